@@ -1,38 +1,27 @@
 import openai
 from dotenv import load_dotenv
 import os
+import sys
 import json
+from typing import Annotated
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.tool_registry import ToolRegistry, ToolArgumentError
 
 load_dotenv()
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def weather_forecast(city: str) -> str:
+# 工具的 JSON schema 由函数签名自动生成，注册时生成一次
+registry = ToolRegistry()
+
+@registry.tool
+def weather_forecast(city: Annotated[str, "The city to get the weather forecast for"]) -> str:
+    """Get the weather forecast for a city"""
     return f"The weather in {city} is sunny."
 
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "weather_forecast",
-            "description": "Get the weather forecast for a city",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "city": {
-                        "type": "string",
-                        "description": "The city to get the weather forecast for"
-                    }
-                },
-                "required": ["city"]
-            }
-        }
-    }
-]
-
-available_tools = {
-    "weather_forecast": weather_forecast
-}
+tools = registry.schema
+available_tools = registry
 
 def run_conversation(user_message: str):
     print(f"用户: {user_message}\n")
@@ -66,8 +55,11 @@ def run_conversation(user_message: str):
 
             print(f"[调用工具] {func_name}({func_args})")
 
-            # 执行函数
-            result = available_tools[func_name](**func_args)
+            # 先按 schema 校验参数，不合法就不执行工具，把错误直接交给 LLM
+            try:
+                result = registry.call(func_name, func_args)
+            except ToolArgumentError as e:
+                result = f"Error: {e}"
 
             print(f"[工具结果] {result}\n")
 
@@ -1,6 +1,10 @@
 import openai
 from dotenv import load_dotenv
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.context import ContextManager
 
 load_dotenv()
 
@@ -10,6 +14,8 @@ def chat():
     messages = [
         {"role": "system", "content": "You are a helpful assistant."},
     ]
+    # messages 保留完整历史，实际发送的是压缩后的版本
+    context = ContextManager(max_tokens=3000)
 
 
     print("多轮对话测试（输入 q 退出）")
@@ -24,13 +30,14 @@ def chat():
 
         response = openai.chat.completions.create(
             model = "gpt-5",
-            messages = messages,
+            messages = context.build(messages),
         )
 
         assistant_content = response.choices[0].message.content
         messages.append({"role": "assistant", "content": assistant_content})
 
         print(f"\nassistant: {assistant_content}")
+        print(f"  [{context.report()}]")
 
 if __name__ == "__main__":
     chat()
\ No newline at end of file
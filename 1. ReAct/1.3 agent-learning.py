@@ -1,43 +1,35 @@
 import openai
 from dotenv import load_dotenv
 import os
+import sys
 import json
+from typing import Annotated
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.context import ContextManager
+from common.tool_registry import ToolRegistry, ToolArgumentError
 
 load_dotenv()
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def weather_forecast(city: str) -> str:
+# 工具的 JSON schema 由函数签名自动生成，注册时生成一次
+registry = ToolRegistry()
+
+@registry.tool
+def weather_forecast(city: Annotated[str, "The city to get the weather forecast for"]) -> str:
+    """Get the weather forecast for a city"""
     return f"The weather in {city} is sunny."
 
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "weather_forecast",
-            "description": "Get the weather forecast for a city",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "city": {
-                        "type": "string",
-                        "description": "The city to get the weather forecast for"
-                    }
-                },
-                "required": ["city"]
-            }
-        }
-    }
-]
-
-available_tools = {
-    "weather_forecast": weather_forecast
-}
+tools = registry.schema
+available_tools = registry
 
 def run_conversation():
     messages = [
         {"role": "system", "content": "You are a helpful assistant."},
     ]
+    # messages 保留完整历史，实际发送的是压缩后的版本
+    context = ContextManager(max_tokens=3000)
 
 
     print("多轮对话测试（输入 q 退出）")
@@ -52,7 +44,7 @@ def run_conversation():
         # 第一次请求：让 LLM 决定是否调用工具
         response = openai.chat.completions.create(
             model="gpt-5",
-            messages=messages,
+            messages=context.build(messages),
             tools=tools,
         )
 
@@ -74,8 +66,11 @@ def run_conversation():
 
                 print(f"[调用工具] {func_name}({func_args})")
 
-                # 执行函数
-                result = available_tools[func_name](**func_args)
+                # 先按 schema 校验参数，不合法就不执行工具，把错误直接交给 LLM
+                try:
+                    result = registry.call(func_name, func_args)
+                except ToolArgumentError as e:
+                    result = f"Error: {e}"
 
                 print(f"[工具结果] {result}\n")
 
@@ -89,7 +84,7 @@ def run_conversation():
             # 第二次请求：让 LLM 根据工具结果生成最终回复
             final_response = openai.chat.completions.create(
                 model="gpt-4o",
-                messages=messages,
+                messages=context.build(messages),
                 tools=tools,
             )
             final_answer = final_response.choices[0].message.content
@@ -99,6 +94,7 @@ def run_conversation():
 
         messages.append({"role": "assistant", "content": final_answer})
         print(f"助手: {final_answer}")
+        print(f"  [{context.report()}]")
 
 
 if __name__ == "__main__":
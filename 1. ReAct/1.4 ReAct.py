@@ -1,43 +1,37 @@
 import openai
 from dotenv import load_dotenv
 import os
-import json
+import sys
+from typing import Annotated
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.dispatcher import ToolDispatcher
+from common.context import ContextManager
+from common.tool_registry import ToolRegistry
 
 load_dotenv()
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def weather_forecast(city: str) -> str:
+# 工具的 JSON schema 由函数签名自动生成；dispatcher 执行前按 schema 校验参数
+registry = ToolRegistry()
+
+@registry.tool
+def weather_forecast(city: Annotated[str, "The city to get the weather forecast for"]) -> str:
+    """Get the weather forecast for a city"""
     return f"The weather in {city} is sunny."
 
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "weather_forecast",
-            "description": "Get the weather forecast for a city",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "city": {
-                        "type": "string",
-                        "description": "The city to get the weather forecast for"
-                    }
-                },
-                "required": ["city"]
-            }
-        }
-    }
-]
-
-available_tools = {
-    "weather_forecast": weather_forecast
-}
+tools = registry.schema
+available_tools = registry
+
+dispatcher = ToolDispatcher(available_tools, scope="react-1.4")
 
 def run_conversation():
     messages = [
         {"role": "system", "content": "You are a helpful assistant."},
     ]
+    # messages 保留完整历史，每次请求发送压缩后的版本
+    context = ContextManager(max_tokens=3000)
 
     print("ReAct 多轮对话测试（输入 q 退出）")
     print("=" * 40)
@@ -54,7 +48,7 @@ def run_conversation():
         for i in range(max_iterations):
             response = openai.chat.completions.create(
                 model="gpt-4o",
-                messages=messages,
+                messages=context.build(messages),
                 tools=tools,
             )
             assistant_message = response.choices[0].message
@@ -70,24 +64,17 @@ def run_conversation():
 
             messages.append(assistant_message)
 
-            for tool_call in assistant_message.tool_calls:
-                func_name = tool_call.function.name
-                func_args = json.loads(tool_call.function.arguments)
-                print(f"  [调用工具] {func_name}({func_args})")
-
-                result = available_tools[func_name](**func_args)
-                print(f"  [工具结果] {result}")
-
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": str(result),
-                })
+            # 同一轮的多个工具调用并发执行，tool 消息仍按原顺序追加
+            for result in dispatcher.dispatch(assistant_message.tool_calls):
+                print(f"  [调用工具] {result.name}({result.args})")
+                print(f"  [工具结果] {result.content}")
+                messages.append(result.message())
         else:
             final_answer = "抱歉，达到最大迭代次数，无法完成任务。"
 
         messages.append({"role": "assistant", "content": final_answer})
         print(f"助手: {final_answer}")
+        print(f"  [{context.report()}]")
 
 
 if __name__ == "__main__":
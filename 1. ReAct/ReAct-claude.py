@@ -1,7 +1,19 @@
 import openai
 from dotenv import load_dotenv
 import os
-import json
+import sys
+from typing import Annotated
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.dispatcher import ToolDispatcher
+from common.context import ContextManager
+from common.memo import cached_tool
+from common.llm import chat_completion, achat_completion
+from common.streaming import stream_turn
+from common.tracing import traced
+from common.budget import TokenBudget, BudgetExceeded, budgeted, current_budget
+from common.sessions import SessionStore, SessionLog, resume
+from common.tool_registry import ToolRegistry
 
 load_dotenv()
 
@@ -11,11 +23,19 @@ openai.api_key = os.getenv("OPENAI_API_KEY")
 # Tools
 # ============================================================
 
-def weather_forecast(city: str) -> str:
+# 工具的 JSON schema 由函数签名自动生成；dispatcher 执行前按 schema 校验参数
+registry = ToolRegistry()
+
+
+@registry.tool
+def weather_forecast(city: Annotated[str, "The city to get the weather forecast for"]) -> str:
+    """Get the weather forecast for a city"""
     return f"The weather in {city} is sunny, 22°C."
 
 
-def calculator(expression: str) -> str:
+@registry.tool
+def calculator(expression: Annotated[str, "The math expression to evaluate, e.g. '2 + 3 * 4'"]) -> str:
+    """Evaluate a mathematical expression"""
     try:
         result = eval(expression)
         return str(result)
@@ -23,87 +43,85 @@ def calculator(expression: str) -> str:
         return f"Error: {e}"
 
 
-def search(query: str) -> str:
+@registry.tool
+def search(query: Annotated[str, "The search query"]) -> str:
+    """Search the web for information"""
     # 模拟搜索结果，实际可接入搜索 API
     return f"Search results for '{query}': [模拟结果] ..."
 
 
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "weather_forecast",
-            "description": "Get the weather forecast for a city",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "city": {
-                        "type": "string",
-                        "description": "The city to get the weather forecast for",
-                    }
-                },
-                "required": ["city"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "calculator",
-            "description": "Evaluate a mathematical expression",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "expression": {
-                        "type": "string",
-                        "description": "The math expression to evaluate, e.g. '2 + 3 * 4'",
-                    }
-                },
-                "required": ["expression"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "search",
-            "description": "Search the web for information",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "The search query",
-                    }
-                },
-                "required": ["query"],
-            },
-        },
-    },
-]
-
-available_tools = {
-    "weather_forecast": weather_forecast,
-    "calculator": calculator,
-    "search": search,
-}
+tools = registry.schema
+
+# 天气和搜索结果在 TTL 内复用，相同参数的并发调用只执行一次（替换实现，schema 不变）
+registry["weather_forecast"] = cached_tool(ttl=600, max_entries=256)(weather_forecast)
+registry["search"] = cached_tool(ttl=300, max_entries=1000)(search)
+available_tools = registry
+
+# 同一轮的多个 tool_calls 并发执行，search 最多同时跑 2 个
+dispatcher = ToolDispatcher(available_tools, max_workers=8, tool_limits={"search": 2}, scope="react")
 
 # ============================================================
 # ReAct Agent
 # ============================================================
 
 MAX_ITERATIONS = 10  # 防止无限循环
-
-
-def run_conversation():
-    system_prompt = (
-        "You are a helpful assistant. "
-        "Think step by step. "
-        "Use tools when needed to gather information before answering. "
-        "You can call multiple tools in sequence to solve complex problems."
-    )
-
-    messages = [{"role": "system", "content": system_prompt}]
+SESSION_TOKEN_BUDGET = 200_000  # 整个会话最多消耗的 token 数
+SESSION_DIR = os.getenv("AGENT_SESSION_DIR", "sessions")  # --session 的会话记录目录
+RESUME_MESSAGES = 40  # 恢复会话时只读最近的这么多条消息
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant. "
+    "Think step by step. "
+    "Use tools when needed to gather information before answering. "
+    "You can call multiple tools in sequence to solve complex problems."
+)
+
+
+def call_model(messages: list, stream: bool):
+    """
+    一次 LLM 调用，返回 (assistant 消息, 文本内容, 工具结果列表)。
+    stream=True 时文本边生成边打印，每个 tool_call 的参数一完整就立即提交执行，
+    不必等整轮输出结束。
+    """
+    if not stream:
+        response = chat_completion(
+            model="gpt-4o",
+            messages=messages,
+            tools=tools,
+        )
+        message = response.choices[0].message
+        results = dispatcher.dispatch(message.tool_calls) if message.tool_calls else []
+        return message, message.content, results
+
+    futures = []
+    printed = False
+    for event, value in stream_turn(model="gpt-4o", messages=messages, tools=tools):
+        if event == "text":
+            if not printed:
+                print("\n助手: ", end="")
+                printed = True
+            print(value, end="", flush=True)
+        elif event == "tool_call":
+            futures.append(dispatcher.submit(value))
+        else:
+            message = value
+    if printed:
+        print()
+    return message, message["content"], [future.result() for future in futures]
+
+
+def run_conversation(stream: bool = True, session: str | None = None):
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    # 指定 session 时：从追加日志里读回最近几轮（不加载整段历史），每轮结束后追加新消息
+    log = SessionStore(SESSION_DIR).open(session) if session else None
+    if log is not None:
+        messages += resume(log, RESUME_MESSAGES)
+        print(f"已恢复会话 {session}（共 {len(log)} 条消息，载入最近 {len(messages) - 1} 条）")
+    saved = len(messages)
+    # messages 保留完整历史；每次请求只发送预算内的压缩版本
+    context = ContextManager(max_tokens=3000)
+    # 会话剩余 token 不足时，历史压缩得更狠；连压缩后都放不下的请求直接拒绝
+    budget = TokenBudget(SESSION_TOKEN_BUDGET, name="react")
 
     print("ReAct Agent（输入 q 退出）")
     print("=" * 50)
@@ -121,56 +139,97 @@ def run_conversation():
         # LLM 自行决定何时停止调用工具
         # --------------------------------------------------
         iteration = 0
+        streamed = stream
 
         while iteration < MAX_ITERATIONS:
             iteration += 1
 
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=messages,
-                tools=tools,
-            )
-
-            assistant_message = response.choices[0].message
+            try:
+                with budget:
+                    allowance = budget.prompt_allowance(tools=tools)
+                    assistant_message, content, results = call_model(
+                        context.build(messages, allowance), stream
+                    )
+            except BudgetExceeded as e:
+                final_answer = f"抱歉，本次会话的 token 预算已用完（{e}）。"
+                streamed = False
+                break
 
             # 如果 LLM 没有调用工具 → 任务完成，跳出循环
-            if not assistant_message.tool_calls:
-                final_answer = assistant_message.content
+            if not results:
+                final_answer = content
                 break
 
             # LLM 发出了 tool_calls → 执行工具，继续循环
-            if assistant_message.content:
-                print(f"  💭 思考: {assistant_message.content}")
+            if content and not stream:
+                print(f"  💭 思考: {content}")
 
             messages.append(assistant_message)
 
-            for tool_call in assistant_message.tool_calls:
-                func_name = tool_call.function.name
-                func_args = json.loads(tool_call.function.arguments)
-
-                print(f"  🔧 调用工具: {func_name}({func_args})")
-
-                if func_name in available_tools:
-                    result = available_tools[func_name](**func_args)
-                else:
-                    result = f"Error: unknown tool '{func_name}'"
-
-                print(f"  📋 工具结果: {result}")
-
-                messages.append(
-                    {
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": str(result),
-                    }
-                )
+            # 本轮所有工具调用并发执行，结果按原顺序追加
+            for result in results:
+                print(f"  🔧 调用工具: {result.name}({result.args})")
+                print(f"  📋 工具结果: {result.content}")
+                messages.append(result.message())
         else:
             # 达到最大迭代次数仍未结束
             final_answer = "抱歉，我尝试了多次但未能完成任务。"
+            streamed = False
 
         messages.append({"role": "assistant", "content": final_answer})
-        print(f"\n助手: {final_answer}")
+        if log is not None:
+            log.extend(messages[saved:])
+            saved = len(messages)
+        if not streamed:
+            print(f"\n助手: {final_answer}")
+        print(f"  [{context.report()}]")
+        print(f"  [{budget.report()}]")
+
+
+# ============================================================
+# Async ReAct Agent：一个事件循环同时服务多个会话
+# ============================================================
+
+def new_session(log: SessionLog | None = None) -> list:
+    """新会话；传入 log 时接着它最近的几轮继续。"""
+    return [{"role": "system", "content": SYSTEM_PROMPT}] + (resume(log, RESUME_MESSAGES) if log else [])
+
+
+@traced("query", query_arg="user_input")
+@budgeted("react")
+async def arun_turn(messages: list, user_input: str, context: ContextManager | None = None) -> str:
+    """
+    异步版 ReAct 循环，处理一个会话的一轮用户输入。
+    LLM 请求走共享的 AsyncOpenAI 连接池，工具在线程池中执行，不阻塞事件循环。
+    每轮有自己的 token 预算（超出时抛 BudgetExceeded）；传入 context 时
+    按其预算与本轮剩余预算中较小的一个压缩历史。
+    """
+    messages.append({"role": "user", "content": user_input})
+    budget = current_budget()
+
+    for _ in range(MAX_ITERATIONS):
+        # abuild: a summarization awaits the LLM instead of blocking the other sessions
+        response = await achat_completion(
+            model="gpt-4o",
+            messages=await context.abuild(messages, budget.prompt_allowance(tools=tools)) if context else messages,
+            tools=tools,
+        )
+        assistant_message = response.choices[0].message
+
+        if not assistant_message.tool_calls:
+            final_answer = assistant_message.content
+            break
+
+        messages.append(assistant_message)
+        for result in await dispatcher.adispatch(assistant_message.tool_calls):
+            messages.append(result.message())
+    else:
+        final_answer = "抱歉，我尝试了多次但未能完成任务。"
+
+    messages.append({"role": "assistant", "content": final_answer})
+    return final_answer
 
 
 if __name__ == "__main__":
-    run_conversation()
\ No newline at end of file
+    session = sys.argv[sys.argv.index("--session") + 1] if "--session" in sys.argv else None
+    run_conversation(stream="--no-stream" not in sys.argv, session=session)
\ No newline at end of file
@@ -1,12 +1,34 @@
 import openai
 from dotenv import load_dotenv
 import os
+import sys
+import re
 import json
+import time
+import asyncio
+import contextvars
+from typing import Annotated
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.dispatcher import ToolDispatcher
+from common.memo import cached_tool
+from common.llm import chat_completion, achat_completion, response_cache
+from common.streaming import stream_text
+from common.tracing import traced
+from common.budget import BudgetExceeded, budgeted
+from common.tool_registry import ToolRegistry
+from common.prompts import Prompt
 
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def weather_forecast(city: str) -> str:
+# Schemas come from the signatures, built once; the dispatcher validates arguments against them
+registry = ToolRegistry()
+
+@registry.tool
+def weather_forecast(city: Annotated[str, "The city name"]) -> str:
+    """Get the weather forecast for a city"""
     if city == "Tokyo":
         return f"sunny, 22C"
     elif city == "Osaka":
@@ -18,54 +40,26 @@ def weather_forecast(city: str) -> str:
     else:
         return f"Error: city not found"
 
-def web_search(query: str) -> str:
+@registry.tool
+def web_search(query: Annotated[str, "The search query"]) -> str:
+    """Search the web for information"""
     return f"Precipitation: 10mm, Wind: 10km/h"
 
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "weather_forecast",
-            "description": "Get the weather forecast for a city",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "city":{"type": "string", "description": "The city name"}
-                },
-                "required": ["city"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "web_search",
-            "description": "Search the web for information",
-            "parameters":{
-                "type": "object",
-                "properties": {
-                    "query": {"type": "string", "description": "The search query"}
-                },
-                "required": ["query"]
-            }
-        }
-    }
-]
+tools = registry.schema
 
-available_tools = {
-    "weather_forecast": weather_forecast,
-    "web_search": web_search,
-}
+# Cached implementations, same schemas
+registry["weather_forecast"] = cached_tool(ttl=600, max_entries=256)(weather_forecast)
+registry["web_search"] = cached_tool(ttl=300, max_entries=1000)(web_search)
+available_tools = registry
+
+dispatcher = ToolDispatcher(available_tools, scope="plan-and-execute")
 
 # ============================================================
 # Prompts
 # ============================================================
 
 def get_tool_descriptions() -> str:
-    return "\n".join(
-        f"- {t['function']['name']}: {t['function']['description']}"
-        for t in tools
-    )
+    return registry.descriptions
 
 PLANNER_PROMPT = """\
 You are a planner.
@@ -85,9 +79,7 @@ Return a JSON object with a "steps" key containing an array of step strings."""
 
 EXECUTOR_PROMPT = """\
 You are an executor.
-Complete the given task using the available tools or by direct reasoning.
-
-{context_str}"""
+Complete the given task using the available tools or by direct reasoning."""
 
 REPLANNER_PROMPT = """\
 You are a replanner.
@@ -110,26 +102,80 @@ Return a JSON object with:
 SYNTHESIZER_PROMPT = """\
 Based on the following completed steps, provide a final comprehensive answer to the user."""
 
+# Formatted once: every call sends the same system prompt (and tools) first, so the
+# provider can serve that prefix from its prompt cache. Results go in the user message.
+PLANNER = Prompt(PLANNER_PROMPT, tool_descriptions=get_tool_descriptions())
+EXECUTOR = Prompt(EXECUTOR_PROMPT)
+REPLANNER = Prompt(REPLANNER_PROMPT, tool_descriptions=get_tool_descriptions())
+SYNTHESIZER = Prompt(SYNTHESIZER_PROMPT)
+
+# ============================================================
+# Plan context
+# ============================================================
+
+WORD_PATTERN = re.compile(r"\w+")
+
+class PlanContext:
+    """
+    Results of the completed steps. Each step is rendered (and serialized
+    for the replanner) once, when it is added, so building a prompt costs
+    nothing extra as the plan grows. Results are capped at
+    `max_result_chars`; with `relevant_k` set, the executor only sees the
+    k earlier results that share the most words with the current step.
+    """
+    def __init__(self, max_result_chars: int = 1500, relevant_k: int | None = None):
+        self.max_result_chars = max_result_chars
+        self.relevant_k = relevant_k
+        self.entries: list[str] = []
+        self._lines: list[str] = []
+        self._words: list[set] = []
+        self._text = ""
+        self._json = ""
+
+    def add(self, step: str, result: str) -> None:
+        if len(result) > self.max_result_chars:
+            result = result[:self.max_result_chars] + " ...[truncated]"
+        entry = f"{step} → {result}"
+        line = f"  Step {len(self.entries) + 1}: {entry}\n"
+
+        self.entries.append(entry)
+        self._lines.append(line)
+        self._words.append(set(WORD_PATTERN.findall(step.lower())))
+        self._text += line
+        self._json += ",\n  " if self._json else "  "
+        self._json += json.dumps(entry, ensure_ascii=False)
+
+    def render(self, step: str | None = None) -> str:
+        """Executor view: every result, or the most relevant ones for `step`."""
+        if not self.entries:
+            return ""
+        if step is None or self.relevant_k is None or len(self.entries) <= self.relevant_k:
+            return "Previous steps results:\n" + self._text
+
+        words = set(WORD_PATTERN.findall(step.lower()))
+        last = len(self.entries) - 1
+        # Always keep the latest result; rank the rest by word overlap
+        ranked = sorted(range(last), key=lambda i: len(words & self._words[i]), reverse=True)
+        chosen = sorted(ranked[:self.relevant_k - 1] + [last])
+        return "Previous steps results:\n" + "".join(self._lines[i] for i in chosen)
+
+    def to_json(self) -> str:
+        """Same text as json.dumps(entries, ensure_ascii=False, indent=2)."""
+        return f"[\n{self._json}\n]" if self._json else "[]"
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
 # ============================================================
 # Functions
 # ============================================================
 
-def plan(user_input: str) -> list:
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "system",
-                "content": PLANNER_PROMPT.format(
-                    tool_descriptions=get_tool_descriptions()
-                ),
-            },
-            {"role": "user", "content": user_input},
-        ],
-        response_format={"type": "json_object"},
-    )
+def planner_messages(user_input: str) -> list:
+    return PLANNER.messages(user_input)
 
-    result = json.loads(response.choices[0].message.content)
+@traced("parse")
+def parse_plan(content: str) -> list:
+    result = json.loads(content)
 
     if isinstance(result, dict):
         steps = result.get("steps", list(result.values())[0])
@@ -143,25 +189,47 @@ def plan(user_input: str) -> list:
 
     return steps
 
-def execute_step(step: str, context: list) -> str:
-    context_str = ""
-    if context:
-        context_str = "Previous steps results:\n"
-        for i, c in enumerate(context):
-            context_str += f"  Step {i+1}: {c}\n"
-
-    messages = [
-        {
-            "role": "system",
-            "content": EXECUTOR_PROMPT.format(context_str=context_str),
-        },
-        {"role": "user", "content": step},
-    ]
+def executor_messages(step: str, context: PlanContext) -> list:
+    return EXECUTOR.messages(step, context=context.render(step))
+
+def replanner_messages(user_input: str, completed: PlanContext, remaining: list) -> list:
+    # Same task, then results that only grow, then what changes every time
+    return REPLANNER.messages(
+        f"Remaining steps:\n{json.dumps(remaining, ensure_ascii=False, indent=2)}\n\n"
+        f"Should we continue with the remaining plan or adjust it?",
+        context=f"Original task: {user_input}\n\nCompleted steps:\n{completed.to_json()}",
+    )
+
+@traced("parse")
+def parse_replan(content: str, remaining: list) -> list:
+    result = json.loads(content)
+
+    if result.get("action") == "replan":
+        return result.get("steps", remaining)
+    return remaining
+
+def synthesizer_messages(user_input: str, context: PlanContext) -> list:
+    return SYNTHESIZER.messages(
+        f"Original request: {user_input}\n\n"
+        f"Completed steps:\n" + "\n".join(context.entries)
+    )
+
+def plan(user_input: str) -> list:
+    response = chat_completion(
+        model="gpt-4o",
+        messages=planner_messages(user_input),
+        response_format={"type": "json_object"},
+    )
+    return parse_plan(response.choices[0].message.content)
+
+@traced("step")
+def execute_step(step: str, context: PlanContext) -> str:
+    messages = executor_messages(step, context)
 
     last_tool_result = ""
     max_tool_calls = 5
     for i in range(max_tool_calls):
-        response = openai.chat.completions.create(
+        response = chat_completion(
             model = "gpt-4o",
             messages = messages,
             tools = tools,
@@ -172,22 +240,14 @@ def execute_step(step: str, context: list) -> str:
             return msg.content
 
         messages.append(msg)
-        for tool_call in msg.tool_calls:
-            func_name = tool_call.function.name
-            func_args = json.loads(tool_call.function.arguments)
-            print(f"    [Tool Call] {func_name}({func_args})")
-
-            result = available_tools[func_name](**func_args)
-            last_tool_result = f"{func_name}({func_args}) -> {result}"
-            print(f"    [Tool Result] {result}")
-
-            messages.append({
-                "role": "tool",
-                "tool_call_id": tool_call.id,
-                "content": str(result),
-            })
-
-    response = openai.chat.completions.create(
+        # Tool calls of one turn run concurrently; messages keep their order
+        for result in dispatcher.dispatch(msg.tool_calls):
+            print(f"    [Tool Call] {result.name}({result.args})")
+            last_tool_result = f"{result.name}({result.args}) -> {result.content}"
+            print(f"    [Tool Result] {result.content}")
+            messages.append(result.message())
+
+    response = chat_completion(
         model = "gpt-4o",
         messages = messages,
         tools = tools,
@@ -198,71 +258,273 @@ def execute_step(step: str, context: list) -> str:
 
     return f"Failed after {max_tool_calls} iterations. Last tool result: {last_tool_result}"
 
-def replan(user_input: str, original_steps: list, completed: list, remaining: list) -> list:
-    response = openai.chat.completions.create(
+@traced("replan")
+def replan(user_input: str, original_steps: list, completed: PlanContext, remaining: list) -> list:
+    response = chat_completion(
         model="gpt-4o",
-        messages=[
-            {
-                "role": "system",
-                "content": REPLANNER_PROMPT.format(
-                    tool_descriptions=get_tool_descriptions()
-                ),
-            },
-            {
-                "role": "user",
-                "content": (
-                    f"Original task: {user_input}\n\n"
-                    f"Completed steps:\n{json.dumps(completed, ensure_ascii=False, indent=2)}\n\n"
-                    f"Remaining steps:\n{json.dumps(remaining, ensure_ascii=False, indent=2)}\n\n"
-                    f"Should we continue with the remaining plan or adjust it?"
-                ),
-            },
-        ],
+        messages=replanner_messages(user_input, completed, remaining),
         response_format={"type": "json_object"},
     )
+    return parse_replan(response.choices[0].message.content, remaining)
+
+class Speculator:
+    """
+    Speculative execution: start the next planned step while the replanner
+    is still deciding. If the replanner keeps that step as the next one
+    ("continue", or a revised plan starting with the same step) the result
+    is reused and the step's latency overlaps the replan call; otherwise
+    it is cancelled if it has not started yet, or discarded: a step already
+    running on its thread cannot be stopped and still spends its LLM and
+    tool calls. Only safe for side-effect free tools. close() when done.
+
+    astart() / aresolve() / aclose() do the same for arun_query with an
+    asyncio task, sharing the counters; a dropped task that has started
+    stops at its next await, but what it already spent is counted as
+    discarded.
+    """
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculate")
+        self._future = None
+        self._task = None
+        self._task_started = False
+        self._step = None
+        self.hits = 0
+        self.cancelled = 0   # misses that never ran
+        self.discarded = 0   # misses that ran (or are running) for nothing
+        self.saved_seconds = 0.0
+
+    @property
+    def misses(self) -> int:
+        return self.cancelled + self.discarded
+
+    def start(self, step: str, context: PlanContext) -> None:
+        self._step = step
+        self._future = self._pool.submit(contextvars.copy_context().run, self._timed, step, context)
+
+    def resolve(self, next_steps: list, replan_seconds: float) -> str | None:
+        """Result of the speculative step if it is still next in line, else None."""
+        future, self._future = self._future, None
+        if next_steps and next_steps[0] == self._step:
+            result, step_seconds = future.result()
+            self.hits += 1
+            self.saved_seconds += min(step_seconds, replan_seconds)
+            return result
+        self._drop(future)
+        return None
+
+    def close(self) -> None:
+        """Drop an unresolved step (e.g. the replan raised) and release the thread."""
+        if self._future is not None:
+            self._drop(self._future)
+            self._future = None
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _drop(self, future) -> None:
+        if future.cancel():
+            self.cancelled += 1
+        else:
+            self.discarded += 1
+
+    def astart(self, step: str, context: PlanContext) -> None:
+        self._step = step
+        self._task_started = False
+        self._task = asyncio.create_task(self._atimed(step, context))
+
+    async def aresolve(self, next_steps: list, replan_seconds: float) -> str | None:
+        task, self._task = self._task, None
+        if next_steps and next_steps[0] == self._step:
+            result, step_seconds = await task
+            self.hits += 1
+            self.saved_seconds += min(step_seconds, replan_seconds)
+            return result
+        self._adrop(task)
+        return None
+
+    def aclose(self) -> None:
+        """Drop an unresolved task (e.g. the replan raised)."""
+        if self._task is not None:
+            self._adrop(self._task)
+            self._task = None
+
+    def _adrop(self, task: asyncio.Task) -> None:
+        started = self._task_started or task.done()
+        task.cancel()
+        if started:
+            self.discarded += 1
+        else:
+            self.cancelled += 1
+
+    async def _atimed(self, step: str, context: PlanContext) -> tuple[str, float]:
+        self._task_started = True
+        start = time.perf_counter()
+        result = await aexecute_step(step, context)
+        return result, time.perf_counter() - start
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return (
+            f"speculation: {self.hits}/{total} hits ({rate:.0%}), "
+            f"{self.saved_seconds:.1f}s saved, "
+            f"{self.discarded} discarded after running, {self.cancelled} cancelled"
+        )
 
-    result = json.loads(response.choices[0].message.content)
+    @staticmethod
+    def _timed(step: str, context: PlanContext) -> tuple[str, float]:
+        start = time.perf_counter()
+        result = execute_step(step, context)
+        return result, time.perf_counter() - start
 
-    if result.get("action") == "replan":
-        return result.get("steps", remaining)
-    return remaining
+# ============================================================
+# Replan policies
+# ============================================================
 
-def run():
-    print("Plan-and-Execute Agent (press q to quit)")
-    print("=" * 50)
+ERROR_MARKERS = ("Error:", "Failed after", "not found", "unable to", "cannot", "错误", "失败")
 
-    while True:
-        user_input = input("\nUser: ")
+class ReplanPolicy:
+    """
+    Decides after each step whether the replanner is worth a full LLM
+    round trip. The base class always replans (the original behaviour).
+    """
+    name = "always"
 
-        # Exit the loop if the user inputs "q"
-        if user_input.lower() == "q":
-            print("Goodbye!")
-            break
-        
-        # Step 1: Plan the steps
-        print("\n Planning...")
-        steps = plan(user_input)
-        print(f"Plan ({len(steps)} steps):")
-        for i, step in enumerate(steps):
-            print(f"  {i+1}. {step}")
-
-        # Step 2: Execute each step, replan after each
-        context = []
-        remaining = steps[:]
-        step_num = 0
+    def __init__(self):
+        self.calls = 0
+        self.skipped = 0
+
+    def should_replan(self, step_num: int, result: str, remaining: list) -> bool:
+        return True
+
+    def check(self, step_num: int, result: str, remaining: list) -> bool:
+        if self.should_replan(step_num, result, remaining):
+            self.calls += 1
+            return True
+        self.skipped += 1
+        return False
 
+class NeverReplan(ReplanPolicy):
+    name = "never"
+
+    def should_replan(self, step_num, result, remaining):
+        return False
+
+class EveryNSteps(ReplanPolicy):
+    def __init__(self, n: int = 2):
+        super().__init__()
+        self.n = n
+        self.name = f"every-{n}"
+
+    def should_replan(self, step_num, result, remaining):
+        return step_num % self.n == 0
+
+class OnError(ReplanPolicy):
+    """Replan only when the step reported a tool error or failed outright."""
+    name = "on-error"
+
+    def should_replan(self, step_num, result, remaining):
+        return result.startswith("Error") or "Error:" in result or result.startswith("Failed after")
+
+class HeuristicGate(ReplanPolicy):
+    """Errors, failure wording or an empty result suggest the plan may need to change."""
+    name = "heuristic"
+
+    def should_replan(self, step_num, result, remaining):
+        text = result.strip()
+        return len(text) < 10 or any(marker in text for marker in ERROR_MARKERS)
+
+GATE_PROMPT = """A step of a plan just finished. Answer "yes" if its result means the
+remaining steps must change (failure, missing data, unexpected finding),
+otherwise answer "no". Reply with one word."""
+
+class ModelGate(ReplanPolicy):
+    """Ask a small, fast model whether the full replanner is needed."""
+    name = "model-gate"
+
+    def __init__(self, model: str = "gpt-4o-mini"):
+        super().__init__()
+        self.model = model
+
+    def should_replan(self, step_num, result, remaining):
+        response = chat_completion(
+            model=self.model,
+            max_tokens=1,
+            messages=[
+                {"role": "system", "content": GATE_PROMPT},
+                {
+                    "role": "user",
+                    "content": f"Result: {result}\n\nRemaining steps: {remaining}",
+                },
+            ],
+        )
+        return (response.choices[0].message.content or "").strip().lower().startswith("y")
+
+REPLAN_POLICIES = {
+    "always": ReplanPolicy,
+    "never": NeverReplan,
+    "every-2": lambda: EveryNSteps(2),
+    "on-error": OnError,
+    "heuristic": HeuristicGate,
+    "model-gate": ModelGate,
+}
+
+# ============================================================
+# Agent loop
+# ============================================================
+
+@traced("query", query_arg="user_input")
+@budgeted("plan-and-execute")
+def run_query(
+    user_input: str,
+    policy: ReplanPolicy | None = None,
+    speculative: bool = False,
+    stream: bool = False,
+) -> str:
+    """
+    Plan → execute → (replan) → synthesize for one request.
+    With stream=True the final answer is printed token by token.
+    """
+    policy = policy or ReplanPolicy()
+
+    # Step 1: Plan the steps
+    print("\n Planning...")
+    steps = plan(user_input)
+    print(f"Plan ({len(steps)} steps):")
+    for i, step in enumerate(steps):
+        print(f"  {i+1}. {step}")
+
+    # Step 2: Execute each step, replan after each (subject to the policy)
+    context = PlanContext()
+    remaining = steps[:]
+    step_num = 0
+    speculator = Speculator() if speculative else None
+    speculative_result = None
+
+    try:
         while remaining:
             step = remaining.pop(0)
             step_num += 1
-            print(f"\n> Executing step {step_num}: {step}")
-            result = execute_step(step, context)
-            context.append(f"{step} → {result}")
+            if speculative_result is not None:
+                print(f"\n> Step {step_num} already executed speculatively: {step}")
+                result, speculative_result = speculative_result, None
+            else:
+                print(f"\n> Executing step {step_num}: {step}")
+                result = execute_step(step, context)
+            context.add(step, result)
             print(f"  Result: {result}")
 
             # Replan: check if remaining plan needs adjustment
-            if remaining:
+            if remaining and not policy.check(step_num, result, remaining):
+                print(f"  Replan skipped ({policy.name} policy)")
+            elif remaining:
                 print("\n  Checking if replan is needed...")
+                if speculator:
+                    speculator.start(remaining[0], context)
+                replan_start = time.perf_counter()
                 new_remaining = replan(user_input, steps, context, remaining)
+                if speculator:
+                    speculative_result = speculator.resolve(
+                        new_remaining, time.perf_counter() - replan_start
+                    )
                 if new_remaining != remaining:
                     print("  Plan adjusted:")
                     for i, s in enumerate(new_remaining):
@@ -270,26 +532,206 @@ def run():
                     remaining = new_remaining
                 else:
                     print("  Plan unchanged, continuing")
+    finally:
+        if speculator:
+            speculator.close()
+
+    # Step 3: Synthesize final answer
+    print("\n Synthesizing final answer...")
+    if stream:
+        print("\nFinal Answer: ", end="")
+        parts = []
+        for delta in stream_text(model="gpt-4o", messages=synthesizer_messages(user_input, context)):
+            print(delta, end="", flush=True)
+            parts.append(delta)
+        print()
+        answer = "".join(parts)
+    else:
+        final = chat_completion(
+            model="gpt-4o",
+            messages=synthesizer_messages(user_input, context),
+        )
+        answer = final.choices[0].message.content
+        print(f"\nFinal Answer: {answer}")
+    print(f"  ({response_cache.summary()})")
+    if speculator:
+        print(f"  ({speculator.report()})")
+    return answer
+
+def run(speculative: bool = False, policy_name: str = "always"):
+    print("Plan-and-Execute Agent (press q to quit)")
+    print("=" * 50)
+
+    while True:
+        user_input = input("\nUser: ")
+
+        # Exit the loop if the user inputs "q"
+        if user_input.lower() == "q":
+            print("Goodbye!")
+            break
+
+        try:
+            run_query(user_input, REPLAN_POLICIES[policy_name](), speculative=speculative, stream=True)
+        except BudgetExceeded as e:
+            print(f"\n  Stopped: {e}")
+
+# ============================================================
+# Benchmark: replan policies
+# ============================================================
+
+# Test cases from README.md
+BENCHMARK_QUERIES = [
+    "北京今天天气怎么样？",
+    "比较上海和东京的天气，哪个更适合出行？",
+    "我周末打算去杭州露营，帮我看看天气，再搜索推荐的露营地点",
+    "2026年有哪些值得关注的科技大会？",
+    "1+1等于几？",
+    "帮我查深圳天气，天气不好搜室内活动，天气好搜户外活动",
+    "下周去日本，查东京大阪天气，搜热门景点和交通攻略",
+    "asdfghjkl",
+]
+
+def benchmark_policies(queries: list = BENCHMARK_QUERIES, policy_names: list | None = None):
+    """LLM calls and wall-clock time per request for each policy, relative to "always"."""
+    import io
+    import contextlib
+    from common import llm
+
+    # Looked up per call, so policies registered after import are included
+    if policy_names is None:
+        policy_names = list(REPLAN_POLICIES)
+    rows = []
+    # Every policy must pay for its own LLM calls
+    cache_enabled, response_cache.enabled = response_cache.enabled, False
+    try:
+        for name in policy_names:
+            policy = REPLAN_POLICIES[name]()
+            before = llm.stats["requests"]
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for query in queries:
+                    run_query(query, policy)
+            rows.append((
+                name,
+                (llm.stats["requests"] - before) / len(queries),
+                (time.perf_counter() - start) / len(queries),
+                policy.calls,
+                policy.skipped,
+            ))
+    finally:
+        response_cache.enabled = cache_enabled
+
+    base_calls, base_time = rows[0][1], rows[0][2]
+    print(f"\n{len(queries)} queries, per-request averages (baseline: {rows[0][0]})")
+    print(f"  {'policy':<12}{'LLM calls':>10}{'saved':>8}{'wall (s)':>10}{'saved':>8}{'replans':>9}{'skipped':>9}")
+    for name, calls, wall, replans, skipped in rows:
+        print(
+            f"  {name:<12}{calls:>10.1f}{base_calls - calls:>8.1f}"
+            f"{wall:>10.2f}{base_time - wall:>8.2f}{replans:>9}{skipped:>9}"
+        )
+
+# ============================================================
+# Async pipeline (many requests share one event loop)
+# ============================================================
 
-        # Step 3: Synthesize final answer
-        print("\n Synthesizing final answer...")
-        final = openai.chat.completions.create(
+async def aplan(user_input: str) -> list:
+    response = await achat_completion(
+        model="gpt-4o",
+        messages=planner_messages(user_input),
+        response_format={"type": "json_object"},
+    )
+    return parse_plan(response.choices[0].message.content)
+
+@traced("step")
+async def aexecute_step(step: str, context: PlanContext) -> str:
+    messages = executor_messages(step, context)
+
+    last_tool_result = ""
+    max_tool_calls = 5
+    for i in range(max_tool_calls + 1):
+        response = await achat_completion(
             model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": SYNTHESIZER_PROMPT,
-                },
-                {
-                    "role": "user",
-                    "content": (
-                        f"Original request: {user_input}\n\n"
-                        f"Completed steps:\n" + "\n".join(context)
-                    ),
-                },
-            ],
+            messages=messages,
+            tools=tools,
         )
-        print(f"\nFinal Answer: {final.choices[0].message.content}")
+        msg = response.choices[0].message
+
+        if not msg.tool_calls:
+            return msg.content
+        if i == max_tool_calls:
+            break
+
+        messages.append(msg)
+        for result in await dispatcher.adispatch(msg.tool_calls):
+            last_tool_result = f"{result.name}({result.args}) -> {result.content}"
+            messages.append(result.message())
+
+    return f"Failed after {max_tool_calls} iterations. Last tool result: {last_tool_result}"
+
+@traced("replan")
+async def areplan(user_input: str, original_steps: list, completed: PlanContext, remaining: list) -> list:
+    response = await achat_completion(
+        model="gpt-4o",
+        messages=replanner_messages(user_input, completed, remaining),
+        response_format={"type": "json_object"},
+    )
+    return parse_replan(response.choices[0].message.content, remaining)
+
+@traced("query", query_arg="user_input")
+@budgeted("plan-and-execute")
+async def arun_query(user_input: str, speculative: bool = False) -> str:
+    """
+    Non-interactive plan → execute → replan → synthesize for one request.
+    With speculative=True the next step runs concurrently with the replan
+    call and is cancelled if the replanner changes what comes next; hits,
+    misses and the time saved are reported as in run_query().
+    """
+    steps = await aplan(user_input)
+
+    context = PlanContext()
+    remaining = steps[:]
+    speculator = Speculator() if speculative else None
+    speculative_result = None
+    while remaining:
+        step = remaining.pop(0)
+        if speculative_result is not None:
+            result, speculative_result = speculative_result, None
+        else:
+            result = await aexecute_step(step, context)
+        context.add(step, result)
+        if remaining:
+            if speculator:
+                speculator.astart(remaining[0], context)
+            replan_start = time.perf_counter()
+            try:
+                new_remaining = await areplan(user_input, steps, context, remaining)
+                if speculator:
+                    speculative_result = await speculator.aresolve(
+                        new_remaining, time.perf_counter() - replan_start
+                    )
+            finally:
+                # The replan raised: never leave the step running unowned
+                if speculator:
+                    speculator.aclose()
+            remaining = new_remaining
+
+    final = await achat_completion(
+        model="gpt-4o",
+        messages=synthesizer_messages(user_input, context),
+    )
+    if speculator:
+        print(f"  ({speculator.report()})")
+    return final.choices[0].message.content
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    speculative = "--speculative" in sys.argv
+    policy_name = next(
+        (arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--replan=")), "always"
+    )
+    query = " ".join(arg for arg in sys.argv[1:] if not arg.startswith("--"))
+    if "--bench-replan" in sys.argv:
+        benchmark_policies()
+    elif query:
+        print(asyncio.run(arun_query(query, speculative=speculative)))
+    else:
+        run(speculative=speculative, policy_name=policy_name)
\ No newline at end of file
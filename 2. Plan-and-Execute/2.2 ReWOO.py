@@ -3,11 +3,29 @@ from dotenv import load_dotenv
 import os
 import json
 import re
+import sys
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Annotated
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.llm import chat_completion, response_cache
+from common.budget import TokenBudget, BudgetExceeded, budgeted, query_budget
+from common.streaming import stream_text
+from common.tracing import span, traced
+from common.resilience import tool_guard
+from common.tool_registry import ToolRegistry
+from common.prompts import Prompt
 
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def weather_forecast(city: str) -> str:
+registry = ToolRegistry()
+
+@registry.tool
+def weather_forecast(city: Annotated[str, "The city name"]) -> str:
+    """Get the weather forecast for a city"""
     if city == "Tokyo":
         return "sunny, 22C"
     elif city == "Osaka":
@@ -19,13 +37,12 @@ def weather_forecast(city: str) -> str:
     else:
         return "Error: city not found"
 
-def web_search(query: str) -> str:
+@registry.tool
+def web_search(query: Annotated[str, "The search query"]) -> str:
+    """Search the web for information"""
     return "Precipitation: 10mm, Wind: 10km/h"
 
-available_tools = {
-    "weather_forecast": weather_forecast,
-    "web_search": web_search,
-}
+available_tools = registry
 
 # ============================================================
 # Prompts
@@ -39,8 +56,7 @@ or direct reasoning step. Use #E1, #E2, ... as variable placeholders to
 reference results from previous steps.
 
 Available tools:
-- weather_forecast(city): Get the weather forecast for a city
-- web_search(query): Search the web for information
+{tool_descriptions}
 
 Output format (strict, one plan-evidence pair per step):
 Plan: <reasoning about what to do>
@@ -61,44 +77,169 @@ from executed plan steps, provide a final comprehensive answer.
 
 Respond directly to the user's question using the evidence provided."""
 
+# System prompts formatted once; the question and evidence follow them (prompt-cache friendly)
+PLANNER = Prompt(PLANNER_PROMPT, tool_descriptions=registry.descriptions)
+SOLVER = Prompt(SOLVER_PROMPT)
+
 # ============================================================
 # Functions
 # ============================================================
 
-PLAN_PATTERN = re.compile(
-    r"Plan:\s*(.+?)\s*\n\s*#E(\d+)\s*=\s*(\w+)\s*\(([^)]*)\)",
-    re.DOTALL,
-)
+STEP_HEADER = re.compile(r"#E(\d+)\s*=\s*(\w+)\s*\(")
+PLAN_LINE = re.compile(r"Plan:\s*(.+)")
+
+
+class PlanParser:
+    """
+    Incremental parser for the planner output.
+
+    Text can be fed in arbitrary chunks; a step is emitted as soon as the
+    closing parenthesis of its `#En = tool(arg)` call arrives. The argument
+    is scanned character by character, so nested parentheses and quoted
+    text (including commas and parens inside quotes) are kept intact.
+    A call still open at the end of its line is treated as malformed and
+    dropped.
+    """
+    def __init__(self):
+        self._buffer = ""
+        self._thought = ""
+        self._step = None        # (id, tool) while inside an argument
+        self._pos = 0            # scan position inside the argument
+        self._depth = 0
+        self._quote = None
+
+    def feed(self, chunk: str) -> list:
+        self._buffer += chunk
+        steps = []
+        while True:
+            if self._step is None:
+                if not self._find_header():
+                    break
+            else:
+                step = self._scan_arg()
+                if step is None:
+                    break
+                if step:
+                    steps.append(step)
+        return steps
+
+    def close(self) -> list:
+        # Complete steps were already emitted by feed(); anything left is an
+        # unterminated call
+        return []
+
+    def _find_header(self) -> bool:
+        match = STEP_HEADER.search(self._buffer)
+        if not match:
+            # Keep only the unfinished last line: it may still become a header
+            done, _, self._buffer = self._buffer.rpartition("\n")
+            self._remember_thought(done)
+            return False
+        self._remember_thought(self._buffer[:match.start()])
+        eid, tool_name = match.groups()
+        self._step = (f"#E{eid}", tool_name)
+        self._buffer = self._buffer[match.end():]
+        self._pos, self._depth, self._quote = 0, 1, None
+        return True
+
+    def _remember_thought(self, text: str) -> None:
+        thoughts = PLAN_LINE.findall(text)
+        if thoughts:
+            self._thought = thoughts[-1].strip()
+
+    def _scan_arg(self):
+        """Returns a step, False for a dropped step, or None if more text is needed."""
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            ch = buffer[i]
+            i += 1
+            if ch == "\n":
+                # Unbalanced parens or quotes: drop the step, resume on the next line
+                self._step = None
+                self._buffer = buffer[i:]
+                return False
+            if self._quote:
+                if ch == "\\":
+                    i += 1          # skip the escaped character
+                elif ch == self._quote:
+                    self._quote = None
+            elif ch in "\"'" and (i == 1 or buffer[i - 2] in "(,= \t"):
+                # Only a quote that opens a token; the ' in "what's" is text
+                self._quote = ch
+            elif ch == "(":
+                self._depth += 1
+            elif ch == ")":
+                self._depth -= 1
+                if self._depth == 0:
+                    return self._finish(buffer[:i - 1], i)
+        self._pos = i
+        return None
+
+    def _finish(self, raw_arg: str, end: int) -> dict:
+        eid, tool_name = self._step
+        arg = raw_arg.strip()
+        if len(arg) >= 2 and arg[0] == arg[-1] and arg[0] in "\"'":
+            arg = arg[1:-1]
+        step = {"id": eid, "thought": self._thought, "tool": tool_name, "arg": arg}
+        self._step = None
+        self._thought = ""
+        self._buffer = self._buffer[end:]
+        return step
+
+
+def planner_messages(user_input: str) -> list:
+    return PLANNER.messages(user_input)
 
 
 def plan(user_input: str) -> list:
     """Generate all steps at once with #E variable placeholders."""
-    response = openai.chat.completions.create(
+    response = chat_completion(
         model="gpt-4o",
-        messages=[
-            {"role": "system", "content": PLANNER_PROMPT},
-            {"role": "user", "content": user_input},
-        ],
+        messages=planner_messages(user_input),
     )
 
     raw_plan = response.choices[0].message.content
     print(f"\n  Raw plan:\n{raw_plan}")
 
-    steps = []
-    for match in PLAN_PATTERN.finditer(raw_plan):
-        thought, eid, tool_name, raw_arg = match.groups()
-        steps.append({
-            "id": f"#E{eid}",
-            "thought": thought.strip(),
-            "tool": tool_name.strip(),
-            "arg": raw_arg.strip().strip('"').strip("'"),
-        })
+    with span("parse_plan", "parse"):
+        parser = PlanParser()
+        return parser.feed(raw_plan) + parser.close()
+
+
+def plan_stream(user_input: str):
+    """Yield steps while the planner is still writing the rest of the plan."""
+    parser = PlanParser()
+    for delta in stream_text(model="gpt-4o", messages=planner_messages(user_input)):
+        yield from parser.feed(delta)
+    yield from parser.close()
 
-    return steps
+
+EVIDENCE_REF = re.compile(r"#E\d+")
+
+
+@traced("tool")
+def call_tool(tool_name: str, arg: str) -> str:
+    if tool_name in available_tools:
+        try:
+            # Shared per-tool circuit breaker + concurrency limit (common/resilience.py)
+            result = str(tool_guard(tool_name, "rewoo").call(available_tools[tool_name], arg))
+        except Exception as e:
+            # A failed or rejected step becomes evidence for the solver instead of aborting the run
+            result = f"Error: {e}"
+        print(f"    [Tool Call] {tool_name}({arg})")
+        print(f"    [Tool Result] {result}")
+    else:
+        result = f"Unknown tool: {tool_name}"
+        print(f"    [Error] {result}")
+    return result
 
 
-def worker(steps: list) -> dict:
+def worker(steps, parallel: bool = False, max_workers: int = 4) -> dict:
     """Execute each step, substituting #E references with real results."""
+    if parallel:
+        return parallel_worker(steps, max_workers)
+
     evidence = {}
 
     for step in steps:
@@ -106,46 +247,110 @@ def worker(steps: list) -> dict:
         for var, val in evidence.items():
             arg = arg.replace(var, val)
 
-        tool_name = step["tool"]
-        if tool_name in available_tools:
-            result = available_tools[tool_name](arg)
-            print(f"    [Tool Call] {tool_name}({arg})")
-            print(f"    [Tool Result] {result}")
-        else:
-            result = f"Unknown tool: {tool_name}"
-            print(f"    [Error] {result}")
+        evidence[step["id"]] = call_tool(step["tool"], arg)
+
+    return evidence
+
 
-        evidence[step["id"]] = result
+def parallel_worker(steps, max_workers: int = 4) -> dict:
+    """
+    Execute steps on a bounded thread pool. A step is submitted as soon as
+    every earlier #E it references has a result, so independent steps run
+    concurrently and evidence is filled in as futures complete.
+
+    `steps` may also be a generator that is still streaming the plan
+    (see plan_stream); it is read on its own thread, so tools start
+    while the planner is writing the later steps.
+    """
+    evidence = {}
+    deps = {}
+    seen = set()
+    pending = []
+    running = {}
+    steps = iter(steps)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool, \
+            ThreadPoolExecutor(max_workers=1) as reader:
+        # The plan stream makes its LLM request from the reader thread: run it
+        # in the caller's context so per-task usage tracking still sees it
+        context = contextvars.copy_context()
+        next_step = reader.submit(context.run, next, steps, None)
+        while next_step or pending or running:
+            ready = [s for s in pending if deps[s["id"]] <= evidence.keys()]
+            for step in ready:
+                pending.remove(step)
+                arg = EVIDENCE_REF.sub(
+                    lambda m: evidence.get(m.group(0), m.group(0)), step["arg"]
+                )
+                future = pool.submit(contextvars.copy_context().run, call_tool, step["tool"], arg)
+                running[future] = step
+
+            waiting = [*running, next_step] if next_step else list(running)
+            done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future is next_step:
+                    step = future.result()
+                    if step is None:
+                        next_step = None
+                        continue
+                    # Only earlier steps count as dependencies (same rule as the sequential loop)
+                    deps[step["id"]] = set(EVIDENCE_REF.findall(step["arg"])) & seen
+                    seen.add(step["id"])
+                    pending.append(step)
+                    next_step = reader.submit(context.run, next, steps, None)
+                else:
+                    step = running.pop(future)
+                    evidence[step["id"]] = future.result()
 
     return evidence
 
 
-def solver(user_input: str, steps: list, evidence: dict) -> str:
-    """Combine all evidence to produce the final answer."""
+def solver_messages(user_input: str, steps: list, evidence: dict) -> list:
     evidence_str = ""
     for step in steps:
         eid = step["id"]
         evidence_str += f"{eid} (Plan: {step['thought']})\n"
         evidence_str += f"  Result: {evidence.get(eid, 'N/A')}\n\n"
 
-    response = openai.chat.completions.create(
+    return SOLVER.messages(f"Question: {user_input}\n\nEvidence:\n{evidence_str}")
+
+
+def solver(user_input: str, steps: list, evidence: dict) -> str:
+    """Combine all evidence to produce the final answer."""
+    response = chat_completion(
         model="gpt-4o",
-        messages=[
-            {"role": "system", "content": SOLVER_PROMPT},
-            {
-                "role": "user",
-                "content": (
-                    f"Question: {user_input}\n\n"
-                    f"Evidence:\n{evidence_str}"
-                ),
-            },
-        ],
+        messages=solver_messages(user_input, steps, evidence),
     )
 
     return response.choices[0].message.content
 
 
-def run():
+def solver_stream(user_input: str, steps: list, evidence: dict):
+    """Same as solver(), but yields the answer as it is generated."""
+    yield from stream_text(
+        model="gpt-4o",
+        messages=solver_messages(user_input, steps, evidence),
+    )
+
+
+@traced("query", query_arg="user_input")
+@budgeted("rewoo")
+def run_query(user_input: str, parallel: bool = True) -> str:
+    """Non-interactive plan → work → solve for one request."""
+    steps = plan_stream(user_input)
+    collected = []
+
+    def planned():
+        for step in steps:
+            collected.append(step)
+            yield step
+
+    evidence = worker(planned(), parallel=parallel)
+    if not collected:
+        raise ValueError("planner output contained no parsable steps")
+    return solver(user_input, collected, evidence)
+
+
+def run(parallel: bool = False):
     print("ReWOO Agent (press q to quit)")
     print("=" * 50)
 
@@ -155,27 +360,79 @@ def run():
             print("Goodbye!")
             break
 
-        # Step 1: Planner - generate full plan at once
-        print("\n Planning (all steps at once)...")
-        steps = plan(user_input)
-
-        if not steps:
-            print("  Failed to parse plan. Please try again.")
+        try:
+            with TokenBudget(query_budget, "rewoo") as budget:
+                # Step 1 + 2: Planner streams the plan; each step goes to the worker
+                # as soon as it is parsed, so tools start before the plan is finished
+                print("\n Planning (all steps at once) and executing...")
+                steps = []
+
+                def planned():
+                    for step in plan_stream(user_input):
+                        print(f"    {step['id']}: {step['tool']}({step['arg']})  -- {step['thought']}")
+                        steps.append(step)
+                        yield step
+
+                evidence = worker(planned(), parallel=parallel)
+
+                if not steps:
+                    print("  Failed to parse plan. Please try again.")
+                    continue
+
+                # Step 3: Solver - synthesize final answer
+                print("\n Solving...")
+                print("\nFinal Answer: ", end="")
+                for delta in solver_stream(user_input, steps, evidence):
+                    print(delta, end="", flush=True)
+                print()
+                print(f"  ({response_cache.summary()})")
+        except BudgetExceeded as e:
+            print(f"\n  Stopped: {e}")
             continue
+        print(f"  ({budget.report()})")
 
-        print(f"\n  Parsed plan ({len(steps)} steps):")
-        for s in steps:
-            print(f"    {s['id']}: {s['tool']}({s['arg']})  -- {s['thought']}")
 
-        # Step 2: Worker - execute all steps sequentially
-        print("\n Executing all steps...")
-        evidence = worker(steps)
+# ============================================================
+# Benchmark
+# ============================================================
 
-        # Step 3: Solver - synthesize final answer
-        print("\n Solving...")
-        answer = solver(user_input, steps, evidence)
-        print(f"\nFinal Answer: {answer}")
+BENCH_STEPS = [
+    {"id": "#E1", "thought": "Tokyo weather", "tool": "weather_forecast", "arg": "Tokyo"},
+    {"id": "#E2", "thought": "Osaka weather", "tool": "weather_forecast", "arg": "Osaka"},
+    {"id": "#E3", "thought": "Kyoto weather", "tool": "weather_forecast", "arg": "Kyoto"},
+    {"id": "#E4", "thought": "Fukuoka weather", "tool": "weather_forecast", "arg": "Fukuoka"},
+    {"id": "#E5", "thought": "Rain details", "tool": "web_search", "arg": "rain in Kyoto: #E3"},
+    {"id": "#E6", "thought": "Compare", "tool": "web_search", "arg": "compare #E1, #E2, #E4, #E5"},
+]
+
+
+def benchmark(latency: float = 0.3, max_workers: int = 4):
+    """Compare sequential and dependency-aware execution with slow mock tools."""
+    real_tools = dict(available_tools)
+
+    def slow(tool):
+        def wrapped(arg):
+            time.sleep(latency)
+            return tool(arg)
+        return wrapped
+
+    available_tools.update({name: slow(tool) for name, tool in real_tools.items()})
+    try:
+        timings = {}
+        for parallel in (False, True):
+            start = time.perf_counter()
+            worker(BENCH_STEPS, parallel=parallel, max_workers=max_workers)
+            timings[parallel] = time.perf_counter() - start
+    finally:
+        available_tools.update(real_tools)
+
+    print(f"\n  {len(BENCH_STEPS)} steps, {latency:.1f}s per tool call")
+    print(f"  sequential: {timings[False]:.2f}s")
+    print(f"  parallel:   {timings[True]:.2f}s ({timings[False] / timings[True]:.1f}x speedup)")
 
 
 if __name__ == "__main__":
-    run()
+    if "--bench" in sys.argv:
+        benchmark()
+    else:
+        run(parallel="--parallel" in sys.argv)
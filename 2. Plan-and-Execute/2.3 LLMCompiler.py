@@ -0,0 +1,389 @@
+import openai
+from dotenv import load_dotenv
+import os
+import re
+import sys
+import time
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.llm import chat_completion
+from common.budget import TokenBudget, BudgetExceeded, query_budget
+from common.streaming import stream_text
+from common.tracing import traced
+from common.resilience import tool_guard
+from common.tool_registry import ToolRegistry
+from common.prompts import Prompt
+
+load_dotenv()
+openai.api_key = os.getenv("OPENAI_API_KEY")
+
+registry = ToolRegistry()
+
+@registry.tool
+def weather_forecast(city: Annotated[str, "The city name"]) -> str:
+    """Get the weather forecast for a city"""
+    if city == "Tokyo":
+        return "sunny, 22C"
+    elif city == "Osaka":
+        return "cloudy, -5C"
+    elif city == "Kyoto":
+        return "rainy, 20C"
+    elif city == "Fukuoka":
+        return "sunny, 22C"
+    else:
+        return "Error: city not found"
+
+@registry.tool
+def web_search(query: Annotated[str, "The search query"]) -> str:
+    """Search the web for information"""
+    return "Precipitation: 10mm, Wind: 10km/h"
+
+available_tools = registry
+
+# ============================================================
+# Prompts
+# ============================================================
+
+PLANNER_PROMPT = """\
+You are a planner that creates a plan of tool calls which will be executed
+in parallel wherever possible.
+
+For each step, output a line of thought (Plan:) followed by a tool call.
+Use #E1, #E2, ... as variable placeholders to reference results from
+previous steps.
+
+Available tools:
+{tool_descriptions}
+
+Output format (strict, one plan-evidence pair per step):
+Plan: <reasoning about what to do>
+#E1 = tool_name(arg or #Ex reference)
+Plan: <next reasoning>
+#E2 = tool_name(arg or #Ex reference)
+...
+
+Rules:
+- Each #E variable must be assigned exactly once.
+- Only reference a previous #E variable when the step really needs its result;
+  independent steps must not reference each other so they can run in parallel.
+- Keep the plan concise (1-8 steps).
+- Do NOT output anything else besides Plan/Evidence lines."""
+
+JOINER_PROMPT = """\
+You are a joiner. Given the original question and the results of tool calls
+that were executed in parallel, provide a final comprehensive answer.
+
+Respond directly to the user's question using the evidence provided."""
+
+# System prompts formatted once; the question and evidence follow them (prompt-cache friendly)
+PLANNER = Prompt(PLANNER_PROMPT, tool_descriptions=registry.descriptions)
+JOINER = Prompt(JOINER_PROMPT)
+
+# ============================================================
+# Planner (batch + streaming)
+# ============================================================
+
+@dataclass
+class Task:
+    id: str                 # "#E1"
+    thought: str
+    tool: str
+    arg: str
+    deps: set[str] = field(default_factory=set)
+
+
+TASK_LINE = re.compile(r"^\s*#E(\d+)\s*=\s*(\w+)\s*\((.*)\)\s*$")
+PLAN_LINE = re.compile(r"^\s*Plan:\s*(.*)$")
+DEP_PATTERN = re.compile(r"#E\d+")
+
+
+class PlanParser:
+    """
+    Line-based parser for the planner output.
+    Text can be fed in arbitrary chunks; a task is emitted as soon as its
+    `#En = tool(arg)` line is complete. Only references to already emitted
+    tasks become dependencies, so the graph is always acyclic.
+    """
+    def __init__(self):
+        self._buffer = ""
+        self._thought = ""
+        self._seen: set[str] = set()
+
+    def feed(self, chunk: str) -> list[Task]:
+        self._buffer += chunk
+        tasks = []
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            task = self._parse_line(line)
+            if task:
+                tasks.append(task)
+        return tasks
+
+    def close(self) -> list[Task]:
+        line, self._buffer = self._buffer, ""
+        task = self._parse_line(line)
+        return [task] if task else []
+
+    def _parse_line(self, line: str) -> Task | None:
+        plan_match = PLAN_LINE.match(line)
+        if plan_match:
+            self._thought = plan_match.group(1).strip()
+            return None
+
+        task_match = TASK_LINE.match(line)
+        if not task_match:
+            return None
+
+        eid, tool_name, raw_arg = task_match.groups()
+        task_id = f"#E{eid}"
+        arg = raw_arg.strip().strip('"').strip("'")
+        task = Task(
+            id=task_id,
+            thought=self._thought,
+            tool=tool_name,
+            arg=arg,
+            deps=set(DEP_PATTERN.findall(arg)) & self._seen,
+        )
+        self._seen.add(task_id)
+        self._thought = ""
+        return task
+
+
+def plan(user_input: str) -> list[Task]:
+    """Wait for the whole plan, then parse it."""
+    response = chat_completion(
+        model="gpt-4o",
+        messages=PLANNER.messages(user_input),
+    )
+    parser = PlanParser()
+    raw_plan = response.choices[0].message.content
+    return parser.feed(raw_plan) + parser.close()
+
+
+def plan_stream(user_input: str):
+    """Yield tasks while the planner is still writing the rest of the plan."""
+    parser = PlanParser()
+    for delta in stream_text(
+        model="gpt-4o",
+        messages=PLANNER.messages(user_input),
+    ):
+        yield from parser.feed(delta)
+    yield from parser.close()
+
+# ============================================================
+# Task Fetching Unit (thread pool)
+# ============================================================
+
+@traced("tool")
+def run_tool(tool_name: str, arg: str) -> str:
+    if tool_name not in available_tools:
+        return f"Unknown tool: {tool_name}"
+    try:
+        return str(tool_guard(tool_name, "llmcompiler").call(available_tools[tool_name], arg))
+    except Exception as e:
+        return f"Error: {e}"
+
+
+def substitute(arg: str, evidence: dict) -> str:
+    # A single regex pass, so #E1 never clobbers part of #E12
+    return DEP_PATTERN.sub(lambda m: evidence.get(m.group(0), m.group(0)), arg)
+
+
+class TaskFetchingUnit:
+    """
+    Dispatches each task to a thread pool as soon as all of its #E
+    dependencies have resolved. Tasks may be submitted while earlier tasks
+    are still running (streaming planner).
+    """
+    def __init__(self, max_workers: int = 4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._cond = threading.Condition()
+        self.tasks: dict[str, Task] = {}
+        self.evidence: dict[str, str] = {}
+        self._waiting: dict[str, Task] = {}
+        self._running = 0
+        self._closed = False
+
+    def submit(self, task: Task) -> None:
+        with self._cond:
+            self.tasks[task.id] = task
+            self._waiting[task.id] = task
+            self._schedule_ready()
+
+    def close(self) -> None:
+        """No more tasks will be submitted."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def join(self) -> dict:
+        with self._cond:
+            while not self._closed or self._waiting or self._running:
+                self._cond.wait()
+        self._pool.shutdown()
+        return self.evidence
+
+    def _schedule_ready(self) -> None:
+        # Caller holds self._cond
+        ready = [t for t in self._waiting.values() if t.deps <= self.evidence.keys()]
+        for task in ready:
+            # A future that is already done runs _on_done inline, and its nested
+            # _schedule_ready may have dispatched the rest of this snapshot
+            if self._waiting.pop(task.id, None) is None:
+                continue
+            arg = substitute(task.arg, self.evidence)
+            self._running += 1
+            print(f"    [Dispatch] {task.id} = {task.tool}({arg})")
+            future = self._pool.submit(run_tool, task.tool, arg)
+            future.add_done_callback(lambda f, tid=task.id: self._on_done(tid, f))
+
+    def _on_done(self, task_id: str, future) -> None:
+        with self._cond:
+            self._running -= 1
+            self.evidence[task_id] = future.result()
+            print(f"    [Result] {task_id} -> {self.evidence[task_id]}")
+            self._schedule_ready()
+            self._cond.notify_all()
+
+
+def execute_threaded(tasks, max_workers: int = 4) -> dict:
+    """Run an iterable of tasks (list or streaming generator) on a thread pool."""
+    tfu = TaskFetchingUnit(max_workers=max_workers)
+    for task in tasks:
+        tfu.submit(task)
+    tfu.close()
+    return tfu.join()
+
+# ============================================================
+# Task Fetching Unit (asyncio)
+# ============================================================
+
+async def execute_async(tasks, max_concurrency: int = 4) -> dict:
+    """
+    asyncio variant: every task awaits the futures of its dependencies, then
+    runs the (blocking) tool in a worker thread under a concurrency limit.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    futures: dict[str, asyncio.Future] = {}
+    evidence: dict[str, str] = {}
+
+    def future_for(task_id: str) -> asyncio.Future:
+        if task_id not in futures:
+            futures[task_id] = loop.create_future()
+        return futures[task_id]
+
+    async def run(task: Task) -> None:
+        for dep in task.deps:
+            await future_for(dep)
+        arg = substitute(task.arg, evidence)
+        async with semaphore:
+            print(f"    [Dispatch] {task.id} = {task.tool}({arg})")
+            result = await asyncio.to_thread(run_tool, task.tool, arg)
+        evidence[task.id] = result
+        print(f"    [Result] {task.id} -> {result}")
+        future_for(task.id).set_result(result)
+
+    # Pull from the (possibly streaming) planner in a thread so running
+    # tasks keep making progress while the next plan line is on its way
+    source = iter(tasks)
+    running = []
+    while (task := await asyncio.to_thread(next, source, None)) is not None:
+        running.append(asyncio.create_task(run(task)))
+
+    await asyncio.gather(*running)
+    return evidence
+
+# ============================================================
+# Joiner
+# ============================================================
+
+def joiner(user_input: str, tasks: list[Task], evidence: dict) -> str:
+    evidence_str = ""
+    for task in tasks:
+        evidence_str += f"{task.id} (Plan: {task.thought})\n"
+        evidence_str += f"  Result: {evidence.get(task.id, 'N/A')}\n\n"
+
+    response = chat_completion(
+        model="gpt-4o",
+        messages=JOINER.messages(f"Question: {user_input}\n\nEvidence:\n{evidence_str}"),
+    )
+    return response.choices[0].message.content
+
+
+def critical_path(tasks: list[Task]) -> int:
+    """Length of the longest dependency chain, i.e. the number of sequential rounds."""
+    by_id = {t.id: t for t in tasks}
+    depth: dict[str, int] = {}
+
+    def visit(task_id: str, seen: frozenset) -> int:
+        if task_id in depth:
+            return depth[task_id]
+        if task_id not in by_id or task_id in seen:
+            return 0
+        task = by_id[task_id]
+        d = 1 + max((visit(dep, seen | {task_id}) for dep in task.deps), default=0)
+        depth[task_id] = d
+        return d
+
+    return max((visit(t.id, frozenset()) for t in tasks), default=0)
+
+
+def run(streaming: bool = True, use_asyncio: bool = False):
+    print("LLMCompiler Agent (press q to quit)")
+    print("=" * 50)
+
+    while True:
+        user_input = input("\nUser: ")
+        if user_input.lower() == "q":
+            print("Goodbye!")
+            break
+
+        try:
+            with TokenBudget(query_budget, "llm-compiler") as budget:
+                start = time.perf_counter()
+                tasks = []
+
+                def collect(source):
+                    for task in source:
+                        print(f"  [Planned] {task.id} = {task.tool}({task.arg})  deps={sorted(task.deps)}")
+                        tasks.append(task)
+                        yield task
+
+                # Step 1 + 2: plan and execute, overlapped when streaming
+                print("\n Planning and executing...")
+                source = plan_stream(user_input) if streaming else plan(user_input)
+                if use_asyncio:
+                    evidence = asyncio.run(execute_async(collect(source)))
+                else:
+                    evidence = execute_threaded(collect(source))
+
+                if not tasks:
+                    print("  Failed to parse plan. Please try again.")
+                    continue
+
+                print(
+                    f"\n  {len(tasks)} tasks, critical path {critical_path(tasks)}, "
+                    f"took {time.perf_counter() - start:.2f}s"
+                )
+
+                # Step 3: Joiner - synthesize final answer
+                print("\n Joining...")
+                answer = joiner(user_input, tasks, evidence)
+                print(f"\nFinal Answer: {answer}")
+        except BudgetExceeded as e:
+            print(f"\n  Stopped: {e}")
+            continue
+        print(f"  ({budget.report()})")
+
+
+if __name__ == "__main__":
+    run(
+        streaming="--no-stream" not in sys.argv,
+        use_asyncio="--asyncio" in sys.argv,
+    )
@@ -1,12 +1,27 @@
+import re
 import json
 import time
 import os
-from typing import Any
-from dataclasses import dataclass, field
+import sys
+import asyncio
+import warnings
+from typing import Any, Annotated
+from array import array
+from dataclasses import dataclass, field, asdict
 from enum import Enum
 from dotenv import load_dotenv
 import openai
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.llm import chat_completion, achat_completion
+from common.budget import TokenBudget, BudgetExceeded
+from common.memo import cached_tool, tool_cache_stats
+from common.retry import RetryEngine
+from common.resilience import CircuitOpen, guards_report
+from common.tracing import span, annotate, traced
+from common.sessions import SessionStore
+from common.tool_registry import ToolRegistry
+
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
@@ -16,22 +31,46 @@ class StepStatus(Enum):
     PARSE_ERROR = "parse_error"
     MAX_RETRIES = "max_retries"
     LOOP_DETECTED = "loop_detected"
+    CIRCUIT_OPEN = "circuit_open"  # the tool's shared breaker rejected the call
 
-@dataclass
+# slots: no per-instance __dict__, a third smaller per step
+@dataclass(slots=True)
 class AgentStep:
     thought: str
     action: str | None
     action_input: dict | None
     observation: str | None
     status: StepStatus
+    duration: float = 0.0  # seconds: LLM call + parse + tool
+    tokens: int = 0        # prompt + completion tokens of this step's LLM call
 
-@dataclass
+    def to_dict(self) -> dict:
+        return {**asdict(self), "status": self.status.value}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AgentStep":
+        return cls(**{**data, "status": StepStatus(data["status"])})
+
+@dataclass(slots=True)
 class AgentState:
     query: str
     steps: list[AgentStep] = field(default_factory=list)
     final_answer: str | None = None
     total_tokens: int = 0
 
+    def to_dict(self) -> dict:
+        """Plain, JSON/msgpack-safe form, e.g. for a SessionStore record."""
+        return {
+            "query": self.query,
+            "steps": [step.to_dict() for step in self.steps],
+            "final_answer": self.final_answer,
+            "total_tokens": self.total_tokens,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AgentState":
+        return cls(**{**data, "steps": [AgentStep.from_dict(step) for step in data["steps"]]})
+
 # A tool that occasionally fails to simulate real-world behavior
 def web_search(query: str) -> str:
     import random
@@ -39,15 +78,34 @@ def web_search(query: str) -> str:
         raise ConnectionError(f"Search API timeout for query: {query}")
     return f"Search results for '{query}': [mock result 1, mock result 2]"
 
-def execute_tool_with_retry(
+def _print_retry(tool_name: str, attempt: int, error: Exception, delay: float) -> None:
+    print(f"  [retry] {tool_name} attempt {attempt} failed: {error}. retrying in {delay:.2f}s")
+
+# Tool calls: capped jittered backoff (an asyncio.sleep, not a blocked thread),
+# 10s per attempt, a hedged duplicate once an attempt is slower than p95, and
+# each tool's process-wide circuit breaker + bulkhead (shared by all sessions)
+tool_retry = RetryEngine(
+    attempts=3,
+    base=0.5,
+    cap=5.0,
+    timeout=10.0,
+    hedge_quantile=95,
+    # Wrong arguments -- not worth retrying
+    retry_on=lambda error: not isinstance(error, TypeError),
+    on_retry=_print_retry,
+    guarded=True,
+    scope="error-handling",
+)
+
+@traced("tool")
+async def aexecute_tool_with_retry(
     tool_name: str, # The name of the tool to execute
     tool_input: dict, # The input to the tool
     tool_registry: dict, # The registry of tools
-    max_retries: int = 3, # The maximum number of retries
-    backoff_base: float = 1.5 # The base for exponential backoff
+    engine: RetryEngine = tool_retry # Retry / timeout / hedging policy
 ) -> tuple[str, StepStatus]:
     """
-    Tool executor with exponential backoff.
+    Tool executor with retries scheduled on the event loop.
     Returns (result_str, status).
     """
     if tool_name not in tool_registry:
@@ -58,24 +116,35 @@ def execute_tool_with_retry(
             StepStatus.TOOL_ERROR
         )
 
-    last_error = None
-    for attempt in range(max_retries):
-        try:
-            result = tool_registry[tool_name](**tool_input)
-            return str(result), StepStatus.SUCCESS
+    annotate(tool=tool_name)
+    try:
+        if isinstance(tool_registry, ToolRegistry):
+            # Bad arguments are caught here, before the retry engine and the tool's guard
+            tool_registry.validate(tool_name, tool_input)
+        result = await engine.run(tool_name, tool_registry[tool_name], **tool_input)
+        return str(result), StepStatus.SUCCESS
 
-        except TypeError as e:
-            # Wrong arguments -- not worth retrying
-            return f"Error: wrong arguments for '{tool_name}': {e}", StepStatus.TOOL_ERROR
+    except TypeError as e:
+        return f"Error: wrong arguments for '{tool_name}': {e}", StepStatus.TOOL_ERROR
 
-        except Exception as e:
-            last_error = e
-            if attempt < max_retries - 1:
-                wait = backoff_base ** attempt
-                print(f"  [retry] attempt {attempt + 1} failed: {e}. waiting {wait:.1f}s")
-                time.sleep(wait)
+    except CircuitOpen as e:
+        # Fail fast: the backend is down for everyone, let the LLM work around it
+        annotate(error=str(e))
+        return f"Error: {e}. Try another tool or answer without it.", StepStatus.CIRCUIT_OPEN
 
-    return f"Tool '{tool_name}' failed after {max_retries} retries: {last_error}", StepStatus.MAX_RETRIES
+    except Exception as e:
+        annotate(error=str(e))
+        return f"Tool '{tool_name}' failed after {engine.attempts} attempts: {e}", StepStatus.MAX_RETRIES
+
+
+def execute_tool_with_retry(
+    tool_name: str,
+    tool_input: dict,
+    tool_registry: dict,
+    engine: RetryEngine = tool_retry
+) -> tuple[str, StepStatus]:
+    """Blocking form of aexecute_tool_with_retry for the sync agent loop."""
+    return asyncio.run(aexecute_tool_with_retry(tool_name, tool_input, tool_registry, engine))
 
 
 @dataclass
@@ -85,18 +154,115 @@ class ParsedAction:
     action_input: dict | None
     final_answer: str | None
 
+class ParseErrorCode(Enum):
+    NO_ACTION = "no_action"            # no JSON object and no "Final Answer:"
+    TRUNCATED = "truncated"            # a JSON object is opened but never closed
+    MALFORMED_JSON = "malformed_json"  # an object that even the repairs cannot load
+    MISSING_ACTION = "missing_action"
+    BAD_ACTION_INPUT = "bad_action_input"
+
+class ActionParseError(ValueError):
+    def __init__(self, code: ParseErrorCode, message: str):
+        super().__init__(message)
+        self.code = code
+
+# Braces, and quoted strings (only looked for inside an object: apostrophes in prose are not quotes)
+_BRACE = re.compile(r"[{}]")
+_IN_OBJECT = re.compile(r"""[{}]|"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'""", re.DOTALL)
+# Repairs, applied to the text between strings only
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_PY_LITERAL = re.compile(r"\b(True|False|None)\b")
+_LINE_COMMENT = re.compile(r"//[^\n]*")
+_JSON_LITERAL = {"True": "true", "False": "false", "None": "null"}
+
+def _json_objects(text: str) -> tuple[list[str], bool]:
+    """Top-level {...} spans in order, and whether one was left open at the end."""
+    objects, depth, start, pos = [], 0, 0, 0
+    while True:
+        match = (_IN_OBJECT if depth else _BRACE).search(text, pos)
+        if match is None:
+            return objects, depth > 0
+        token = match.group()
+        pos = match.end()
+        if token == "{":
+            if depth == 0:
+                start = match.start()
+            depth += 1
+        elif token == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                objects.append(text[start:pos])
+
+def _repair(candidate: str) -> str:
+    """Single quotes -> double; drop trailing commas and // comments; Python literals -> JSON."""
+    out, pos = [], 0
+    for match in _IN_OBJECT.finditer(candidate):
+        token = match.group()
+        if token in "{}":
+            continue
+        out.append(_fix_bare(candidate[pos:match.start()]))
+        if token[0] == "'":
+            token = json.dumps(token[1:-1].replace("\\'", "'"), ensure_ascii=False)
+        out.append(token)
+        pos = match.end()
+    out.append(_fix_bare(candidate[pos:]))
+    return "".join(out)
+
+def _fix_bare(text: str) -> str:
+    text = _LINE_COMMENT.sub("", text)
+    text = _TRAILING_COMMA.sub(r"\1", text)
+    return _PY_LITERAL.sub(lambda m: _JSON_LITERAL[m.group()], text)
+
+def _load_object(candidate: str):
+    """The parsed object, or the JSONDecodeError of the repaired text."""
+    try:
+        return json.loads(candidate)          # fast path: well-formed output
+    except json.JSONDecodeError:
+        pass
+    try:
+        # strict=False: raw newlines inside strings
+        return json.loads(_repair(candidate), strict=False)
+    except json.JSONDecodeError as e:
+        return e
+
+def _is_action(data) -> bool:
+    return isinstance(data, dict) and ("action" in data or "final_answer" in data)
+
+def _fast_path(text: str) -> dict | None:
+    """One well-formed object, fenced or not: from the first { to the last }."""
+    first, last = text.find("{"), text.rfind("}")
+    if first == -1 or last < first:
+        return None
+    try:
+        data = json.loads(text[first:last + 1])
+    except json.JSONDecodeError:
+        return None
+    return data if _is_action(data) else None
+
+@traced("parse")
 def parse_llm_response(response_text: str) -> ParsedAction:
     """
-    Parse structured actions from LLM text output.
-    Uses a simplified JSON block format.
+    Parse the action JSON from LLM text output, fenced or not: the last
+    object that loads (after light repairs) and has an action or final
+    answer wins. Falls back to a "Final Answer:" line. Raises
+    ActionParseError (a ValueError) with a code.
     """
-    import re
-
-    # Try to find a JSON block
-    json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
+    data, objects, truncated = _fast_path(response_text), [], False
+    if data is None:
+        objects, truncated = _json_objects(response_text)
+    # Only an object with an action or final answer is a candidate; the last
+    # other object (or load error) is kept to say why nothing matched
+    rejected = None
+    for candidate in reversed(objects):
+        loaded = _load_object(candidate)
+        if _is_action(loaded):
+            data = loaded
+            break
+        if rejected is None or isinstance(rejected, json.JSONDecodeError):
+            rejected = loaded
 
-    if not json_match:
-        # No JSON: could be a direct answer or a format error
+    if data is None:
+        # Checked before any error: "Final Answer: ... {"debug": true}" is an answer
         if "Final Answer:" in response_text:
             answer = response_text.split("Final Answer:")[-1].strip()
             return ParsedAction(
@@ -105,27 +271,36 @@ def parse_llm_response(response_text: str) -> ParsedAction:
                 action_input=None,
                 final_answer=answer
             )
-        raise ValueError(f"Cannot parse LLM output: no JSON block or final answer found")
-
-    try:
-        data = json.loads(json_match.group(1))
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Malformed JSON in LLM output: {e}")
+        if isinstance(rejected, dict):
+            raise ActionParseError(ParseErrorCode.MISSING_ACTION, "Parsed JSON missing 'action' field")
+        if truncated:
+            raise ActionParseError(ParseErrorCode.TRUNCATED, "JSON object is not closed (output cut off?)")
+        if isinstance(rejected, json.JSONDecodeError):
+            raise ActionParseError(ParseErrorCode.MALFORMED_JSON, f"Malformed JSON in LLM output: {rejected}")
+        raise ActionParseError(ParseErrorCode.NO_ACTION, "Cannot parse LLM output: no JSON block or final answer found")
 
     # Validate required fields
-    if "action" not in data:
-        raise ValueError("Parsed JSON missing 'action' field")
+    if "action" not in data and not data.get("final_answer"):
+        raise ActionParseError(ParseErrorCode.MISSING_ACTION, "Parsed JSON missing 'action' field")
+    action_input = data.get("action_input") or {}
+    if not isinstance(action_input, dict):
+        raise ActionParseError(ParseErrorCode.BAD_ACTION_INPUT, "'action_input' must be a JSON object")
 
     return ParsedAction(
         thought=data.get("thought", ""),
         action=data.get("action"),
-        action_input=data.get("action_input", {}),
+        action_input=action_input,
         final_answer=data.get("final_answer")
     )
 
 class CircuitBreaker:
     """
     Prevents the agent from entering infinite loops or exceeding resource limits.
+    Scoped to one run; tool backend failures across runs are tracked by the
+    per-tool breakers in common/resilience.py.
+
+    The token limit is a TokenBudget: a call that would not fit in what is
+    left is refused before it is sent, not noticed after it returned.
     """
     def __init__(
         self,
@@ -136,14 +311,21 @@ class CircuitBreaker:
         self.max_steps = max_steps
         self.max_consecutive_errors = max_consecutive_errors
         self.max_tokens = max_tokens
+        self.budget = TokenBudget(max_tokens, name="error-handling")
 
         self._steps = 0
         self._consecutive_errors = 0
-        self._total_tokens = 0
 
-    def record_step(self, status: StepStatus, tokens_used: int = 0) -> None:
+    def record_step(self, status: StepStatus, tokens_used: int | None = None) -> None:
+        # tokens_used is deprecated: the budget charges every LLM call made under it
+        if tokens_used is not None:
+            warnings.warn(
+                "CircuitBreaker.record_step(tokens_used=...) is ignored; "
+                "tokens are charged to CircuitBreaker.budget automatically",
+                DeprecationWarning,
+                stacklevel=2,
+            )
         self._steps += 1
-        self._total_tokens += tokens_used
 
         if status == StepStatus.SUCCESS:
             self._consecutive_errors = 0
@@ -155,8 +337,8 @@ class CircuitBreaker:
             return True, f"Max steps reached ({self.max_steps})"
         if self._consecutive_errors >= self.max_consecutive_errors:
             return True, f"Too many consecutive errors ({self._consecutive_errors})"
-        if self._total_tokens >= self.max_tokens:
-            return True, f"Token budget exceeded ({self._total_tokens})"
+        if self.budget.remaining <= 0:
+            return True, f"Token budget exceeded ({self.budget.used})"
         return False, ""
 
 SYSTEM_PROMPT = """You are a helpful agent. At each step, respond with a JSON block:
@@ -179,6 +361,7 @@ When you have enough information, respond with:
 ```
 """
 
+@traced("query", query_arg="query")
 def run_agent(query: str, tool_registry: dict) -> AgentState:
     state = AgentState(query=query)
     circuit_breaker = CircuitBreaker(max_steps=8, max_consecutive_errors=3)
@@ -194,34 +377,47 @@ def run_agent(query: str, tool_registry: dict) -> AgentState:
             state.final_answer = f"Agent stopped: {reason}"
             break
 
-        # 2. Call LLM
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            max_tokens=1024,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                *messages,
-            ],
-        )
+        # 2. Call LLM (rate limited; 429/5xx are retried with backoff; refused if over budget)
+        step_start = time.perf_counter()
+        used_before = circuit_breaker.budget.used
+        try:
+            with circuit_breaker.budget:
+                response = chat_completion(
+                    model="gpt-4o",
+                    max_tokens=1024,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        *messages,
+                    ],
+                )
+        except BudgetExceeded as e:
+            print(f"[CircuitBreaker] Stopping: {e}")
+            state.final_answer = f"Agent stopped: {e}"
+            break
         response_text = response.choices[0].message.content
-        tokens_used = response.usage.prompt_tokens + response.usage.completion_tokens
+        # Actual usage (0 for a cached response)
+        tokens_used = circuit_breaker.budget.used - used_before
+        state.total_tokens += tokens_used
 
         print(f"\n[LLM output]\n{response_text}")
 
         # 3. Parse LLM output (with error handling)
         try:
             parsed = parse_llm_response(response_text)
-        except ValueError as e:
-            print(f"[ParseError] {e}")
+        except ActionParseError as e:
+            print(f"[ParseError] {e.code.value}: {e}")
+            annotate(parse_error=e.code.value)
             step = AgentStep(
                 thought=response_text,
                 action=None,
                 action_input=None,
-                observation=f"Parse error: {e}. Please respond with valid JSON.",
-                status=StepStatus.PARSE_ERROR
+                observation=f"Parse error ({e.code.value}): {e}. Please respond with valid JSON.",
+                status=StepStatus.PARSE_ERROR,
+                duration=time.perf_counter() - step_start,
+                tokens=tokens_used
             )
             state.steps.append(step)
-            circuit_breaker.record_step(StepStatus.PARSE_ERROR, tokens_used)
+            circuit_breaker.record_step(StepStatus.PARSE_ERROR)
 
             # Feed error back to LLM so it can correct itself
             messages.append({"role": "assistant", "content": response_text})
@@ -246,10 +442,12 @@ def run_agent(query: str, tool_registry: dict) -> AgentState:
             action=parsed.action,
             action_input=parsed.action_input,
             observation=observation,
-            status=status
+            status=status,
+            duration=time.perf_counter() - step_start,
+            tokens=tokens_used
         )
         state.steps.append(step)
-        circuit_breaker.record_step(status, tokens_used)
+        circuit_breaker.record_step(status)
 
         print(f"[Tool: {parsed.action}] -> {observation[:100]}")
 
@@ -260,12 +458,435 @@ def run_agent(query: str, tool_registry: dict) -> AgentState:
     return state
 
 
+@traced("query", query_arg="query")
+async def arun_agent(query: str, tool_registry: dict) -> AgentState:
+    """
+    asyncio version of run_agent for serving many queries in one process.
+    LLM calls share the pooled AsyncOpenAI client; tools run in worker
+    threads and their retry backoff is an asyncio.sleep, so neither blocks
+    the event loop nor holds a thread.
+    """
+    state = AgentState(query=query)
+    circuit_breaker = CircuitBreaker(max_steps=8, max_consecutive_errors=3)
+    messages = [{"role": "user", "content": query}]
+
+    while True:
+        should_stop, reason = circuit_breaker.should_stop()
+        if should_stop:
+            state.final_answer = f"Agent stopped: {reason}"
+            break
+
+        step_start = time.perf_counter()
+        used_before = circuit_breaker.budget.used
+        try:
+            with circuit_breaker.budget:
+                response = await achat_completion(
+                    model="gpt-4o",
+                    max_tokens=1024,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        *messages,
+                    ],
+                )
+        except BudgetExceeded as e:
+            state.final_answer = f"Agent stopped: {e}"
+            break
+        response_text = response.choices[0].message.content
+        tokens_used = circuit_breaker.budget.used - used_before
+        state.total_tokens += tokens_used
+
+        try:
+            parsed = parse_llm_response(response_text)
+        except ActionParseError as e:
+            annotate(parse_error=e.code.value)
+            step = AgentStep(
+                thought=response_text,
+                action=None,
+                action_input=None,
+                observation=f"Parse error ({e.code.value}): {e}. Please respond with valid JSON.",
+                status=StepStatus.PARSE_ERROR,
+                duration=time.perf_counter() - step_start,
+                tokens=tokens_used
+            )
+            state.steps.append(step)
+            circuit_breaker.record_step(StepStatus.PARSE_ERROR)
+            messages.append({"role": "assistant", "content": response_text})
+            messages.append({"role": "user", "content": step.observation})
+            continue
+
+        if parsed.action == "finish" or parsed.final_answer:
+            state.final_answer = parsed.final_answer
+            break
+
+        observation, status = await aexecute_tool_with_retry(
+            tool_name=parsed.action,
+            tool_input=parsed.action_input,
+            tool_registry=tool_registry
+        )
+
+        step = AgentStep(
+            thought=parsed.thought,
+            action=parsed.action,
+            action_input=parsed.action_input,
+            observation=observation,
+            status=status,
+            duration=time.perf_counter() - step_start,
+            tokens=tokens_used
+        )
+        state.steps.append(step)
+        circuit_breaker.record_step(status)
+
+        messages.append({"role": "assistant", "content": response_text})
+        messages.append({"role": "user", "content": f"Observation: {observation}"})
+
+    return state
+
+
+# ============================================================
+# Trace store: many finished runs in columns
+# ============================================================
+
+class TraceStore:
+    """
+    Finished AgentStates kept column-wise for tens of thousands of runs:
+    numbers and status codes in typed arrays (durations as float32), tool
+    names as indexes into an intern table, thoughts and observations
+    deduplicated (identical tool results and error messages are stored
+    once) and observations longer than `max_observation` characters cut
+    down to a prefix. run(i) rebuilds the AgentState.
+    """
+    _STATUSES = list(StepStatus)
+
+    def __init__(self, max_observation: int | None = 2000):
+        self.max_observation = max_observation
+        # Per run
+        self.queries: list[str] = []
+        self.answers: list[str | None] = []
+        self.total_tokens = array("Q")
+        self.first_step = array("Q", [0])   # steps of run i: first_step[i]:first_step[i+1]
+        # Per step
+        self.actions = array("H")           # 0 = no action, else _names[i - 1]
+        self.statuses = array("B")
+        self.durations = array("f")
+        self.tokens = array("I")
+        self.thoughts: list[str] = []
+        self.inputs: list[str | None] = []  # action_input as JSON
+        self.observations: list[str | None] = []
+        self._names: list[str] = []
+        self._name_ids: dict[str, int] = {}
+        self._shared: dict[str, str] = {}
+        self._status_ids = {status: i for i, status in enumerate(self._STATUSES)}
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def add(self, state: AgentState) -> int:
+        """Store a finished run; returns its index."""
+        for step in state.steps:
+            self.actions.append(self._name_id(step.action))
+            self.statuses.append(self._status_ids[step.status])
+            self.durations.append(step.duration)
+            self.tokens.append(step.tokens)
+            self.thoughts.append(self._share(step.thought))
+            self.inputs.append(
+                None if step.action_input is None
+                else self._share(json.dumps(step.action_input, ensure_ascii=False))
+            )
+            self.observations.append(self._share(self._truncate(step.observation)))
+        self.first_step.append(len(self.statuses))
+        self.queries.append(state.query)
+        self.answers.append(state.final_answer)
+        self.total_tokens.append(state.total_tokens)
+        return len(self.queries) - 1
+
+    def run(self, i: int) -> AgentState:
+        return AgentState(
+            query=self.queries[i],
+            steps=[self._step(j) for j in range(self.first_step[i], self.first_step[i + 1])],
+            final_answer=self.answers[i],
+            total_tokens=self.total_tokens[i],
+        )
+
+    def status_counts(self) -> dict[StepStatus, int]:
+        """Steps per status across all runs, without rebuilding any."""
+        counts = [0] * len(self._STATUSES)
+        for code in self.statuses:
+            counts[code] += 1
+        return {status: n for status, n in zip(self._STATUSES, counts) if n}
+
+    def _step(self, j: int) -> AgentStep:
+        action = self.actions[j]
+        return AgentStep(
+            thought=self.thoughts[j],
+            action=self._names[action - 1] if action else None,
+            action_input=None if self.inputs[j] is None else json.loads(self.inputs[j]),
+            observation=self.observations[j],
+            status=self._STATUSES[self.statuses[j]],
+            duration=self.durations[j],
+            tokens=self.tokens[j],
+        )
+
+    def _name_id(self, name: str | None) -> int:
+        if name is None:
+            return 0
+        if name not in self._name_ids:
+            self._names.append(name)
+            self._name_ids[name] = len(self._names)
+        return self._name_ids[name]
+
+    def _share(self, text: str | None) -> str | None:
+        if text is None:
+            return None
+        return self._shared.setdefault(text, text)
+
+    def _truncate(self, text: str | None) -> str | None:
+        if text is None or self.max_observation is None or len(text) <= self.max_observation:
+            return text
+        return f"{text[:self.max_observation]}... [{len(text) - self.max_observation} more chars]"
+
+
+# ============================================================
+# Benchmark: tool retries
+# ============================================================
+
+def benchmark_retry(calls: int = 200, concurrency: int = 50, seed: int = 0):
+    """
+    The flaky web_search (30% failures) with a long tail (3% of calls take
+    1s instead of 50ms), `calls` times with `concurrency` in flight:
+    - blocking: the previous executor, time.sleep(1.5 ** attempt) in a worker thread
+    - backoff: RetryEngine, capped jittered backoff on the event loop
+    - backoff + hedge: also a duplicate call once an attempt passes p95
+    """
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+
+    def flaky_search(query: str) -> str:
+        time.sleep(1.0 if random.random() < 0.03 else 0.05)
+        return web_search(query)
+
+    def blocking(query: str) -> bool:
+        for attempt in range(3):
+            try:
+                flaky_search(query=query)
+                return True
+            except Exception:
+                if attempt < 2:
+                    time.sleep(1.5 ** attempt)
+        return False
+
+    def run_blocking() -> list:
+        def timed(i):
+            start = time.perf_counter()
+            ok = blocking(f"query {i}")
+            return time.perf_counter() - start, ok
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(timed, range(calls)))
+
+    def run_engine(engine: RetryEngine) -> list:
+        async def main():
+            slots = asyncio.Semaphore(concurrency)
+
+            async def timed(i):
+                async with slots:
+                    start = time.perf_counter()
+                    try:
+                        await engine.run("web_search", flaky_search, query=f"query {i}")
+                        ok = True
+                    except Exception:
+                        ok = False
+                    return time.perf_counter() - start, ok
+            return await asyncio.gather(*(timed(i) for i in range(calls)))
+        return asyncio.run(main())
+
+    configs = {
+        "blocking": run_blocking,
+        # Room for every call plus its hedge, as the blocking run has a thread per call
+        "backoff": lambda: run_engine(
+            RetryEngine(attempts=3, hedge_quantile=None, max_workers=2 * concurrency)),
+        "backoff + hedge": lambda: run_engine(
+            RetryEngine(attempts=3, hedge_quantile=95, max_workers=2 * concurrency)),
+    }
+    print(f"\n{calls} web_search calls, {concurrency} in flight")
+    print(f"  {'strategy':<16}{'wall (s)':>9}{'p50':>7}{'p95':>7}{'p99':>7}{'failed':>8}")
+    for name, run in configs.items():
+        random.seed(seed)
+        start = time.perf_counter()
+        results = run()
+        wall = time.perf_counter() - start
+        latencies = sorted(latency for latency, _ in results)
+        pct = lambda q: latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))]
+        print(
+            f"  {name:<16}{wall:>9.2f}{pct(50):>7.2f}{pct(95):>7.2f}{pct(99):>7.2f}"
+            f"{sum(not ok for _, ok in results):>8}"
+        )
+
+
+# ============================================================
+# Benchmark: trace memory
+# ============================================================
+
+def benchmark_memory(runs: int = 20_000, seed: int = 0):
+    """
+    Memory held by `runs` finished traces of 2-8 steps: a list of
+    AgentState objects vs a TraceStore. Tool results repeat (same search,
+    same error) the way they do across many users; every fifth search
+    returns a long page.
+    """
+    import random
+    import tracemalloc
+
+    rng = random.Random(seed)
+    topics = [f"topic {i}" for i in range(500)]
+    page = "lorem ipsum dolor sit amet " * 400
+
+    def make_run(i: int) -> AgentState:
+        state = AgentState(query=f"Question {i} about {rng.choice(topics)}")
+        for n in range(rng.randint(2, 8)):
+            topic = rng.choice(topics)
+            if rng.random() < 0.2:
+                state.steps.append(AgentStep(
+                    f"Step {n}: searching {topic} failed before, trying again",
+                    "web_search", {"query": topic},
+                    f"Tool 'web_search' failed after 3 attempts: Search API timeout for query: {topic}",
+                    StepStatus.MAX_RETRIES, rng.random(), rng.randint(200, 900),
+                ))
+            else:
+                long_page = rng.random() < 0.2
+                state.steps.append(AgentStep(
+                    f"Step {n}: I need to look up {topic} for question {i}",
+                    "web_search", {"query": topic},
+                    f"Search results for '{topic}': " + (page if long_page else "[mock result 1, mock result 2]"),
+                    StepStatus.SUCCESS, rng.random(), rng.randint(200, 900),
+                ))
+        state.final_answer = f"Answer to question {i}"
+        state.total_tokens = sum(step.tokens for step in state.steps)
+        return state
+
+    def measure(build):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        kept = build()
+        elapsed = time.perf_counter() - start
+        size = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        return kept, size, elapsed
+
+    def objects():
+        # Fresh strings per run, as parsed from each LLM / tool response
+        rng.seed(seed)
+        return [make_run(i) for i in range(runs)]
+
+    def columns():
+        rng.seed(seed)
+        store = TraceStore()
+        for i in range(runs):
+            store.add(make_run(i))
+        return store
+
+    print(f"\n{runs} finished runs")
+    print(f"  {'representation':<18}{'memory (MB)':>12}{'bytes/step':>12}{'build (s)':>11}")
+    for name, build in {"AgentState list": objects, "TraceStore": columns}.items():
+        kept, size, elapsed = measure(build)
+        steps = sum(len(state.steps) for state in kept) if isinstance(kept, list) else len(kept.statuses)
+        print(f"  {name:<18}{size / 2**20:>12.1f}{size / steps:>12.0f}{elapsed:>11.2f}")
+        del kept
+
+
+# ============================================================
+# Benchmark: action parsing
+# ============================================================
+
+PARSE_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parse_corpus.jsonl")
+
+def benchmark_parse(corpus: str = PARSE_CORPUS, repeat: int = 2000):
+    """
+    The previous parser (a ```json fence or "Final Answer:") vs the
+    tolerant one on a corpus of model outputs, malformed ones included.
+    Every output a parser rejects costs an extra LLM round trip through
+    the parse-error feedback path; `expect` is the action (or "finish",
+    or the error code for outputs that cannot be understood).
+    """
+    def fenced_only(response_text: str) -> ParsedAction:
+        import re
+        json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
+        if not json_match:
+            if "Final Answer:" in response_text:
+                answer = response_text.split("Final Answer:")[-1].strip()
+                return ParsedAction(response_text, None, None, answer)
+            raise ValueError("Cannot parse LLM output: no JSON block or final answer found")
+        try:
+            data = json.loads(json_match.group(1))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Malformed JSON in LLM output: {e}")
+        if "action" not in data:
+            raise ValueError("Parsed JSON missing 'action' field")
+        return ParsedAction(data.get("thought", ""), data.get("action"),
+                            data.get("action_input", {}), data.get("final_answer"))
+
+    def outcome(parse, text: str) -> str:
+        try:
+            parsed = parse(text)
+        except ActionParseError as e:
+            return e.code.value
+        except ValueError:
+            return "error"
+        return "finish" if parsed.action == "finish" or parsed.final_answer else parsed.action
+
+    with open(corpus, encoding="utf-8") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    parsers = {"fenced only": fenced_only, "tolerant": parse_llm_response.__wrapped__}
+    codes = {code.value for code in ParseErrorCode}
+    understandable = [case for case in cases if case["expect"] not in codes]
+
+    print(f"\n{len(cases)} outputs ({len(understandable)} carry a usable action), {repeat} parses each")
+    print(f"  {'parser':<13}{'parsed':>8}{'wrong':>7}{'round trips':>13}{'us/parse':>10}{'us (clean)':>12}")
+    for name, parse in parsers.items():
+        results = [outcome(parse, case["output"]) for case in cases]
+        parsed = sum(result == case["expect"] for result, case in zip(results, cases)
+                     if case["expect"] not in codes)
+        # Accepted, but not as what the output meant
+        wrong = sum(result != case["expect"] and result != "error" and result not in codes
+                    for result, case in zip(results, cases))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for case in cases:
+                outcome(parse, case["output"])
+        per_parse = (time.perf_counter() - start) / (repeat * len(cases)) * 1e6
+        clean = cases[0]["output"]
+        start = time.perf_counter()
+        for _ in range(repeat * 10):
+            parse(clean)
+        per_clean = (time.perf_counter() - start) / (repeat * 10) * 1e6
+        print(f"  {name:<13}{parsed:>8}{wrong:>7}{len(understandable) - parsed:>13}"
+              f"{per_parse:>10.1f}{per_clean:>12.1f}")
+    for case in cases:
+        print(f"  {case['case']:<46} {outcome(fenced_only, case['output']):>16} -> "
+              f"{outcome(parse_llm_response.__wrapped__, case['output'])}")
+
+
 # Example usage
 if __name__ == "__main__":
-    tools = {
-        "web_search": web_search,
-        "calculator": lambda expression: str(eval(expression))  # demo only, do not use in production
-    }
+    if "--bench-retry" in sys.argv:
+        benchmark_retry()
+        sys.exit()
+    if "--bench-memory" in sys.argv:
+        benchmark_memory()
+        sys.exit()
+    if "--bench-parse" in sys.argv:
+        benchmark_parse()
+        sys.exit()
+
+    tools = ToolRegistry()
+    tools.tool(web_search, description="Search the web")
+
+    @tools.tool
+    def calculator(expression: Annotated[str, "A Python arithmetic expression"]) -> str:
+        """Evaluate an arithmetic expression"""
+        return str(eval(expression))  # demo only, do not use in production
+
+    # Search results are reused for 5 minutes; identical concurrent calls share one request
+    tools["web_search"] = cached_tool(ttl=300, max_entries=1000)(web_search)
 
     result = run_agent(
         query="Search for the latest F1 2026 season regulations and summarise the key changes.",
@@ -275,4 +896,15 @@ if __name__ == "__main__":
     print(f"\n{'='*50}")
     print(f"Steps taken: {len(result.steps)}")
     for i, step in enumerate(result.steps):
-        print(f"  Step {i+1}: {step.action} -> {step.status.value}")
\ No newline at end of file
+        print(f"  Step {i+1}: {step.action} -> {step.status.value} ({step.duration:.2f}s, {step.tokens} tokens)")
+    print(f"Tokens: {result.total_tokens}")
+    print(f"Tool cache: {tool_cache_stats(tools)}")
+    print(f"Tool guards:\n{guards_report(tool_retry.scope)}")
+
+    # --session NAME: append this run to the session's log (one record per run)
+    if "--session" in sys.argv:
+        log = SessionStore(os.getenv("AGENT_SESSION_DIR", "sessions")).open(
+            sys.argv[sys.argv.index("--session") + 1]
+        )
+        log.append(result.to_dict())
+        print(f"Saved as run {len(log)} of the session")
\ No newline at end of file
@@ -0,0 +1 @@
+"""Shared building blocks used by the agent scripts in this repo."""
@@ -0,0 +1,202 @@
+"""
+Batch runner for offline evaluation.
+
+Reads queries from JSONL, runs them through one agent with bounded
+concurrency and appends one result line (answer + metrics) per query to
+the output JSONL as soon as it finishes (with --trace, including where its
+wall-clock time went: llm / tool / parse / retry / other):
+
+    python -m common.batch --agent react --input queries.jsonl --output results.jsonl
+    python -m common.batch --agent rewoo --input requests.jsonl \
+        --id-field request_id --query-field body --mock
+
+The output file is the checkpoint: on restart, queries whose id already
+has a result there are skipped, so a crashed run resumes where it stopped.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import contextlib
+
+from common import llm, budget
+from common.loader import load_agent
+from common.mock_server import MockChatServer
+from common.tracing import tracer, span
+
+AGENTS = ["react", "plan-and-execute", "rewoo", "error-handling"]
+
+# fsync the output every this many results (a flush happens after each one)
+SYNC_EVERY = 100
+
+
+def make_runner(agent: str, module):
+    """async query -> (answer, extra metrics) for the chosen architecture."""
+    if agent == "react":
+        async def run(query):
+            return await module.arun_turn(module.new_session(), query), {}
+    elif agent == "plan-and-execute":
+        async def run(query):
+            return await module.arun_query(query), {}
+    elif agent == "rewoo":
+        async def run(query):
+            return await asyncio.to_thread(module.run_query, query), {}
+    elif agent == "error-handling":
+        tools = {"web_search": module.web_search}
+
+        async def run(query):
+            state = await module.arun_agent(query, tools)
+            statuses = [step.status.value for step in state.steps]
+            return state.final_answer, {"steps": len(statuses), "statuses": statuses}
+    else:
+        raise ValueError(f"unknown agent '{agent}'")
+    return run
+
+
+def read_queries(path: str, id_field: str | None, query_field: str):
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            query_id = record.get(id_field) if id_field else None
+            yield str(query_id if query_id is not None else line_no), record[query_field]
+
+
+def load_checkpoint(path: str, retry_errors: bool) -> set[str]:
+    """
+    Ids that already have a result in `path`. A line cut short by a crash
+    is truncated away so the next append starts on a clean line.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        result = json.loads(line)
+        if result["status"] == "ok" or not retry_errors:
+            done.add(result["id"])
+    return done
+
+
+async def run_batch(run, queries, output, concurrency: int, timeout: float | None) -> list[dict]:
+    """
+    Run `queries` (an iterator of (id, query)) with at most `concurrency` in
+    flight. Workers pull from the iterator, so a 10k-line input is never
+    materialised as 10k tasks.
+    """
+    results = []
+    written = 0
+
+    async def one(query_id, query):
+        start = time.perf_counter()
+        with llm.track_usage() as usage, span("query", "query", query=query, id=query_id) as trace:
+            try:
+                answer, extra = await asyncio.wait_for(run(query), timeout)
+                result = {"id": query_id, "query": query, "status": "ok", "answer": answer}
+            except Exception as e:
+                extra = {}
+                result = {"id": query_id, "query": query, "status": "error",
+                          "error": f"{type(e).__name__}: {e}"}
+        result.update(extra, latency=round(time.perf_counter() - start, 3), **usage)
+        if tracer.enabled:
+            result["time"] = {k: round(v, 3) for k, v in tracer.breakdown(trace).items()}
+        return result
+
+    async def worker():
+        nonlocal written
+        for query_id, query in queries:
+            result = await one(query_id, query)
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            written += 1
+            if written % SYNC_EVERY == 0:
+                os.fsync(output.fileno())
+            results.append(result)
+            print(f"\r  {written} done, {sum(r['status'] != 'ok' for r in results)} errors",
+                  end="", file=sys.stderr, flush=True)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    print(file=sys.stderr)
+    return results
+
+
+def summarize(results: list[dict], wall: float) -> None:
+    if not results:
+        print("Nothing to do: every query already has a result.")
+        return
+    latencies = sorted(r["latency"] for r in results)
+    errors = sum(r["status"] != "ok" for r in results)
+    print(f"\n{len(results)} queries in {wall:.1f}s ({len(results) / wall:.1f}/s), {errors} errors")
+    print(f"  latency p50 {statistics.median(latencies):.2f}s, "
+          f"p95 {latencies[max(0, int(len(latencies) * 0.95) - 1)]:.2f}s")
+    usage = {key: sum(r[key] for r in results)
+             for key in ("requests", "prompt_tokens", "completion_tokens", "cached_tokens")}
+    print(f"  LLM requests {usage['requests']}, "
+          f"tokens {usage['prompt_tokens'] + usage['completion_tokens']}, "
+          f"{llm.cache_ratio(usage):.0%} of prompt tokens from the prompt cache")
+    for name, total in budget.totals.items():
+        print(f"  {name}: {total['calls']} charged calls, prompt {total['prompt_tokens']}, "
+              f"completion {total['completion_tokens']}, {total['refused']} refused over budget")
+    print(f"  ({llm.response_cache.summary()})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agent", required=True, choices=AGENTS)
+    parser.add_argument("--input", required=True, help="JSONL file with one query per line")
+    parser.add_argument("--output", required=True, help="results JSONL; also the resume checkpoint")
+    parser.add_argument("--query-field", default="query")
+    parser.add_argument("--id-field", default="id",
+                        help="field holding a stable query id (default: line number)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=300, help="per-query timeout in seconds")
+    parser.add_argument("--retry-errors", action="store_true",
+                        help="on resume, run queries that failed last time again")
+    parser.add_argument("--verbose", action="store_true", help="keep the agents' own printing")
+    parser.add_argument("--trace", help="write a Chrome trace of the run here")
+    parser.add_argument("--mock", action="store_true", help="run against the local mock server")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock LLM latency in seconds")
+    args = parser.parse_args()
+
+    server = None
+    if args.mock:
+        server = MockChatServer(latency=args.latency)
+        os.environ["OPENAI_BASE_URL"] = server.start()
+        os.environ["OPENAI_API_KEY"] = "mock"
+        llm.configure(base_url=os.environ["OPENAI_BASE_URL"], api_key="mock")
+
+    if args.trace:
+        tracer.enable()
+    run = make_runner(args.agent, load_agent(args.agent))
+    done = load_checkpoint(args.output, args.retry_errors)
+    if done:
+        print(f"Resuming: {len(done)} queries already have results in {args.output}")
+    queries = (
+        (query_id, query)
+        for query_id, query in read_queries(args.input, args.id_field, args.query_field)
+        if query_id not in done
+    )
+
+    start = time.perf_counter()
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with open(args.output, "a", encoding="utf-8") as output, quiet:
+        results = asyncio.run(run_batch(run, queries, output, args.concurrency, args.timeout))
+    summarize(results, time.perf_counter() - start)
+    if args.trace:
+        tracer.export_chrome(args.trace)
+        print(f"  Trace written to {args.trace}")
+
+    if server:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Benchmark the agent architectures against each other.
+
+    python -m common.bench --queries 50 --llm-latency 0.1 --tool-latency 0.05 --json bench.json
+
+Runs are reproducible: the mock LLM replays scripted replies
+(default_responder, or the rules in --script, see scripted_responder),
+every tool is replaced by a mock with fixed latency and a seeded failure
+rate, and the response cache and request coalescing are off so each
+round trip is real. Reports p50/p95/p99 wall time per query, LLM round
+trips, prompt/completion tokens and tool calls per architecture.
+
+With --cassette the LLM is the real API (--record) or a recording of it
+(replay, fully offline) instead of the mock server:
+
+    python -m common.bench --cassette bench.cassette --record
+    python -m common.bench --cassette bench.cassette --latency-scale 0.5
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+import contextlib
+import statistics
+
+from common import llm
+from common.batch import make_runner
+from common.loader import load_agent
+from common.mock_server import MockChatServer, scripted_responder, default_responder
+
+ARCHITECTURES = ["react", "plan-and-execute", "rewoo"]
+
+QUERIES = [
+    "What's the weather like in Tokyo?",
+    "Should I bring an umbrella in Kyoto tomorrow?",
+    "Compare the weather in Osaka and Fukuoka.",
+    "Is it a good day for a walk in Tokyo?",
+]
+
+
+class MockTools:
+    """
+    Swaps an agent's tools for mocks that sleep `latency` seconds and fail
+    with probability `failure_rate` (seeded), then call the real tool.
+    """
+    def __init__(self, latency: float, failure_rate: float, seed: int):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wrap(self, name: str, fn):
+        def tool(*args, **kwargs):
+            with self._lock:
+                self.calls += 1
+                fail = self._random.random() < self.failure_rate
+                self.failures += fail
+            time.sleep(self.latency)
+            if fail:
+                raise ConnectionError(f"mock failure in {name}")
+            return fn(*args, **kwargs)
+        return tool
+
+    @contextlib.contextmanager
+    def install(self, registry: dict):
+        # In place: dispatchers and workers hold a reference to this dict
+        real = dict(registry)
+        registry.update({name: self.wrap(name, fn) for name, fn in real.items()})
+        try:
+            yield self
+        finally:
+            registry.update(real)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return values[max(0, min(len(values) - 1, round(q / 100 * len(values)) - 1))]
+
+
+async def bench_architecture(name: str, queries: list[str], tools: MockTools, warmup: int) -> dict:
+    module = load_agent(name)
+    run = make_runner(name, module)
+    rows = []
+    with tools.install(module.available_tools):
+        for query in queries[:warmup]:
+            await run(query)
+        tools.calls = tools.failures = 0
+
+        for query in queries:
+            calls_before = tools.calls
+            start = time.perf_counter()
+            with llm.track_usage() as usage:
+                try:
+                    await run(query)
+                    error = False
+                except Exception:
+                    error = True
+            rows.append(dict(
+                usage,
+                wall=time.perf_counter() - start,
+                tool_calls=tools.calls - calls_before,
+                error=error,
+            ))
+
+    walls = sorted(row["wall"] for row in rows)
+    mean = lambda key: statistics.fmean(row[key] for row in rows)
+    return {
+        "queries": len(rows),
+        "errors": sum(row["error"] for row in rows),
+        "wall_s": {
+            "p50": percentile(walls, 50),
+            "p95": percentile(walls, 95),
+            "p99": percentile(walls, 99),
+            "mean": statistics.fmean(walls),
+        },
+        "llm_requests": mean("requests"),
+        "prompt_tokens": mean("prompt_tokens"),
+        "completion_tokens": mean("completion_tokens"),
+        "cached_ratio": llm.cache_ratio({
+            key: sum(row[key] for row in rows) for key in ("prompt_tokens", "cached_tokens")
+        }),
+        "tool_calls": mean("tool_calls"),
+        "tool_failures": tools.failures,
+    }
+
+
+def print_table(results: dict) -> None:
+    print(f"\n{'architecture':<18}{'p50':>8}{'p95':>8}{'p99':>8}{'LLM':>7}"
+          f"{'prompt':>9}{'cached':>8}{'compl.':>8}{'tools':>7}{'errors':>8}")
+    for name, r in results.items():
+        wall = r["wall_s"]
+        print(f"{name:<18}{wall['p50']:>7.2f}s{wall['p95']:>7.2f}s{wall['p99']:>7.2f}s"
+              f"{r['llm_requests']:>7.1f}{r['prompt_tokens']:>9.0f}{r['cached_ratio']:>8.0%}"
+              f"{r['completion_tokens']:>8.0f}"
+              f"{r['tool_calls']:>7.1f}{r['errors']:>8}")
+    print("  (LLM, tokens and tools are per-query means; cached: share of prompt tokens "
+          "served from the provider's prefix cache)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", nargs="+", default=ARCHITECTURES, choices=ARCHITECTURES)
+    parser.add_argument("--queries", type=int, default=20, help="measured queries per architecture")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0,
+                        help="share of LLM requests failing with 429 (retried)")
+    parser.add_argument("--tool-latency", type=float, default=0.05)
+    parser.add_argument("--tool-failure-rate", type=float, default=0.0)
+    parser.add_argument("--script", help="JSON list of scripted_responder rules")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results here for regression tracking")
+    parser.add_argument("--cassette", help="replay LLM traffic from this cassette instead of the mock")
+    parser.add_argument("--record", action="store_true",
+                        help="with --cassette: call the real API and record into the cassette")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="with --cassette: multiply recorded latencies by this")
+    parser.add_argument("--cache-min-tokens", type=int, default=1024,
+                        help="mock: shortest prompt prefix reported as cached")
+    args = parser.parse_args()
+
+    responder = default_responder
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            responder = scripted_responder(json.load(f))
+
+    server = None
+    if args.cassette:
+        llm.configure(cassette=args.cassette, cassette_mode="record" if args.record else "replay",
+                      replay_latency_scale=args.latency_scale, coalesce=False)
+    else:
+        server = MockChatServer(latency=args.llm_latency, responder=responder, chunk_delay=0,
+                                error_rate=args.llm_error_rate, retry_after=0.01, seed=args.seed,
+                                cache_min_tokens=args.cache_min_tokens)
+        os.environ["OPENAI_BASE_URL"] = server.start()
+        os.environ["OPENAI_API_KEY"] = "mock"
+        llm.configure(base_url=os.environ["OPENAI_BASE_URL"], api_key="mock", coalesce=False)
+    llm.response_cache.enabled = False
+
+    queries = [QUERIES[i % len(QUERIES)] for i in range(args.queries)]
+
+    async def bench_all():
+        results = {}
+        for name in args.agents:
+            tools = MockTools(args.tool_latency, args.tool_failure_rate, args.seed)
+            with contextlib.redirect_stdout(open(os.devnull, "w")):
+                results[name] = await bench_architecture(name, queries, tools, args.warmup)
+        return results
+
+    results = asyncio.run(bench_all())
+    if server:
+        server.stop()
+
+    print_table(results)
+    if args.json:
+        config = {k: v for k, v in vars(args).items() if k != "json"}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
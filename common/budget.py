@@ -0,0 +1,169 @@
+"""
+Token budgets.
+
+A TokenBudget caps the tokens spent inside a `with` block: a step, a
+query, a whole session. Every LLM call made inside it (common.llm, in
+any thread or task started from the block) is estimated locally first
+and refused with BudgetExceeded if it could not fit in what is left.
+Like the rate limiter, the estimate is reserved while the call is in
+flight (so parallel calls cannot all squeeze into the same remainder)
+and replaced by the usage the API reports. Budgets nest, a call has to
+fit in all of them.
+
+    with TokenBudget(20_000, "plan-and-execute") as budget:
+        answer = run_query(question)
+    print(budget.report())
+
+or, for a fresh budget per call (size from AGENT_TOKEN_BUDGET),
+
+    @budgeted("plan-and-execute")
+    def run_query(user_input): ...
+
+Agents that keep a ContextManager compact their history to
+budget.prompt_allowance() instead of being refused. Usage is also
+aggregated per budget name (one name per architecture) in `totals`.
+"""
+import os
+import inspect
+import functools
+import threading
+import contextvars
+
+from common.ratelimit import DEFAULT_COMPLETION_TOKENS, estimate_tokens
+from common.tracing import current_span
+
+_current = contextvars.ContextVar("token_budget", default=None)
+
+# Tokens per query for @budgeted entry points
+query_budget = int(os.getenv("AGENT_TOKEN_BUDGET", 50_000))
+
+# name -> {"calls", "prompt_tokens", "completion_tokens", "refused"}, charged to the
+# innermost budget's name only so nested budgets are not counted twice
+totals: dict[str, dict] = {}
+# One lock for all budgets: checking and reserving across a chain has to be atomic
+_lock = threading.Lock()
+
+
+class BudgetExceeded(RuntimeError):
+    """An LLM call would not fit in the remaining token budget."""
+
+
+class TokenBudget:
+    def __init__(self, max_tokens: int, name: str = "default"):
+        self.max_tokens = max_tokens
+        self.name = name
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.refused = 0
+        self.reserved = 0
+        self.parent: TokenBudget | None = None
+        self._token = None
+
+    @property
+    def used(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def remaining(self) -> int:
+        return self.max_tokens - self.used - self.reserved
+
+    def chain(self):
+        budget = self
+        while budget is not None:
+            yield budget
+            budget = budget.parent
+
+    def reserve(self, request: dict) -> int:
+        """
+        Reserve the estimated cost of `request` (prompt + completion cap)
+        and return it, or raise BudgetExceeded if it cannot fit.
+        """
+        estimate = estimate_tokens(request)
+        budgets = list(self.chain())
+        with _lock:
+            for budget in budgets:
+                if estimate > budget.remaining:
+                    budget._refuse()
+                    current_span().set(budget_refused=budget.name, estimated_tokens=estimate)
+                    raise BudgetExceeded(
+                        f"{budget.name}: call needs ~{estimate} tokens, "
+                        f"{max(budget.remaining, 0)} of {budget.max_tokens} left"
+                    )
+            for budget in budgets:
+                budget.reserved += estimate
+        return estimate
+
+    def release(self, reserved: int) -> None:
+        with _lock:
+            for budget in self.chain():
+                budget.reserved -= reserved
+
+    def charge(self, prompt_tokens: int, completion_tokens: int) -> None:
+        with _lock:
+            for budget in self.chain():
+                budget.calls += 1
+                budget.prompt_tokens += prompt_tokens
+                budget.completion_tokens += completion_tokens
+            total = _total(self.name)
+            total["calls"] += 1
+            total["prompt_tokens"] += prompt_tokens
+            total["completion_tokens"] += completion_tokens
+
+    def prompt_allowance(self, completion_tokens: int = DEFAULT_COMPLETION_TOKENS,
+                         tools: list | None = None) -> int:
+        """Most prompt tokens a call reserving `completion_tokens` can still send."""
+        request = {"messages": [], "tools": tools, "max_tokens": completion_tokens}
+        overhead = estimate_tokens(request)
+        return min(budget.remaining for budget in self.chain()) - overhead
+
+    def report(self) -> str:
+        return (
+            f"{self.name}: {self.used} of {self.max_tokens} tokens in {self.calls} calls "
+            f"(prompt {self.prompt_tokens}, completion {self.completion_tokens}, "
+            f"{self.refused} refused)"
+        )
+
+    def _refuse(self) -> None:
+        # Called with _lock held
+        self.refused += 1
+        _total(self.name)["refused"] += 1
+
+    def __enter__(self):
+        self.parent = _current.get()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+        current_span().set(tokens=self.used, token_budget=self.max_tokens)
+        return False
+
+
+def _total(name: str) -> dict:
+    return totals.setdefault(name, dict.fromkeys(
+        ("calls", "prompt_tokens", "completion_tokens", "refused"), 0))
+
+
+def current_budget() -> TokenBudget | None:
+    """The innermost budget of the current thread / task, if any."""
+    return _current.get()
+
+
+def budgeted(name: str, max_tokens: int | None = None):
+    """Run every call of the decorated function in a fresh TokenBudget."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with TokenBudget(max_tokens or query_budget, name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with TokenBudget(max_tokens or query_budget, name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
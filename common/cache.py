@@ -0,0 +1,176 @@
+"""
+Exact-match cache for chat completion responses.
+
+Two tiers: an in-memory LRU in front of an optional SQLite file, both
+with TTL. The key is a hash of the canonical JSON of the request, so the
+same prompt (model, messages, tools, response_format, ...) sent again in
+this or a later run is answered without a round trip.
+"""
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Requests using any of these are sampled, not reproducible: never cached
+NON_DETERMINISTIC = {
+    "temperature": lambda v: v is not None and v > 0,
+    "top_p": lambda v: v is not None and v < 1,
+    "n": lambda v: v is not None and v > 1,
+    "stream": bool,
+}
+
+
+def _plain(obj):
+    # Assistant messages are appended to history as SDK objects
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(exclude_none=True)
+    raise TypeError(f"cannot hash {type(obj).__name__}")
+
+
+def cache_key(**request) -> str:
+    canonical = json.dumps(
+        request, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=_plain
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def is_cacheable(request: dict) -> bool:
+    return not any(
+        check(request[name]) for name, check in NON_DETERMINISTIC.items() if name in request
+    )
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl: float = 24 * 3600,
+        path: str | None = None,
+        max_disk_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.enabled = True
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "evictions": 0}
+        self._memory: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._db.commit()
+
+    # ---------------- public API ----------------
+
+    def get_or_create(self, create, *, cache: bool = True, **request):
+        """Return a cached response for `request`, or call `create(**request)` and store it."""
+        if not (cache and self.enabled and is_cacheable(request)):
+            self.stats["bypassed"] += 1
+            return create(**request)
+
+        key = cache_key(**request)
+        response = self.get(key)
+        if response is None:
+            response = create(**request)
+            self.put(key, response)
+        return response
+
+    async def aget_or_create(self, create, *, cache: bool = True, **request):
+        if not (cache and self.enabled and is_cacheable(request)):
+            self.stats["bypassed"] += 1
+            return await create(**request)
+
+        key = cache_key(**request)
+        response = self.get(key)
+        if response is None:
+            response = await create(**request)
+            self.put(key, response)
+        return response
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[1]
+            if entry:
+                del self._memory[key]
+
+            if self._db:
+                row = self._db.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] < self.ttl:
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    response = _load(row[0])
+                    self._remember(key, row[1], response)
+                    self.stats["disk_hits"] += 1
+                    return response
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, response) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, response)
+            if self._db:
+                value = response.model_dump_json()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, value, now, now, len(value)),
+                )
+                self._evict_disk(now)
+                self._db.commit()
+
+    # ---------------- internals ----------------
+
+    def _remember(self, key: str, created: float, response) -> None:
+        self._memory[key] = (created, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _evict_disk(self, now: float) -> None:
+        expired = self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        self.stats["evictions"] += expired.rowcount
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_disk_bytes:
+            return
+        # Drop least recently used rows until the file is back under budget
+        excess = total - self.max_disk_bytes
+        for key, size in self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ).fetchall():
+            if excess <= 0:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.stats["evictions"] += 1
+            excess -= size
+
+    def summary(self) -> str:
+        s = self.stats
+        hits = s["memory_hits"] + s["disk_hits"]
+        lookups = hits + s["misses"]
+        rate = hits / lookups if lookups else 0.0
+        return (
+            f"cache hits {hits}/{lookups} ({rate:.0%}, memory {s['memory_hits']}, "
+            f"disk {s['disk_hits']}), bypassed {s['bypassed']}"
+        )
+
+
+def _load(value: str):
+    from openai.types.chat import ChatCompletion
+    return ChatCompletion.model_validate_json(value)
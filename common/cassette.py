@@ -0,0 +1,176 @@
+"""
+Record/replay of LLM HTTP traffic.
+
+In record mode every request sent by the shared clients in common.llm is
+passed through to the API and the response (status, headers, body,
+latency) is stored in a cassette: a single SQLite file, zlib-compressed
+bodies, indexed by a hash of the request. In replay mode the cassette
+answers instead of the network, after the recorded latency times
+`latency_scale` (0 = instant), so agent runs and benchmarks repeat
+exactly and offline.
+
+    LLM_CASSETTE=run.cassette LLM_CASSETTE_MODE=record python "2. Plan-and-Execute/2.1 plan-and-execute.py" "..."
+    LLM_CASSETTE=run.cassette LLM_CASSETTE_MODE=replay python "2. Plan-and-Execute/2.1 plan-and-execute.py" "..."
+
+Streamed responses are stored as their raw event stream and replayed in
+one piece.
+"""
+import json
+import time
+import zlib
+import sqlite3
+import asyncio
+import hashlib
+import argparse
+import threading
+
+import httpx
+
+MODES = ("record", "replay")
+
+# Describe the recorded body, not how it travelled
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "date"}
+
+
+def request_key(request: httpx.Request) -> str:
+    body = request.content
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    return hashlib.sha256(request.method.encode() + request.url.path.encode() + body).hexdigest()
+
+
+class Cassette:
+    """
+    Identical requests are kept in order: the n-th replay of a request gets
+    the n-th recording of it (the last one repeats), so a run that sent the
+    same prompt twice and got different answers replays the same way.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.stats = {"recorded": 0, "replayed": 0, "missed": 0}
+        self._seen: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS interactions ("
+            " key TEXT NOT NULL, seq INTEGER NOT NULL, latency REAL NOT NULL,"
+            " status INTEGER NOT NULL, headers TEXT NOT NULL, body BLOB NOT NULL,"
+            " PRIMARY KEY (key, seq))"
+        )
+        self._db.commit()
+
+    def record(self, key: str, latency: float, status: int, headers: dict, body: bytes) -> None:
+        with self._lock:
+            seq = self._db.execute(
+                "SELECT COUNT(*) FROM interactions WHERE key = ?", (key,)
+            ).fetchone()[0]
+            self._db.execute(
+                "INSERT INTO interactions VALUES (?, ?, ?, ?, ?, ?)",
+                (key, seq, latency, status, json.dumps(headers), zlib.compress(body, 9)),
+            )
+            self._db.commit()
+            self.stats["recorded"] += 1
+
+    def replay(self, key: str):
+        """(latency, status, headers, body) of the next recording of `key`, or None."""
+        with self._lock:
+            seq = self._seen.get(key, 0)
+            row = self._db.execute(
+                "SELECT latency, status, headers, body FROM interactions"
+                " WHERE key = ? AND seq <= ? ORDER BY seq DESC LIMIT 1",
+                (key, seq),
+            ).fetchone()
+            if row is None:
+                self.stats["missed"] += 1
+                return None
+            self._seen[key] = seq + 1
+            self.stats["replayed"] += 1
+        latency, status, headers, body = row
+        return latency, status, json.loads(headers), zlib.decompress(body)
+
+    def summary(self) -> str:
+        count, size = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM interactions"
+        ).fetchone()
+        return f"{count} interactions, {size / 1024:.1f} KiB compressed"
+
+
+def _miss(request: httpx.Request) -> httpx.Response:
+    # A 4xx is not retried, so a missing recording fails fast
+    return httpx.Response(404, json={"error": {
+        "message": f"no recording in cassette for {request.method} {request.url.path}",
+        "type": "cassette_miss",
+    }})
+
+
+def _stored_headers(response: httpx.Response) -> dict:
+    return {k: v for k, v in response.headers.items() if k.lower() not in _DROP_HEADERS}
+
+
+class CassetteTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette, mode: str, inner: httpx.BaseTransport,
+                 latency_scale: float = 1.0):
+        self.cassette = cassette
+        self.mode = mode
+        self.inner = inner
+        self.latency_scale = latency_scale
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        if self.mode == "replay":
+            recording = self.cassette.replay(key)
+            if recording is None:
+                return _miss(request)
+            latency, status, headers, body = recording
+            time.sleep(latency * self.latency_scale)
+            return httpx.Response(status, headers=headers, content=body)
+
+        start = time.perf_counter()
+        response = self.inner.handle_request(request)
+        body = response.read()
+        response.close()
+        headers = _stored_headers(response)
+        self.cassette.record(key, time.perf_counter() - start, response.status_code, headers, body)
+        return httpx.Response(response.status_code, headers=headers, content=body)
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, mode: str, inner: httpx.AsyncBaseTransport,
+                 latency_scale: float = 1.0):
+        self.cassette = cassette
+        self.mode = mode
+        self.inner = inner
+        self.latency_scale = latency_scale
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        if self.mode == "replay":
+            recording = self.cassette.replay(key)
+            if recording is None:
+                return _miss(request)
+            latency, status, headers, body = recording
+            await asyncio.sleep(latency * self.latency_scale)
+            return httpx.Response(status, headers=headers, content=body)
+
+        start = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        body = await response.aread()
+        await response.aclose()
+        headers = _stored_headers(response)
+        self.cassette.record(key, time.perf_counter() - start, response.status_code, headers, body)
+        return httpx.Response(response.status_code, headers=headers, content=body)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show what a cassette contains")
+    parser.add_argument("path")
+    args = parser.parse_args()
+    print(f"{args.path}: {Cassette(args.path).summary()}")
@@ -0,0 +1,170 @@
+"""
+Conversation history compaction.
+
+The agents keep the full `messages` list and re-send it on every call, so
+prompt size (cost and latency) grows with every turn. ContextManager.build()
+returns the list to actually send, within a token budget (optionally
+tightened per call, see common/budget.py):
+
+- the system prompt and the most recent messages are kept verbatim
+- tool outputs outside the recent window are truncated
+- when still over budget, older messages are folded into a running
+  summary; each message is summarized once, the summary is updated
+  incrementally as more history falls out of the window
+
+Async agents use abuild(), which awaits the summarizer instead of
+blocking the event loop (and every other session on it) while it runs.
+"""
+import asyncio
+
+from common.tokens import as_dict, count_message_tokens
+
+SUMMARIZER_PROMPT = """\
+You maintain a running summary of a conversation between a user and an
+assistant that uses tools. Update the summary with the new messages.
+Keep facts, tool results, decisions and open questions; drop chit-chat.
+Reply with the updated summary only."""
+
+
+def render(messages: list) -> str:
+    lines = []
+    for message in messages:
+        message = as_dict(message)
+        content = message.get("content") or ""
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call["function"]
+            content += f" [calls {function['name']}({function['arguments']})]"
+        lines.append(f"{message['role']}: {content.strip()}")
+    return "\n".join(lines)
+
+
+def _summarizer_messages(summary: str, new_messages: list) -> list:
+    return [
+        {"role": "system", "content": SUMMARIZER_PROMPT},
+        {
+            "role": "user",
+            "content": (
+                f"Current summary:\n{summary or '(empty)'}\n\n"
+                f"New messages:\n{render(new_messages)}"
+            ),
+        },
+    ]
+
+
+def llm_summarizer(summary: str, new_messages: list) -> str:
+    from common.llm import chat_completion
+
+    response = chat_completion(model="gpt-4o-mini", messages=_summarizer_messages(summary, new_messages))
+    return response.choices[0].message.content
+
+
+async def allm_summarizer(summary: str, new_messages: list) -> str:
+    from common.llm import achat_completion
+
+    response = await achat_completion(model="gpt-4o-mini", messages=_summarizer_messages(summary, new_messages))
+    return response.choices[0].message.content
+
+
+class ContextManager:
+    def __init__(
+        self,
+        max_tokens: int = 3000,
+        keep_recent: int = 6,
+        max_tool_chars: int = 300,
+        summarizer=llm_summarizer,
+        asummarizer=None,
+    ):
+        if keep_recent < 0:
+            raise ValueError(f"keep_recent must be 0 or more, got {keep_recent}")
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.max_tool_chars = max_tool_chars
+        self.summarizer = summarizer
+        # abuild(): without an async summarizer, the sync one runs on a worker thread
+        if asummarizer is None and summarizer is llm_summarizer:
+            asummarizer = allm_summarizer
+        self.asummarizer = asummarizer
+        self.summary = ""
+        self._summarized_upto = 0   # messages[:_summarized_upto] are in the summary
+        self.last_full_tokens = 0
+        self.last_sent_tokens = 0
+        self.total_saved = 0
+
+    def build(self, messages: list, max_tokens: int | None = None) -> list:
+        """
+        The messages to send. `max_tokens` tightens the budget for this
+        call only (e.g. to what is left of a TokenBudget).
+        """
+        compacted, fold = self._compact(messages, max_tokens)
+        if fold:
+            start, boundary = fold
+            summary = self.summarizer(self.summary, messages[start:boundary])
+            compacted = self._fold(messages, boundary, summary)
+        return self._account(messages, compacted)
+
+    async def abuild(self, messages: list, max_tokens: int | None = None) -> list:
+        """build() for coroutines: the summarizer is awaited, not run on the event loop."""
+        compacted, fold = self._compact(messages, max_tokens)
+        if fold:
+            start, boundary = fold
+            if self.asummarizer is not None:
+                summary = await self.asummarizer(self.summary, messages[start:boundary])
+            else:
+                summary = await asyncio.to_thread(self.summarizer, self.summary, messages[start:boundary])
+            compacted = self._fold(messages, boundary, summary)
+        return self._account(messages, compacted)
+
+    def _compact(self, messages: list, max_tokens: int | None) -> tuple[list, tuple[int, int] | None]:
+        """(compacted messages, (start, boundary) of the messages to summarize if still over budget)."""
+        max_tokens = self.max_tokens if max_tokens is None else min(max_tokens, self.max_tokens)
+        head = 1 if messages and as_dict(messages[0])["role"] == "system" else 0
+        system = messages[:head]
+        start = max(self._summarized_upto, head)
+        boundary = self._recent_boundary(messages, start)
+
+        middle = [self._shrink(m) for m in messages[start:boundary]]
+        recent = messages[boundary:]
+        compacted = system + self._summary_messages() + middle + recent
+
+        if count_message_tokens(compacted) > max_tokens and boundary > start:
+            return compacted, (start, boundary)
+        return compacted, None
+
+    def _fold(self, messages: list, boundary: int, summary: str) -> list:
+        self.summary = summary
+        self._summarized_upto = boundary
+        head = 1 if messages and as_dict(messages[0])["role"] == "system" else 0
+        return messages[:head] + self._summary_messages() + messages[boundary:]
+
+    def _account(self, messages: list, compacted: list) -> list:
+        self.last_full_tokens = count_message_tokens(messages)
+        self.last_sent_tokens = count_message_tokens(compacted)
+        self.total_saved += self.last_full_tokens - self.last_sent_tokens
+        return compacted
+
+    def report(self) -> str:
+        return (
+            f"context: sent {self.last_sent_tokens} of {self.last_full_tokens} tokens "
+            f"(saved {self.last_full_tokens - self.last_sent_tokens}, {self.total_saved} this session)"
+        )
+
+    def _recent_boundary(self, messages: list, start: int) -> int:
+        boundary = max(len(messages) - self.keep_recent, start)
+        # Never separate tool results from the assistant message that requested them
+        # (keep_recent=0: boundary is the end, nothing to separate)
+        while start < boundary < len(messages) and as_dict(messages[boundary])["role"] == "tool":
+            boundary -= 1
+        return boundary
+
+    def _summary_messages(self) -> list:
+        if not self.summary:
+            return []
+        return [{"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"}]
+
+    def _shrink(self, message):
+        message = as_dict(message)
+        content = message.get("content") or ""
+        if message["role"] != "tool" or len(content) <= self.max_tool_chars:
+            return message
+        cut = len(content) - self.max_tool_chars
+        return {**message, "content": f"{content[:self.max_tool_chars]}... [{cut} chars truncated]"}
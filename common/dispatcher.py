@@ -0,0 +1,187 @@
+"""Concurrent dispatch of the tool calls in a single assistant turn."""
+import json
+import time
+import asyncio
+import contextvars
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from common.tracing import span
+from common.resilience import CircuitOpen, BulkheadFull, configure_tool, new_scope, tool_guard
+from common.tool_registry import ToolRegistry, ToolArgumentError
+
+
+@dataclass
+class ToolResult:
+    tool_call_id: str
+    name: str
+    args: dict | None
+    content: str
+
+    def message(self) -> dict:
+        return {
+            "role": "tool",
+            "tool_call_id": self.tool_call_id,
+            "content": self.content,
+        }
+
+
+class ToolDispatcher:
+    """
+    Runs the tool calls of one assistant turn concurrently on a shared
+    worker pool; results always come back in the order the model issued
+    the calls.
+
+    Every call of a known tool goes through that tool's guard
+    (common/resilience.py): a circuit breaker that fails fast while the
+    tool keeps erroring, and a bulkhead capping how many of its calls run
+    at once. Guards live in the dispatcher's `scope`, its own unless
+    named, so tools of the same name in another agent never share them;
+    `tool_limits` sets bulkhead sizes in that scope only (e.g.
+    {"web_search": 2}). A call waiting for its bulkhead does not hold a
+    pool thread, so a slow tool cannot starve the others.
+
+    With a ToolRegistry as `available_tools`, arguments are validated
+    against the tool's schema first; invalid calls never reach the guard
+    or the pool.
+    """
+    def __init__(
+        self,
+        available_tools: dict,
+        max_workers: int = 8,
+        tool_limits: dict[str, int] | None = None,
+        scope: str | None = None,
+    ):
+        self.available_tools = available_tools
+        self.scope = scope or new_scope("dispatcher")
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        for name, limit in (tool_limits or {}).items():
+            configure_tool(name, self.scope, max_concurrent=limit)
+
+    def submit(self, tool_call) -> Future:
+        """Start one tool call now (e.g. as soon as it is complete in a stream)."""
+        # Run in the caller's context so tool spans nest under its trace
+        context = contextvars.copy_context()
+        guard = self._guard(tool_call)
+        if guard is None:
+            return self._pool.submit(context.run, self._run, tool_call)
+
+        queued = time.perf_counter()
+        result = Future()
+        try:
+            guard.check()
+            granted = guard.bulkhead.slot()
+        except (CircuitOpen, BulkheadFull) as e:
+            result.set_result(self._rejected(tool_call, e))
+            return result
+
+        def start(_):
+            try:
+                guard.admit()
+            except CircuitOpen as e:
+                result.set_result(self._rejected(tool_call, e))
+                return
+            call = self._submit_admitted(context, tool_call, queued, guard)
+            call.add_done_callback(lambda done: result.set_result(done.result()))
+
+        granted.add_done_callback(start)
+        return result
+
+    def dispatch(self, tool_calls) -> list[ToolResult]:
+        if len(tool_calls) == 1:
+            return [self._call(tool_calls[0])]
+        futures = [self.submit(tool_call) for tool_call in tool_calls]
+        return [future.result() for future in futures]
+
+    async def adispatch(self, tool_calls) -> list[ToolResult]:
+        """Same as dispatch(), but awaits the worker pool instead of blocking the event loop."""
+        return await asyncio.gather(*(self._acall(tool_call) for tool_call in tool_calls))
+
+    def _call(self, tool_call) -> ToolResult:
+        """One call in the caller's thread."""
+        guard = self._guard(tool_call)
+        if guard is None:
+            return self._run(tool_call)
+        queued = time.perf_counter()
+        try:
+            guard.check()
+            guard.bulkhead.acquire()
+            guard.admit()
+        except (CircuitOpen, BulkheadFull) as e:
+            return self._rejected(tool_call, e)
+        return self._run(tool_call, queued, guard)
+
+    async def _acall(self, tool_call) -> ToolResult:
+        guard = self._guard(tool_call)
+        context = contextvars.copy_context()
+        if guard is None:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._pool, context.run, self._run, tool_call
+            )
+        queued = time.perf_counter()
+        try:
+            await guard.aenter()
+        except (CircuitOpen, BulkheadFull) as e:
+            return self._rejected(tool_call, e)
+        return await asyncio.wrap_future(self._submit_admitted(context, tool_call, queued, guard))
+
+    def _submit_admitted(self, context, tool_call, queued: float, guard) -> Future:
+        call = self._pool.submit(context.run, self._run, tool_call, queued, guard)
+        # Cancelled before it started (caller gave up): the slot was never used
+        call.add_done_callback(lambda done: done.cancelled() and guard.abandon())
+        return call
+
+    def _guard(self, tool_call):
+        """The tool's guard, or None for calls that fail before reaching the tool."""
+        if tool_call.function.name not in self.available_tools:
+            return None
+        try:
+            self._arguments(tool_call)
+        except (json.JSONDecodeError, ToolArgumentError):
+            return None
+        return tool_guard(tool_call.function.name, self.scope)
+
+    def _arguments(self, tool_call) -> dict:
+        args = json.loads(tool_call.function.arguments or "{}")
+        if isinstance(self.available_tools, ToolRegistry):
+            self.available_tools.validate(tool_call.function.name, args)
+        return args
+
+    def _rejected(self, tool_call, error: Exception) -> ToolResult:
+        name = tool_call.function.name
+        with span(f"tool:{name}", "tool", tool=name, rejected=type(error).__name__):
+            return ToolResult(tool_call.id, name, None, f"Error: {error}")
+
+    def _run(self, tool_call, queued: float | None = None, guard=None) -> ToolResult:
+        """Run one call; with `guard`, it has been admitted and the outcome goes to the guard."""
+        name = tool_call.function.name
+        with span(f"tool:{name}", "tool", tool=name) as trace:
+            if queued is not None:
+                trace.set(queued=time.perf_counter() - queued)
+            try:
+                args = json.loads(tool_call.function.arguments or "{}")
+            except json.JSONDecodeError as e:
+                trace.set(error="invalid arguments")
+                return ToolResult(tool_call.id, name, None, f"Error: invalid JSON arguments: {e}")
+
+            if name not in self.available_tools:
+                trace.set(error="unknown tool")
+                return ToolResult(tool_call.id, name, args, f"Error: unknown tool '{name}'")
+
+            if isinstance(self.available_tools, ToolRegistry):
+                try:
+                    self.available_tools.validate(name, args)
+                except ToolArgumentError as e:
+                    trace.set(error="invalid arguments")
+                    return ToolResult(tool_call.id, name, args, f"Error: {e}")
+
+            tool = self.available_tools[name]
+            try:
+                content = str(guard.run_admitted(tool, **args) if guard else tool(**args))
+            except Exception as e:
+                content = f"Error: {e}"
+                trace.set(error=f"{type(e).__name__}: {e}")
+            return ToolResult(tool_call.id, name, args, content)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown()
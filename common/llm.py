@@ -0,0 +1,393 @@
+"""
+Shared LLM clients.
+
+Every request takes the same path: response cache -> coalescing of
+identical in-flight requests -> token budget (common/budget.py) ->
+client-side rate limiter -> pooled HTTP client, retrying 429/5xx and
+connection errors with jittered backoff.
+"""
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+from common.budget import current_budget
+from common.cache import ResponseCache, cache_key, is_cacheable
+from common.ratelimit import RateLimiter, estimate_tokens
+from common.retry import is_retryable, retry_after, backoff_delay
+from common.tracing import span, current_span
+
+# Set LLM_CACHE_PATH to a SQLite file to keep responses across runs
+response_cache = ResponseCache(path=os.getenv("LLM_CACHE_PATH"))
+
+# Set LLM_RPM / LLM_TPM to stay under the account's rate limits
+limiter = RateLimiter(
+    requests_per_minute=float(os.getenv("LLM_RPM", 0)) or None,
+    tokens_per_minute=float(os.getenv("LLM_TPM", 0)) or None,
+)
+
+# Set LLM_CASSETTE to a file and LLM_CASSETTE_MODE to record or replay to
+# capture / serve all traffic offline (see common/cassette.py)
+cassette_options = {
+    "path": os.getenv("LLM_CASSETTE"),
+    "mode": os.getenv("LLM_CASSETTE_MODE", "replay"),
+    "latency_scale": float(os.getenv("LLM_REPLAY_LATENCY_SCALE", 1)),
+}
+cassette = None
+
+max_retries = 5
+coalesce = True
+
+# Round trips that actually reached the API (cache hits and coalesced
+# requests excluded, retries included) and the tokens they used
+# cached_tokens: prompt tokens the provider served from its prompt (prefix) cache
+stats = {"requests": 0, "retries": 0, "coalesced": 0, "prompt_tokens": 0, "completion_tokens": 0,
+         "cached_tokens": 0}
+
+_client = None
+_async_client = None
+_client_options: dict = {}
+_in_flight: dict[str, Future] = {}
+_in_flight_lock = threading.Lock()
+_ain_flight: dict[str, asyncio.Task] = {}
+_usage = contextvars.ContextVar("llm_usage", default=None)
+
+
+def configure(**options) -> None:
+    """
+    Set options (base_url, api_key, max_connections, ...) for the shared
+    clients. Must be called before the first request to take effect.
+    Also accepts requests_per_minute / tokens_per_minute for the rate
+    limiter, max_retries, coalesce=False to send every request, and
+    cassette / cassette_mode / replay_latency_scale for record/replay.
+    """
+    global _client, _async_client, limiter, max_retries, coalesce
+    limits = {
+        name: options.pop(name)
+        for name in ("requests_per_minute", "tokens_per_minute")
+        if name in options
+    }
+    if limits:
+        limiter = RateLimiter(**limits)
+    max_retries = options.pop("max_retries", max_retries)
+    coalesce = options.pop("coalesce", coalesce)
+    for name, key in (("cassette", "path"), ("cassette_mode", "mode"),
+                      ("replay_latency_scale", "latency_scale")):
+        if name in options:
+            cassette_options[key] = options.pop(name)
+    _client_options.update(options)
+    _client = None
+    _async_client = None
+
+
+def _client_settings() -> tuple[int, dict]:
+    import httpx
+
+    options = dict(_client_options)
+    max_connections = options.pop("max_connections", 32)
+    replaying = cassette_options["path"] and cassette_options["mode"] == "replay"
+    # Replays never reach the API, so no key is needed
+    options.setdefault("api_key", os.getenv("OPENAI_API_KEY") or ("replay" if replaying else None))
+    options.setdefault("base_url", os.getenv("OPENAI_BASE_URL"))
+    # Retries are done here (with the rate limiter), not inside the SDK
+    options["max_retries"] = 0
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=30,
+    )
+    options["timeout"] = httpx.Timeout(60.0, connect=5.0)
+    return max_connections, dict(options, limits=limits)
+
+
+def _bounded_transport(max_in_flight: int, **kwargs):
+    """
+    httpx transport that queues requests on a semaphore before they reach
+    the connection pool. httpcore rescans every waiting request against
+    every connection on each state change, so CPU per request grows with
+    (waiting x connections): keep the queue outside the pool and the pool
+    itself modest (a few dozen connections).
+    """
+    import httpx
+
+    class BoundedTransport(httpx.AsyncHTTPTransport):
+        def __init__(self):
+            super().__init__(**kwargs)
+            self._slots = asyncio.Semaphore(max_in_flight)
+
+        async def handle_async_request(self, request):
+            async with self._slots:
+                return await super().handle_async_request(request)
+
+    return BoundedTransport()
+
+
+def _with_cassette(transport, asynchronous: bool):
+    """Wrap `transport` for record/replay when a cassette is configured."""
+    global cassette
+    if not cassette_options["path"]:
+        return transport
+
+    from common.cassette import MODES, Cassette, CassetteTransport, AsyncCassetteTransport
+
+    if cassette_options["mode"] not in MODES:
+        raise ValueError(f"cassette mode must be one of {MODES}, got {cassette_options['mode']!r}")
+    if cassette is None or cassette.path != cassette_options["path"]:
+        cassette = Cassette(cassette_options["path"])
+    wrapper = AsyncCassetteTransport if asynchronous else CassetteTransport
+    return wrapper(cassette, cassette_options["mode"], transport, cassette_options["latency_scale"])
+
+
+def get_client():
+    """One pooled, keep-alive OpenAI client per process for the sync agents."""
+    global _client
+    if _client is None:
+        import httpx
+        from openai import OpenAI
+
+        _, options = _client_settings()
+        http_client = httpx.Client(
+            transport=_with_cassette(httpx.HTTPTransport(limits=options.pop("limits")), False),
+            timeout=options.pop("timeout"),
+        )
+        _client = OpenAI(http_client=http_client, **options)
+    return _client
+
+
+def get_async_client():
+    """
+    One AsyncOpenAI instance per process, backed by a single pooled
+    httpx.AsyncClient so every concurrent session reuses keep-alive
+    connections instead of opening its own.
+    """
+    global _async_client
+    if _async_client is None:
+        import httpx
+        from openai import AsyncOpenAI
+
+        max_connections, options = _client_settings()
+        http_client = httpx.AsyncClient(
+            transport=_with_cassette(
+                _bounded_transport(max_connections, limits=options.pop("limits")), True
+            ),
+            timeout=options.pop("timeout"),
+        )
+        _async_client = AsyncOpenAI(http_client=http_client, **options)
+    return _async_client
+
+
+# ============================================================
+# Request pipeline
+# ============================================================
+
+@contextmanager
+def track_usage():
+    """
+    Count the round trips and tokens of the requests made inside the block.
+    The counters follow the current thread / asyncio task (and threads
+    started with asyncio.to_thread), so concurrent callers each get their own.
+    """
+    usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def _count_request() -> None:
+    stats["requests"] += 1
+    usage = _usage.get()
+    if usage is not None:
+        usage["requests"] += 1
+
+
+def record_usage(reported) -> None:
+    """
+    Add a response's reported usage to the process stats, the current
+    track_usage() block and the current token budget.
+    """
+    if not reported:
+        return
+    cached = cached_tokens(reported)
+    stats["prompt_tokens"] += reported.prompt_tokens
+    stats["completion_tokens"] += reported.completion_tokens
+    stats["cached_tokens"] += cached
+    usage = _usage.get()
+    if usage is not None:
+        usage["prompt_tokens"] += reported.prompt_tokens
+        usage["completion_tokens"] += reported.completion_tokens
+        usage["cached_tokens"] += cached
+    budget = current_budget()
+    if budget is not None:
+        budget.charge(reported.prompt_tokens, reported.completion_tokens)
+
+
+def cached_tokens(reported) -> int:
+    """Prompt tokens served from the provider's prefix cache (0 if not reported)."""
+    details = getattr(reported, "prompt_tokens_details", None)
+    return (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+
+def cache_ratio(usage: dict | None = None) -> float:
+    """Share of prompt tokens that were cache hits, process-wide or for a track_usage() dict."""
+    usage = usage or stats
+    return usage["cached_tokens"] / usage["prompt_tokens"] if usage["prompt_tokens"] else 0.0
+
+
+def _reserve_budget(request: dict, trace):
+    """Refuse the request if it cannot fit in the current token budget."""
+    budget = current_budget()
+    if budget is None:
+        return None, 0
+    reserved = budget.reserve(request)
+    trace.set(estimated_tokens=reserved, budget_remaining=budget.remaining)
+    return budget, reserved
+
+
+def _settle(tokens: int, response, trace, attempt: int) -> None:
+    reported = getattr(response, "usage", None)
+    limiter.settle(tokens, reported.total_tokens if reported else tokens)
+    # Streams report their usage in the last chunk (streaming.py records it)
+    record_usage(reported)
+    trace.set(cache_hit=False, retries=attempt)
+    if reported:
+        trace.set(prompt_tokens=reported.prompt_tokens, completion_tokens=reported.completion_tokens,
+                  cached_tokens=cached_tokens(reported))
+
+
+def _send(request: dict, trace=None):
+    """
+    Rate limit, then call the API, retrying transient failures.
+    Retry count and tokens go on `trace` (default: the current span).
+    """
+    trace = trace or current_span()
+    budget, reserved = _reserve_budget(request, trace)
+    tokens = reserved or estimate_tokens(request)
+    try:
+        for attempt in range(max_retries + 1):
+            limiter.acquire(tokens)
+            _count_request()
+            try:
+                response = get_client().chat.completions.create(**request)
+            except Exception as e:
+                limiter.settle(tokens, 0)
+                if attempt == max_retries or not is_retryable(e):
+                    raise
+                stats["retries"] += 1
+                delay = backoff_delay(attempt, server_delay=retry_after(e))
+                with span("backoff", "retry", attempt=attempt + 1, delay=delay, error=type(e).__name__):
+                    time.sleep(delay)
+            else:
+                _settle(tokens, response, trace, attempt)
+                return response
+    finally:
+        if budget:
+            budget.release(reserved)
+
+
+async def _asend(request: dict, trace=None):
+    trace = trace or current_span()
+    budget, reserved = _reserve_budget(request, trace)
+    tokens = reserved or estimate_tokens(request)
+    try:
+        for attempt in range(max_retries + 1):
+            await limiter.aacquire(tokens)
+            _count_request()
+            try:
+                response = await get_async_client().chat.completions.create(**request)
+            except Exception as e:
+                limiter.settle(tokens, 0)
+                if attempt == max_retries or not is_retryable(e):
+                    raise
+                stats["retries"] += 1
+                delay = backoff_delay(attempt, server_delay=retry_after(e))
+                with span("backoff", "retry", attempt=attempt + 1, delay=delay, error=type(e).__name__):
+                    await asyncio.sleep(delay)
+            else:
+                _settle(tokens, response, trace, attempt)
+                return response
+    finally:
+        if budget:
+            budget.release(reserved)
+
+
+def _create(**request):
+    """
+    Identical deterministic requests already in flight share one round
+    trip: the first caller sends it, the others wait for its result.
+    """
+    if not (coalesce and is_cacheable(request)):
+        return _send(request)
+
+    key = cache_key(**request)
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+    if not leader:
+        stats["coalesced"] += 1
+        current_span().set(cache_hit=False, coalesced=True)
+        return future.result()
+
+    try:
+        response = _send(request)
+        future.set_result(response)
+        return response
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+
+
+async def _acreate(**request):
+    if not (coalesce and is_cacheable(request)):
+        return await _asend(request)
+
+    key = cache_key(**request)
+    task = _ain_flight.get(key)
+    if task is None:
+        task = _ain_flight[key] = asyncio.ensure_future(_asend(request))
+        task.add_done_callback(lambda _: _ain_flight.pop(key, None))
+    else:
+        stats["coalesced"] += 1
+        current_span().set(cache_hit=False, coalesced=True)
+    # shield: one caller being cancelled must not cancel the shared request
+    return await asyncio.shield(task)
+
+
+def chat_completion(**request):
+    """
+    chat.completions.create through the shared pipeline.
+    Pass cache=False for calls whose answer should not be reused.
+    """
+    with span("chat_completion", "llm", model=request.get("model")) as trace:
+        response = response_cache.get_or_create(_create, **request)
+        # Nothing was sent: answered from the cache
+        trace.set_default(cache_hit=True)
+        return response
+
+
+async def achat_completion(**request):
+    with span("chat_completion", "llm", model=request.get("model")) as trace:
+        response = await response_cache.aget_or_create(_acreate, **request)
+        trace.set_default(cache_hit=True)
+        return response
+
+
+def open_stream(trace=None, **request):
+    """
+    A streamed completion; rate limiting and retries apply to opening it.
+    The last chunk carries the usage (pass it to record_usage()).
+    """
+    return _send(dict(request, stream=True, stream_options={"include_usage": True}), trace)
+
+
+async def aopen_stream(trace=None, **request):
+    return await _asend(dict(request, stream=True, stream_options={"include_usage": True}), trace)
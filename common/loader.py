@@ -0,0 +1,30 @@
+"""Import the numbered agent scripts, whose file names are not valid module names."""
+import os
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+AGENT_SCRIPTS = {
+    "react": "1. ReAct/ReAct-claude.py",
+    "plan-and-execute": "2. Plan-and-Execute/2.1 plan-and-execute.py",
+    "rewoo": "2. Plan-and-Execute/2.2 ReWOO.py",
+    "error-handling": "3. Error Handling/3.1 error-handling.py",
+}
+
+_loaded = {}
+
+
+def load_script(path: str):
+    """Load a script by path (relative to the repo root) without running its __main__ block."""
+    full_path = os.path.join(ROOT, path)
+    if full_path not in _loaded:
+        name = "agent_" + "".join(c if c.isalnum() else "_" for c in os.path.basename(path)[:-3])
+        spec = importlib.util.spec_from_file_location(name, full_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded[full_path] = module
+    return _loaded[full_path]
+
+
+def load_agent(name: str):
+    return load_script(AGENT_SCRIPTS[name])
@@ -0,0 +1,88 @@
+"""
+Load test for the async agents against the local mock server.
+
+    python -m common.loadtest --agent react --sessions 200 --latency 0.2
+"""
+import time
+import asyncio
+import argparse
+import statistics
+
+from common import llm
+from common.loader import load_agent
+from common.mock_server import MockChatServer
+
+QUERY = "What's the weather like in Tokyo?"
+
+
+def make_session(agent: str, module, turns: int):
+    if agent == "react":
+        async def session():
+            messages = module.new_session()
+            for _ in range(turns):
+                await module.arun_turn(messages, QUERY)
+    elif agent == "plan-and-execute":
+        async def session():
+            for _ in range(turns):
+                await module.arun_query(QUERY)
+    elif agent == "error-handling":
+        async def session():
+            for _ in range(turns):
+                await module.arun_agent(QUERY, {"web_search": module.web_search})
+    else:
+        raise ValueError(f"no async entry point for agent '{agent}'")
+    return session
+
+
+async def run_load(session, sessions: int) -> list[float]:
+    async def timed():
+        start = time.perf_counter()
+        await session()
+        return time.perf_counter() - start
+
+    return await asyncio.gather(*(timed() for _ in range(sessions)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agent", default="react",
+                        choices=["react", "plan-and-execute", "error-handling"])
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="mock LLM latency per request, in seconds")
+    parser.add_argument("--connections", type=int, default=32,
+                        help="size of the shared HTTP connection pool")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of mock requests that fail with 429 (retried by the client)")
+    parser.add_argument("--rpm", type=float, default=None, help="client-side requests/min limit")
+    parser.add_argument("--tpm", type=float, default=None, help="client-side tokens/min limit")
+    args = parser.parse_args()
+
+    server = MockChatServer(latency=args.latency, error_rate=args.error_rate)
+    # Every session asks the same question: measure real round trips, not cache hits
+    llm.response_cache.enabled = False
+    llm.configure(
+        base_url=server.start(), api_key="mock", max_connections=args.connections,
+        requests_per_minute=args.rpm, tokens_per_minute=args.tpm, coalesce=False,
+    )
+    session = make_session(args.agent, load_agent(args.agent), args.turns)
+
+    start = time.perf_counter()
+    latencies = sorted(asyncio.run(run_load(session, args.sessions)))
+    wall = time.perf_counter() - start
+    server.stop()
+
+    print(f"\nagent={args.agent} sessions={args.sessions} turns={args.turns}")
+    print(f"  wall time:       {wall:.2f}s")
+    print(f"  LLM requests:    {server.requests} ({server.requests / wall:.0f}/s)")
+    print(f"  peak in flight:  {server.peak_in_flight}")
+    print(f"  retried:         {llm.stats['retries']} ({server.errors} mock errors)")
+    print(f"  throttled:       {llm.limiter.stats['throttled']} "
+          f"({llm.limiter.stats['waited']:.1f}s waited)")
+    print(f"  session p50:     {statistics.median(latencies):.2f}s")
+    print(f"  session p95:     {latencies[int(len(latencies) * 0.95) - 1]:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Result caching for deterministic tools.
+
+Wrap a tool where it is registered:
+
+    available_tools = {
+        "web_search": cached_tool(ttl=300, max_entries=1000)(web_search),
+    }
+
+Calls are keyed by their normalized arguments. Concurrent calls with the
+same arguments share one execution instead of all hitting the backend.
+Exceptions are never cached. fresh() skips the sharing: a retry or a
+hedged duplicate of a hung call must not just wait on that same call.
+"""
+import json
+import time
+import inspect
+import threading
+import functools
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+class CachedTool:
+    def __init__(self, fn, ttl: float = 300, max_entries: int = 256):
+        functools.update_wrapper(self, fn)
+        self.fn = fn
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "deduplicated": 0, "evictions": 0, "fresh": 0}
+        self._signature = inspect.signature(fn)
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._in_flight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def key(self, *args, **kwargs) -> str:
+        # Raises TypeError for bad arguments, exactly like calling the tool would
+        bound = self._signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return json.dumps(_normalize(bound.arguments), sort_keys=True, default=str)
+
+    def __call__(self, *args, **kwargs):
+        key = self.key(*args, **kwargs)
+        with self._lock:
+            if self._hit(key):
+                return self._entries[key][1]
+
+            shared = self._in_flight.get(key)
+            if shared is None:
+                future = self._in_flight[key] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["deduplicated"] += 1
+
+        if shared is not None:
+            return shared.result()
+
+        try:
+            result = self.fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            self._store(key, result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def fresh(self, *args, **kwargs):
+        """Like calling it, but never waits on the same call in flight: runs it again."""
+        key = self.key(*args, **kwargs)
+        with self._lock:
+            if self._hit(key):
+                return self._entries[key][1]
+            self.stats["fresh"] += 1
+        result = self.fn(*args, **kwargs)
+        self._store(key, result)
+        return result
+
+    def _hit(self, key: str) -> bool:
+        # Under self._lock
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return True
+        return False
+
+    def _store(self, key: str, result) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def cached_tool(ttl: float = 300, max_entries: int = 256):
+    def decorator(fn):
+        return CachedTool(fn, ttl=ttl, max_entries=max_entries)
+    return decorator
+
+
+def tool_cache_stats(registry: dict) -> dict:
+    """Stats of every cached tool in a name -> function registry."""
+    return {
+        name: dict(tool.stats, size=len(tool._entries))
+        for name, tool in registry.items()
+        if isinstance(tool, CachedTool)
+    }
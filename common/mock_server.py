@@ -0,0 +1,366 @@
+"""
+A local, dependency-free mock of the chat completions endpoint.
+
+Answers every request after a configurable latency with a canned response
+that fits the agent that sent it (tool call, JSON plan, ReWOO plan, ...),
+so agents can be load-tested without a real API key. It can also fail a
+share of requests with 429/5xx (and a Retry-After header) to exercise the
+client's retry path.
+
+Like the real API it reports usage.prompt_tokens_details.cached_tokens:
+a prompt whose leading tokens (tools, then messages, in order) were sent
+before is served from a simulated prefix cache, in 128-token blocks once
+the match reaches `cache_min_tokens` (1024, as OpenAI).
+"""
+import json
+import time
+import random
+import hashlib
+import asyncio
+import argparse
+import threading
+from collections import OrderedDict
+
+# ~4 characters per token, as the usage numbers below
+CHARS_PER_TOKEN = 4
+CACHE_BLOCK_TOKENS = 128
+
+
+STATUS_TEXT = {
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+}
+
+
+def _tool_call_reply(body: dict) -> dict:
+    tool = body["tools"][0]["function"]
+    params = tool.get("parameters", {})
+    required = params.get("required") or list(params.get("properties", {}))
+    args = {name: "Tokyo" for name in required}
+    # Derived from the request so replays are reproducible
+    digest = hashlib.sha1(json.dumps(body["messages"], sort_keys=True).encode()).hexdigest()
+    return {
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [{
+            "id": f"call_{digest[:12]}",
+            "type": "function",
+            "function": {"name": tool["name"], "arguments": json.dumps(args)},
+        }],
+    }
+
+
+def stream_chunks(completion: dict, piece: int = 8, include_usage: bool = False) -> list[dict]:
+    """Split a chat.completion into the chat.completion.chunk events of a stream."""
+    message = completion["choices"][0]["message"]
+    base = {k: completion[k] for k in ("id", "created", "model")}
+
+    def chunk(delta: dict, finish_reason=None) -> dict:
+        return {**base, "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+    chunks = [chunk({"role": "assistant", "content": ""})]
+    content = message.get("content") or ""
+    for i in range(0, len(content), piece):
+        chunks.append(chunk({"content": content[i:i + piece]}))
+    for index, call in enumerate(message.get("tool_calls") or []):
+        function = call["function"]
+        chunks.append(chunk({"tool_calls": [{
+            "index": index, "id": call["id"], "type": "function",
+            "function": {"name": function["name"], "arguments": ""},
+        }]}))
+        for i in range(0, len(function["arguments"]), piece):
+            chunks.append(chunk({"tool_calls": [{
+                "index": index, "function": {"arguments": function["arguments"][i:i + piece]},
+            }]}))
+    chunks.append(chunk({}, completion["choices"][0]["finish_reason"]))
+    if include_usage:
+        # stream_options={"include_usage": true}: a final chunk with no choices
+        chunks.append({**base, "object": "chat.completion.chunk", "choices": [],
+                       "usage": completion["usage"]})
+    return chunks
+
+
+def default_responder(body: dict) -> dict:
+    """Pick a plausible assistant message for the agent that sent `body`."""
+    messages = body.get("messages", [])
+    system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    last = messages[-1] if messages else {}
+
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        if "replanner" in system:
+            content = {"action": "continue"}
+        else:
+            content = {"steps": ["Check the weather in Tokyo"]}
+        return {"role": "assistant", "content": json.dumps(content)}
+
+    if body.get("tools") and last.get("role") != "tool":
+        return _tool_call_reply(body)
+
+    if "#E1" in system:
+        return {"role": "assistant", "content": (
+            "Plan: Check the weather in Tokyo\n"
+            "#E1 = weather_forecast(Tokyo)\n"
+            "Plan: Look up more details\n"
+            "#E2 = web_search(weather details for Tokyo: #E1)"
+        )}
+
+    if '"action": "finish"' in system:
+        observed = any(
+            str(m.get("content", "")).startswith("Observation:") for m in messages
+        )
+        if observed:
+            data = {"thought": "I have the answer", "action": "finish",
+                    "action_input": {}, "final_answer": "mock final answer"}
+        else:
+            data = {"thought": "I should search", "action": "web_search",
+                    "action_input": {"query": "mock query"}}
+        return {"role": "assistant", "content": f"```json\n{json.dumps(data)}\n```"}
+
+    return {"role": "assistant", "content": "mock answer"}
+
+
+def scripted_responder(rules: list[dict], fallback=default_responder):
+    """
+    Replay scripted replies. Each rule is
+        {"match": "text", "in": "system" | "last" | "any", "response": reply}
+    where reply is a content string, an assistant message dict, or a list of
+    those replayed in order (the last one repeats). The first rule whose
+    text occurs in the chosen part of the request wins; otherwise
+    `fallback` answers.
+    """
+    replayed = [0] * len(rules)
+
+    def respond(body: dict) -> dict:
+        messages = body.get("messages", [])
+        parts = {
+            "system": next((m.get("content") or "" for m in messages if m.get("role") == "system"), ""),
+            "last": str((messages[-1] if messages else {}).get("content") or ""),
+            "any": json.dumps(messages, ensure_ascii=False),
+        }
+        for i, rule in enumerate(rules):
+            if rule["match"] not in parts[rule.get("in", "any")]:
+                continue
+            reply = rule["response"]
+            if isinstance(reply, list):
+                reply = reply[min(replayed[i], len(reply) - 1)]
+                replayed[i] += 1
+            if isinstance(reply, str):
+                reply = {"role": "assistant", "content": reply}
+            return reply
+        return fallback(body)
+
+    return respond
+
+
+class PrefixCache:
+    """Hashes of recently seen prompt prefixes, in whole cache blocks."""
+    def __init__(self, min_tokens: int = 1024, max_entries: int = 100_000):
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self._seen: OrderedDict[bytes, None] = OrderedDict()
+
+    def lookup(self, prompt: str) -> int:
+        """Cached tokens of `prompt`, then remember all of its blocks."""
+        block = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        digest = hashlib.sha1()
+        hits, matching = 0, True
+        for n in range(len(prompt) // block):
+            digest.update(prompt[n * block:(n + 1) * block].encode())
+            key = digest.digest()
+            if matching and key in self._seen:
+                hits += 1
+                self._seen.move_to_end(key)
+            else:
+                matching = False
+                self._seen[key] = None
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        cached = hits * CACHE_BLOCK_TOKENS
+        return cached if cached >= self.min_tokens else 0
+
+
+class MockChatServer:
+    """
+    Minimal HTTP/1.1 server (keep-alive) on asyncio streams.
+    Use start()/stop() to run it in a background thread.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.05, responder=default_responder,
+                 chunk_delay: float = 0.005, error_rate: float = 0.0,
+                 error_status: int = 429, retry_after: float = 0.1, seed: int | None = None,
+                 cache_min_tokens: int = 1024):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.responder = responder
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self.prefix_cache = PrefixCache(cache_min_tokens)
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._loop = None
+        self._server = None
+        self._connections: set = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def serve(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, backlog=2048
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def start(self) -> str:
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.serve())
+            ready.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, daemon=True, name="mock-llm").start()
+        ready.wait()
+        return self.base_url
+
+    def stop(self) -> None:
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _shutdown(self) -> None:
+        self._server.close()
+        for task in self._connections:
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    async def _handle(self, reader, writer) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, value = line.decode().split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload, extra = await self._route(method, path, body)
+                if isinstance(payload, list):
+                    await self._write_stream(writer, status, payload)
+                    continue
+                data = json.dumps(payload).encode()
+                extra_headers = "".join(f"{k}: {v}\r\n" for k, v in extra.items())
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: application/json\r\n{extra_headers}"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _write_stream(self, writer, status: str, chunks: list[dict]) -> None:
+        """Server-sent events over chunked transfer encoding."""
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/event-stream\r\n"
+            f"Transfer-Encoding: chunked\r\n\r\n".encode()
+        )
+        for event in [json.dumps(c) for c in chunks] + ["[DONE]"]:
+            data = f"data: {event}\n\n".encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+            await asyncio.sleep(self.chunk_delay)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _route(self, method: str, path: str, body: bytes) -> tuple[str, dict | list, dict]:
+        if method != "POST" or not path.rstrip("/").endswith("/chat/completions"):
+            return "404 Not Found", {"error": {"message": f"no route for {method} {path}"}}, {}
+
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            request = json.loads(body)
+            message = self.responder(request)
+        finally:
+            self.in_flight -= 1
+
+        if self._random.random() < self.error_rate:
+            self.errors += 1
+            status = f"{self.error_status} {STATUS_TEXT.get(self.error_status, 'Error')}"
+            error = {"error": {"message": "mock failure", "type": "mock_error"}}
+            return status, error, {"Retry-After": f"{self.retry_after:g}"}
+
+        # What a provider hashes for its prefix cache: tools first, then the messages
+        prompt = json.dumps(request.get("tools") or []) + json.dumps(request.get("messages", []))
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        completion_tokens = len(json.dumps(message)) // CHARS_PER_TOKEN
+        cached_tokens = self.prefix_cache.lookup(prompt)
+        completion = {
+            "id": f"chatcmpl-mock-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
+        if request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+            return "200 OK", stream_chunks(completion, include_usage=include_usage), {}
+        return "200 OK", completion, {}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the mock chat completions server")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--cache-min-tokens", type=int, default=1024,
+                        help="shortest prefix match reported as cached tokens")
+    args = parser.parse_args()
+
+    server = MockChatServer(port=args.port, latency=args.latency,
+                            error_rate=args.error_rate, error_status=args.error_status,
+                            cache_min_tokens=args.cache_min_tokens)
+
+    async def main():
+        await server.serve()
+        print(f"Mock server listening on {server.base_url}")
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
@@ -0,0 +1,35 @@
+"""
+Prompt assembly for provider-side prompt caching.
+
+Providers reuse the work done for a prompt prefix they have seen
+recently: cached input tokens are cheaper and skip most of the prefill.
+The match is on exact leading tokens, tools first and then the messages
+in order, so a request is assembled as
+
+    tools -> system prompt -> variable context -> user input
+
+The system prompt is formatted once, when the Prompt is created. Per-call
+text (step results, evidence, retrieved documents) goes after it, never
+into it, and the part of it that only grows (earlier results) comes
+before the part that is new each call.
+
+    EXECUTOR = Prompt(EXECUTOR_PROMPT)
+    messages = EXECUTOR.messages(step, context=context.render(step))
+
+Whether it works shows in the usage fields: llm.cache_ratio() and the
+cached column of common.bench.
+"""
+
+
+class Prompt:
+    def __init__(self, template: str, **fixed):
+        # str.format only with values that never change for this prompt
+        self.system = template.format(**fixed) if fixed else template
+
+    def messages(self, user: str, context: str | None = None) -> list:
+        """[system, user]; `context` leads the user message, ahead of the input."""
+        content = f"{context}\n\n{user}" if context else user
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": content},
+        ]
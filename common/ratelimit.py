@@ -0,0 +1,86 @@
+"""
+Client-side rate limiting for LLM requests.
+
+Token buckets for requests per minute and tokens per minute, matching the
+two limits the API enforces. A request reserves its estimated token cost
+up front and settles the difference once the real usage is known.
+"""
+import time
+import asyncio
+import threading
+
+from common.tokens import count_message_tokens, count_tools_tokens
+
+# Assumed completion length when the request does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 256
+
+
+def estimate_tokens(request: dict) -> int:
+    completion = request.get("max_completion_tokens") or request.get("max_tokens")
+    return (
+        count_message_tokens(request.get("messages", []))
+        + count_tools_tokens(request.get("tools"))
+        + (completion or DEFAULT_COMPLETION_TOKENS)
+    )
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute / 60` units per second up to `capacity`.
+    reserve() always succeeds and may take the level below zero; the caller
+    then waits until the debt is repaid. Waiters are therefore served in
+    arrival order, and a request larger than the bucket still gets through.
+    """
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` now; returns how many seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            self._level -= amount
+            return max(0.0, -self._level / self.rate)
+
+    def refund(self, amount: float) -> None:
+        """Give back (or, if negative, take more of) a reservation."""
+        with self._lock:
+            self._level = min(self.capacity, self._level + amount)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: float | None = None, tokens_per_minute: float | None = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.stats = {"throttled": 0, "waited": 0.0}
+
+    def _reserve(self, tokens: int) -> float:
+        delay = 0.0
+        if self.requests:
+            delay = self.requests.reserve(1)
+        if self.tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        if delay > 0:
+            self.stats["throttled"] += 1
+            self.stats["waited"] += delay
+        return delay
+
+    def acquire(self, tokens: int) -> None:
+        delay = self._reserve(tokens)
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self, tokens: int) -> None:
+        delay = self._reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Correct the token bucket once the response reports its real usage."""
+        if self.tokens:
+            self.tokens.refund(reserved - used)
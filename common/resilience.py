@@ -0,0 +1,359 @@
+"""
+Per-tool circuit breakers and bulkheads, shared by every session in the
+process.
+
+- ToolBreaker: closed -> open when the error rate over a rolling window
+  passes a threshold; open calls fail fast with CircuitOpen instead of
+  hammering a broken backend; after a cooldown a few probe calls are let
+  through (half-open) and their outcome closes or re-opens the circuit.
+- Bulkhead: at most `max_concurrent` calls of a tool run at once; the
+  next `max_waiting` queue, anything beyond is rejected with BulkheadFull.
+  A queued call waits on a future (slot()), not in a worker thread, so a
+  slow tool cannot occupy the pool that unrelated tools run on.
+
+    guard = tool_guard("web_search", scope="react")   # get or create, process-wide
+    configure_tool("web_search", scope="react", max_concurrent=4, failure_rate=0.5)
+
+Guards are keyed by (scope, tool name): two agents that each have a
+"web_search" backed by different code must not share a breaker, or one
+agent's failures open the circuit for the other. The dispatcher and the
+retry engine apply these around every tool call, each in its own scope
+unless given one to share.
+"""
+import time
+import asyncio
+import itertools
+import threading
+from enum import Enum
+from collections import deque
+from concurrent.futures import Future
+
+
+class CircuitOpen(RuntimeError):
+    """The tool's circuit is open: it failed too often recently."""
+
+
+class BulkheadFull(RuntimeError):
+    """Too many calls of the tool are running or queued."""
+
+
+class BreakerState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class ToolBreaker:
+    """
+    Error rate over the last `window` seconds, counted in one-second
+    buckets. Opens once at least `min_calls` calls saw a failure rate of
+    `failure_rate` or more; stays open for `cooldown` seconds.
+    """
+    def __init__(
+        self,
+        name: str,
+        window: float = 30.0,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        cooldown: float = 15.0,
+        probes: int = 1,
+    ):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.probes = probes
+        self.stats = {"rejected": 0, "opened": 0}
+        self._state = BreakerState.CLOSED
+        self._opened_at = 0.0
+        self._probing = 0
+        self._buckets: deque[list] = deque()   # [second, calls, failures]
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> BreakerState:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def allow(self) -> None:
+        """Raise CircuitOpen unless a call may go through now."""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state is BreakerState.CLOSED:
+                return
+            if state is BreakerState.HALF_OPEN and self._probing < self.probes:
+                self._probing += 1
+                return
+            self.stats["rejected"] += 1
+        retry_in = max(0.0, self._opened_at + self.cooldown - time.monotonic())
+        raise CircuitOpen(f"circuit for '{self.name}' is {state.value}, retry in {retry_in:.0f}s")
+
+    def record(self, ok: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state is BreakerState.OPEN:
+                # A call admitted before the circuit opened
+                return
+            if state is BreakerState.HALF_OPEN:
+                self._probing = max(0, self._probing - 1)
+                if ok:
+                    self._state = BreakerState.CLOSED
+                    self._buckets.clear()
+                else:
+                    self._open(now)
+                return
+
+            second = int(now)
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0])
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            bucket[2] += not ok
+            self._prune(now)
+            if state is BreakerState.CLOSED and not ok:
+                calls = sum(b[1] for b in self._buckets)
+                failures = sum(b[2] for b in self._buckets)
+                if calls >= self.min_calls and failures / calls >= self.failure_rate:
+                    self._open(now)
+
+    def error_rate(self) -> tuple[int, float]:
+        """(calls, failure rate) over the window."""
+        with self._lock:
+            self._prune(time.monotonic())
+            calls = sum(b[1] for b in self._buckets)
+            return calls, (sum(b[2] for b in self._buckets) / calls if calls else 0.0)
+
+    def cancel(self) -> None:
+        """An allowed call that never ran: give back its half-open probe."""
+        with self._lock:
+            if self._state is BreakerState.HALF_OPEN:
+                self._probing = max(0, self._probing - 1)
+
+    def _current_state(self, now: float) -> BreakerState:
+        if self._state is BreakerState.OPEN and now - self._opened_at >= self.cooldown:
+            self._state = BreakerState.HALF_OPEN
+            self._probing = 0
+        return self._state
+
+    def _open(self, now: float) -> None:
+        self._state = BreakerState.OPEN
+        self._opened_at = now
+        self._buckets.clear()
+        self.stats["opened"] += 1
+
+    def _prune(self, now: float) -> None:
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+
+
+class Bulkhead:
+    def __init__(self, name: str, max_concurrent: int = 8, max_waiting: int = 32,
+                 wait_timeout: float = 30.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.active = 0
+        self.stats = {"queued": 0, "rejected": 0, "peak": 0}
+        self._waiters: deque[Future] = deque()
+        self._lock = threading.Lock()
+
+    def slot(self) -> Future:
+        """
+        A future that completes when the caller holds a slot (already
+        completed if one is free). Raises BulkheadFull if the queue is full.
+        Whoever gets the slot must release() it; to give up while still
+        queued, cancel() the future (if that fails, the slot was granted).
+        """
+        granted = Future()
+        with self._lock:
+            if self.active < self.max_concurrent:
+                self.active += 1
+                self.stats["peak"] = max(self.stats["peak"], self.active)
+                granted.set_running_or_notify_cancel()
+                granted.set_result(None)
+                return granted
+            waiting = sum(not waiter.cancelled() for waiter in self._waiters)
+            if waiting >= self.max_waiting:
+                self.stats["rejected"] += 1
+                raise BulkheadFull(
+                    f"'{self.name}' has {self.active} calls running and {waiting} queued"
+                )
+            self.stats["queued"] += 1
+            self._waiters.append(granted)
+        return granted
+
+    def acquire(self) -> None:
+        """Blocking wait for a slot (for callers that are already on their own thread)."""
+        granted = self.slot()
+        try:
+            granted.result(self.wait_timeout)
+        except TimeoutError:
+            self._give_up(granted)
+        except BaseException:
+            if not granted.cancel():
+                self.release()
+            raise
+
+    async def aacquire(self) -> None:
+        granted = self.slot()
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(granted)), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self._give_up(granted)
+        except BaseException:
+            if not granted.cancel():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            # Hand the slot straight to the next live waiter
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if waiter.set_running_or_notify_cancel():
+                    break
+            else:
+                self.active -= 1
+                return
+        # Outside the lock: the waiter's callbacks may come back here
+        waiter.set_result(None)
+
+    def _give_up(self, granted: Future) -> None:
+        if granted.cancel():
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise BulkheadFull(f"no slot for '{self.name}' within {self.wait_timeout}s")
+        # Granted just as the wait timed out: keep it
+
+
+class ToolGuard:
+    """
+    The breaker and bulkhead of one tool. A call goes: reject early if the
+    circuit is open -> wait for a bulkhead slot -> breaker.allow() (may
+    take a half-open probe) -> run_admitted() / submit() records the
+    outcome and frees the slot.
+    """
+    def __init__(self, name: str, breaker: ToolBreaker, bulkhead: Bulkhead):
+        self.name = name
+        self.breaker = breaker
+        self.bulkhead = bulkhead
+
+    def check(self) -> None:
+        """Fail fast, before queueing, while the circuit is open."""
+        if self.breaker.state is BreakerState.OPEN:
+            self.breaker.allow()
+
+    def admit(self) -> None:
+        """With a slot held: let the breaker decide, giving the slot back if it says no."""
+        try:
+            self.breaker.allow()
+        except CircuitOpen:
+            self.bulkhead.release()
+            raise
+
+    def finish(self, error: BaseException | None) -> None:
+        """Record the outcome of an admitted call and free its slot."""
+        # Bad arguments from the model say nothing about the backend
+        self.breaker.record(error is None or isinstance(error, TypeError))
+        self.bulkhead.release()
+
+    def abandon(self) -> None:
+        """An admitted call that never ran."""
+        self.breaker.cancel()
+        self.bulkhead.release()
+
+    def run_admitted(self, fn, /, *args, **kwargs):
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.finish(e)
+            raise
+        self.finish(None)
+        return result
+
+    def submit(self, pool, fn, /, *args, **kwargs) -> Future:
+        """
+        Run an admitted call on `pool`. The outcome is recorded and the
+        slot freed when it ends, or if the future is cancelled before it
+        starts, so callers may abandon it at any time.
+        """
+        future = pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(
+            lambda done: self.abandon() if done.cancelled() else self.finish(done.exception())
+        )
+        return future
+
+    def call(self, fn, /, *args, **kwargs):
+        """Run fn in the calling thread under both (for sync callers)."""
+        self.check()
+        self.bulkhead.acquire()
+        self.admit()
+        return self.run_admitted(fn, *args, **kwargs)
+
+    async def aenter(self) -> None:
+        """Async check + slot + admit; follow with submit()."""
+        self.check()
+        await self.bulkhead.aacquire()
+        self.admit()
+
+    def report(self) -> str:
+        calls, rate = self.breaker.error_rate()
+        return (
+            f"{self.name}: {self.breaker.state.value}, {rate:.0%} errors in {calls} recent calls, "
+            f"{self.bulkhead.active}/{self.bulkhead.max_concurrent} running, "
+            f"{self.bulkhead.stats['rejected'] + self.breaker.stats['rejected']} rejected"
+        )
+
+
+_guards: dict[tuple[str, str], ToolGuard] = {}
+_guards_lock = threading.Lock()
+_options: dict[tuple[str, str], dict] = {}
+_scopes = itertools.count(1)
+
+_BREAKER_OPTIONS = ("window", "min_calls", "failure_rate", "cooldown", "probes")
+_BULKHEAD_OPTIONS = ("max_concurrent", "max_waiting", "wait_timeout")
+
+
+def new_scope(prefix: str) -> str:
+    """A scope no other caller uses, e.g. "dispatcher-3"."""
+    return f"{prefix}-{next(_scopes)}"
+
+
+def configure_tool(name: str, scope: str = "", **options) -> None:
+    """
+    Set breaker (window, min_calls, failure_rate, cooldown, probes) and
+    bulkhead (max_concurrent, max_waiting, wait_timeout) options for a tool
+    in one scope. Replaces its guard, so call it before the tool is used.
+    """
+    unknown = set(options) - set(_BREAKER_OPTIONS) - set(_BULKHEAD_OPTIONS)
+    if unknown:
+        raise TypeError(f"unknown tool guard options: {sorted(unknown)}")
+    with _guards_lock:
+        _options.setdefault((scope, name), {}).update(options)
+        _guards.pop((scope, name), None)
+
+
+def tool_guard(name: str, scope: str = "") -> ToolGuard:
+    """The process-wide guard of a tool in `scope`, created on first use."""
+    key = (scope, name)
+    with _guards_lock:
+        guard = _guards.get(key)
+        if guard is None:
+            options = _options.get(key, {})
+            label = f"{scope}/{name}" if scope else name
+            guard = _guards[key] = ToolGuard(
+                label,
+                ToolBreaker(label, **{k: v for k, v in options.items() if k in _BREAKER_OPTIONS}),
+                Bulkhead(label, **{k: v for k, v in options.items() if k in _BULKHEAD_OPTIONS}),
+            )
+        return guard
+
+
+def guards_report(scope: str | None = None) -> str:
+    """One line per guard; only those of `scope` if given."""
+    with _guards_lock:
+        guards = [guard for key, guard in _guards.items() if scope is None or key[0] == scope]
+    return "\n".join(guard.report() for guard in guards) or "no tools called"
@@ -0,0 +1,252 @@
+"""
+Retry policy for LLM requests: which errors are worth retrying and how
+long to wait before the next attempt.
+
+RetryEngine applies the same backoff to blocking calls such as tools,
+scheduled on an event loop instead of sleeping in the caller's thread,
+with per-attempt timeouts and hedged duplicates for slow attempts.
+"""
+import time
+import random
+import asyncio
+import threading
+import functools
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+from common.tracing import span, annotate
+from common.resilience import CircuitOpen, BulkheadFull, new_scope, tool_guard
+
+# Rate limited, overloaded or temporarily broken: another attempt may succeed
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error: Exception) -> bool:
+    import openai
+
+    # APITimeoutError is a subclass of APIConnectionError
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def retry_after(error: Exception) -> float | None:
+    """Seconds the server asked us to wait (retry-after-ms / Retry-After), if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    try:
+        return float(headers["retry-after-ms"]) / 1000
+    except (KeyError, ValueError):
+        pass
+
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        # HTTP-date form
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(
+    attempt: int,
+    base: float = 0.5,
+    cap: float = 30.0,
+    server_delay: float | None = None,
+) -> float:
+    """
+    Full-jitter exponential backoff for the given (0-based) attempt.
+    When the server said how long to wait, that wins, with a little jitter
+    on top so clients throttled together do not all return at once.
+    """
+    if server_delay is not None:
+        return server_delay + random.uniform(0, 0.1 * server_delay + 0.05)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# ============================================================
+# Retry engine for blocking calls (tools)
+# ============================================================
+
+class LatencyWindow:
+    """The last `size` successful latencies of one key, for hedging thresholds."""
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        """The q-th percentile, or None until there are min_samples samples."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class RetryEngine:
+    """
+    Runs blocking calls on a worker pool and retries failures with capped,
+    full-jitter exponential backoff. Waiting is an asyncio.sleep, so a
+    call in backoff holds neither a thread nor the event loop.
+
+    - timeout: seconds per attempt; a late attempt counts as failed with
+      TimeoutError (its thread cannot be interrupted and finishes in the
+      background, its result is dropped)
+    - hedge_quantile: once `key` has enough history, an attempt still
+      running after that percentile of its past latencies gets a duplicate;
+      whichever returns first wins (use only for idempotent calls)
+    - retries and hedges call `fn.fresh` when fn has one (CachedTool):
+      joining the in-flight call they are meant to replace would only
+      wait on the same hung execution
+    - retry_on: predicate for errors worth another attempt
+    - guarded: run every attempt under tool_guard(key, scope), the key's
+      circuit breaker and bulkhead (common/resilience.py) in `scope`, the
+      engine's own unless named; an open circuit fails the call at once,
+      without retries
+    """
+    def __init__(
+        self,
+        attempts: int = 3,
+        base: float = 0.5,
+        cap: float = 10.0,
+        timeout: float | None = None,
+        hedge_quantile: float | None = 95,
+        max_hedges: int = 1,
+        retry_on=lambda error: True,
+        on_retry=None,
+        guarded: bool = False,
+        scope: str | None = None,
+        max_workers: int = 32,
+    ):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.timeout = timeout
+        self.hedge_quantile = hedge_quantile
+        self.max_hedges = max_hedges
+        self.retry_on = retry_on
+        self.on_retry = on_retry
+        self.guarded = guarded
+        self.scope = scope or new_scope("retry")
+        self.latencies: dict[str, LatencyWindow] = {}
+        self.stats = {"calls": 0, "attempts": 0, "retries": 0, "timeouts": 0,
+                      "hedges": 0, "hedge_wins": 0, "failures": 0}
+        # Own pool: asyncio.run() would otherwise wait for abandoned attempts on exit
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retry")
+
+    async def run(self, key: str, fn, /, *args, **kwargs):
+        """Call fn(*args, **kwargs) with retries; `key` groups latency history (e.g. tool name)."""
+        self.stats["calls"] += 1
+        window = self.latencies.setdefault(key, LatencyWindow())
+        for attempt in range(self.attempts):
+            try:
+                result = await self._attempt(key, window, fn, args, kwargs, retry=attempt > 0)
+                annotate(retries=attempt)
+                return result
+            except Exception as e:
+                if attempt == self.attempts - 1 or isinstance(e, CircuitOpen) or not self.retry_on(e):
+                    self.stats["failures"] += 1
+                    annotate(retries=attempt)
+                    raise
+                self.stats["retries"] += 1
+                delay = backoff_delay(attempt, self.base, self.cap)
+                if self.on_retry:
+                    self.on_retry(key, attempt + 1, e, delay)
+                with span("backoff", "retry", attempt=attempt + 1, delay=delay, error=type(e).__name__):
+                    await asyncio.sleep(delay)
+
+    def call(self, key: str, fn, /, *args, **kwargs):
+        """Blocking form for callers without an event loop (runs one for the call)."""
+        return asyncio.run(self.run(key, fn, *args, **kwargs))
+
+    async def _attempt(self, key: str, window: LatencyWindow, fn, args, kwargs, retry: bool = False):
+        loop = asyncio.get_running_loop()
+        first = functools.partial(fn, *args, **kwargs)
+        again = functools.partial(getattr(fn, "fresh", fn), *args, **kwargs)
+        guard = tool_guard(key, self.scope) if self.guarded else None
+        started: dict[asyncio.Future, float] = {}
+
+        async def launch(call) -> asyncio.Future:
+            # The caller's context, so spans opened by the call nest under its trace
+            context = contextvars.copy_context()
+            if guard:
+                await guard.aenter()
+                future = asyncio.wrap_future(guard.submit(self._pool, context.run, call))
+            else:
+                future = loop.run_in_executor(self._pool, context.run, call)
+            self.stats["attempts"] += 1
+            started[future] = time.perf_counter()
+            return future
+
+        primary = await launch(again if retry else first)
+        pending = {primary}
+        deadline = time.perf_counter() + self.timeout if self.timeout else None
+        hedge_after = window.quantile(self.hedge_quantile) if self.hedge_quantile else None
+        hedges = 0
+        error = None
+
+        while pending:
+            now = time.perf_counter()
+            wait = deadline - now if deadline else None
+            hedging = hedge_after is not None and hedges < self.max_hedges
+            if hedging:
+                hedge_at = started[primary] + hedge_after * (hedges + 1)
+                wait = min(wait, hedge_at - now) if wait is not None else hedge_at - now
+            done, pending = await asyncio.wait(
+                pending, timeout=max(wait, 0) if wait is not None else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for future in done:
+                if future.exception() is None:
+                    window.record(time.perf_counter() - started[future])
+                    for other in pending:
+                        other.cancel()
+                    if future is not primary:
+                        self.stats["hedge_wins"] += 1
+                        annotate(hedged=True)
+                    return future.result()
+                error = future.exception()
+            if done:
+                continue
+            if deadline and time.perf_counter() >= deadline:
+                for other in pending:
+                    other.cancel()
+                self.stats["timeouts"] += 1
+                # No breaker record here: the attempt's done-callback records
+                # its outcome when the thread finishes
+                raise TimeoutError(f"attempt took longer than {self.timeout}s")
+            if hedging:
+                hedges += 1
+                # A hedge never queues behind the tool's bulkhead
+                if not guard or guard.bulkhead.active < guard.bulkhead.max_concurrent:
+                    try:
+                        pending.add(await launch(again))
+                        self.stats["hedges"] += 1
+                    except (CircuitOpen, BulkheadFull):
+                        pass
+        raise error
+
+    def report(self) -> str:
+        s = self.stats
+        return (
+            f"{s['calls']} calls, {s['attempts']} attempts, {s['retries']} retries, "
+            f"{s['timeouts']} timeouts, {s['hedges']} hedges ({s['hedge_wins']} won), "
+            f"{s['failures']} failed"
+        )
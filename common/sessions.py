@@ -0,0 +1,284 @@
+"""
+Append-only session store.
+
+Each session is two files in the store directory:
+
+- <id>.log: an 8-byte header, then one record per message (or any
+  dict): a 4-byte little-endian length followed by the payload, msgpack
+  when it is installed, JSON otherwise (the header says which)
+- <id>.idx: the byte offset of every record in the log, 8 bytes each
+
+Appending writes the record and its offset; nothing is rewritten. The
+last N records are found from the index size alone and read through
+mmap, so resuming a session costs the same for 10 turns or 100k, and a
+history is never loaded whole. At most `max_open` sessions hold file
+handles at a time; the least recently used give theirs back and reopen
+them on their next access, so a SessionLog handed out stays usable.
+
+    store = SessionStore("sessions")
+    log = store.open("alice")
+    log.extend(new_messages)
+    messages = resume(log, 40)
+"""
+import os
+import re
+import json
+import mmap
+import struct
+import weakref
+import threading
+from collections import OrderedDict
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from common.tokens import as_dict
+
+MAGIC = b"AGSL"
+VERSION = 1
+CODECS = {0: "json", 1: "msgpack"}
+HEADER = struct.Struct("<4sBB2x")   # magic, version, codec
+LENGTH = struct.Struct("<I")
+OFFSET = struct.Struct("<Q")
+
+_SESSION_ID = re.compile(r"^[\w.-]{1,128}$")
+
+
+def _encoder(codec: int):
+    if codec == 1:
+        return lambda record: msgpack.packb(record, use_bin_type=True)
+    return lambda record: json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _decoder(codec: int):
+    if codec == 1:
+        if msgpack is None:
+            raise RuntimeError("this session log was written with msgpack; pip install msgpack")
+        return lambda data: msgpack.unpackb(data, raw=False)
+    return json.loads
+
+
+class SessionLog:
+    """
+    One session's log + index, open for appending and reading. close()
+    only releases the file handles: the next call reopens them, and
+    `on_open` (the store's LRU) is told so it can close another log.
+    """
+    def __init__(self, path: str, on_open=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._on_open = on_open
+        new = not os.path.exists(path + ".log")
+        self._log = open(path + ".log", "a+b")
+        self._idx = open(path + ".idx", "a+b")
+        if new or os.path.getsize(path + ".log") == 0:
+            codec = 1 if msgpack is not None else 0
+            self._log.write(HEADER.pack(MAGIC, VERSION, codec))
+            self._log.flush()
+        else:
+            self._log.seek(0)
+            magic, version, codec = HEADER.unpack(self._log.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path}.log is not a version {VERSION} session log")
+        self.codec = CODECS[codec]
+        self._encode = _encoder(codec)
+        self._decode = _decoder(codec)
+        self._recover()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def closed(self) -> bool:
+        return self._log is None
+
+    def append(self, record) -> None:
+        self.extend([record])
+
+    def extend(self, records) -> None:
+        """Append records (message dicts or SDK message objects) in one write."""
+        chunks, offsets = [], []
+        with self._lock:
+            reopened = self._reopen()
+            position = self._size
+            for record in records:
+                payload = self._encode(as_dict(record))
+                chunks.append(LENGTH.pack(len(payload)) + payload)
+                offsets.append(OFFSET.pack(position))
+                position += LENGTH.size + len(payload)
+            if chunks:
+                # Log first: a crash between the writes leaves records the index
+                # does not know yet, which _recover() re-indexes
+                self._log.write(b"".join(chunks))
+                self._log.flush()
+                self._idx.write(b"".join(offsets))
+                self._idx.flush()
+                self._size = position
+                self._count += len(offsets)
+        self._opened(reopened)
+
+    def tail(self, n: int) -> list:
+        """The last n records, oldest first."""
+        return self.slice(max(0, self._count - n), self._count)
+
+    def slice(self, start: int, stop: int) -> list:
+        """Records [start, stop), read through mmap without touching the rest."""
+        with self._lock:
+            stop = min(stop, self._count)
+            if start >= stop:
+                return []
+            reopened = self._reopen()
+            with mmap.mmap(self._idx.fileno(), stop * OFFSET.size, access=mmap.ACCESS_READ) as idx:
+                first = OFFSET.unpack_from(idx, start * OFFSET.size)[0]
+            with mmap.mmap(self._log.fileno(), self._size, access=mmap.ACCESS_READ) as log:
+                records, position = [], first
+                for _ in range(stop - start):
+                    (length,) = LENGTH.unpack_from(log, position)
+                    position += LENGTH.size
+                    records.append(self._decode(log[position:position + length]))
+                    position += length
+        self._opened(reopened)
+        return records
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._log is not None:
+                os.fsync(self._log.fileno())
+                os.fsync(self._idx.fileno())
+
+    def close(self) -> None:
+        """Release the file handles; the log reopens them when used again."""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._idx.close()
+                self._log = self._idx = None
+
+    def reopen(self) -> None:
+        """Take the file handles back after close(); every call does this lazily too."""
+        with self._lock:
+            reopened = self._reopen()
+        self._opened(reopened)
+
+    def _reopen(self) -> bool:
+        # Under self._lock. Only this object appends, so size and count still hold
+        if self._log is not None:
+            return False
+        self._log = open(self.path + ".log", "a+b")
+        self._idx = open(self.path + ".idx", "a+b")
+        return True
+
+    def _opened(self, reopened: bool) -> None:
+        # Outside self._lock: the store takes its own lock and may close other logs
+        if reopened and self._on_open is not None:
+            self._on_open(self)
+
+    def _recover(self) -> None:
+        """Make log and index agree after a crash mid-append."""
+        log_size = os.path.getsize(self.path + ".log")
+        idx_size = os.path.getsize(self.path + ".idx")
+        count = idx_size // OFFSET.size
+        if idx_size != count * OFFSET.size:
+            self._idx.truncate(count * OFFSET.size)
+
+        # Start of the first record the index does not cover
+        position = HEADER.size
+        if count:
+            self._idx.seek((count - 1) * OFFSET.size)
+            position = OFFSET.unpack(self._idx.read(OFFSET.size))[0]
+            self._log.seek(position)
+            header = self._log.read(LENGTH.size)
+            if len(header) < LENGTH.size or position + LENGTH.size + LENGTH.unpack(header)[0] > log_size:
+                # The last indexed record itself is cut short
+                count -= 1
+                self._idx.truncate(count * OFFSET.size)
+            else:
+                position += LENGTH.size + LENGTH.unpack(header)[0]
+
+        # Index records that were written before the index was
+        self._log.seek(position)
+        missing = []
+        while position + LENGTH.size <= log_size:
+            (length,) = LENGTH.unpack(self._log.read(LENGTH.size))
+            if position + LENGTH.size + length > log_size:
+                break
+            missing.append(OFFSET.pack(position))
+            self._log.seek(length, os.SEEK_CUR)
+            position += LENGTH.size + length
+        if position < log_size:
+            self._log.truncate(position)
+        if missing:
+            self._idx.write(b"".join(missing))
+            self._idx.flush()
+        self._size = position
+        self._count = count + len(missing)
+
+
+def resume(log: SessionLog, n: int) -> list:
+    """
+    The last n messages of a chat session, ready to send again: tool
+    results whose assistant tool_calls message fell outside the window
+    are dropped, since the API rejects them.
+    """
+    messages = log.tail(n)
+    while messages and messages[0].get("role") == "tool":
+        messages.pop(0)
+    return messages
+
+
+class SessionStore:
+    """
+    A directory of session logs. open() returns the same SessionLog for a
+    session as long as anyone holds it. At most `max_open` logs keep their
+    file handles (two each); the least recently used release them and
+    reopen on their next access, so callers never see a closed log.
+    """
+    def __init__(self, root: str, max_open: int = 64):
+        self.root = root
+        self.max_open = max_open
+        self._logs: weakref.WeakValueDictionary[str, SessionLog] = weakref.WeakValueDictionary()
+        self._open: OrderedDict[str, SessionLog] = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def open(self, session_id: str) -> SessionLog:
+        if not _SESSION_ID.match(session_id):
+            raise ValueError(f"invalid session id {session_id!r}")
+        with self._lock:
+            log = self._logs.get(session_id)
+            if log is None:
+                log = self._logs[session_id] = SessionLog(
+                    os.path.join(self.root, session_id), on_open=self._touch
+                )
+        log.reopen()
+        self._touch(log)
+        return log
+
+    def _touch(self, log: SessionLog) -> None:
+        """Mark `log` most recently used; release the handles of the logs past max_open."""
+        session_id = os.path.basename(log.path)
+        with self._lock:
+            self._open[session_id] = log
+            self._open.move_to_end(session_id)
+            idle = []
+            while len(self._open) > self.max_open:
+                idle.append(self._open.popitem(last=False)[1])
+        # Outside the store lock: close() waits for a call the log is in
+        for log in idle:
+            log.close()
+
+    def exists(self, session_id: str) -> bool:
+        return os.path.exists(os.path.join(self.root, session_id + ".log"))
+
+    def sessions(self) -> list[str]:
+        return sorted(name[:-4] for name in os.listdir(self.root) if name.endswith(".log"))
+
+    def close(self) -> None:
+        """Release every handle; logs still held reopen on their next use."""
+        with self._lock:
+            logs = list(self._open.values())
+            self._open.clear()
+        for log in logs:
+            log.close()
@@ -0,0 +1,151 @@
+"""
+Streaming chat completions.
+
+stream_text()/astream_text() yield content deltas as they arrive, for
+final answers where time-to-first-token is what the user notices.
+
+stream_turn()/astream_turn() also reassemble the `tool_calls` fragments of
+a streamed assistant turn and emit each tool call as soon as its
+arguments are complete, so it can be dispatched before the model has
+finished writing the rest of the turn.
+"""
+from dataclasses import dataclass, field
+
+from common import llm
+from common.tracing import span
+
+
+@dataclass
+class StreamedFunction:
+    name: str = ""
+    arguments: str = ""
+
+
+@dataclass
+class StreamedToolCall:
+    """Same shape as the SDK's tool call object (id, type, function.name/arguments)."""
+    index: int
+    id: str = ""
+    type: str = "function"
+    function: StreamedFunction = field(default_factory=StreamedFunction)
+
+    def model_dump(self, **_) -> dict:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "function": {"name": self.function.name, "arguments": self.function.arguments},
+        }
+
+
+class ToolCallAssembler:
+    """
+    Collects tool call fragments by index. The model writes tool calls one
+    after another, so call i is complete once a fragment for a later index
+    arrives, or when the stream ends.
+    """
+    def __init__(self):
+        self.calls: list[StreamedToolCall] = []
+        self._emitted = 0
+
+    def feed(self, fragments) -> list[StreamedToolCall]:
+        for fragment in fragments or []:
+            while len(self.calls) <= fragment.index:
+                self.calls.append(StreamedToolCall(index=len(self.calls)))
+            call = self.calls[fragment.index]
+            if fragment.id:
+                call.id = fragment.id
+            if fragment.function:
+                call.function.name += fragment.function.name or ""
+                call.function.arguments += fragment.function.arguments or ""
+        # Everything before the call currently being written is finished
+        return self._emit(len(self.calls) - 1)
+
+    def finish(self) -> list[StreamedToolCall]:
+        return self._emit(len(self.calls))
+
+    def _emit(self, upto: int) -> list[StreamedToolCall]:
+        ready = self.calls[self._emitted:upto]
+        self._emitted = max(self._emitted, upto)
+        return ready
+
+
+def _assistant_message(content: str, calls: list[StreamedToolCall]) -> dict:
+    message = {"role": "assistant", "content": content or None}
+    if calls:
+        message["tool_calls"] = [call.model_dump() for call in calls]
+    return message
+
+
+def _usage_chunk(chunk, trace) -> None:
+    llm.record_usage(chunk.usage)
+    if chunk.usage:
+        trace.set(prompt_tokens=chunk.usage.prompt_tokens,
+                  completion_tokens=chunk.usage.completion_tokens)
+
+
+def _chunks(request: dict):
+    """Content chunks of a streamed completion, traced as one LLM call."""
+    # detached: this generator's body runs in whatever context consumes it
+    with span("chat_completion", "llm", detached=True, model=request.get("model"), stream=True) as trace:
+        for chunk in llm.open_stream(trace=trace, **request):
+            if chunk.choices:
+                yield chunk
+            else:
+                # Final usage chunk
+                _usage_chunk(chunk, trace)
+
+
+def stream_text(**request):
+    """Yield the content deltas of a completion."""
+    for chunk in _chunks(request):
+        if chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def stream_turn(**request):
+    """
+    Yield ("text", delta) and ("tool_call", call) events while the turn is
+    streamed, then ("message", assistant_message_dict) for the history.
+    """
+    assembler = ToolCallAssembler()
+    content = ""
+    for chunk in _chunks(request):
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content += delta.content
+            yield "text", delta.content
+        for call in assembler.feed(delta.tool_calls):
+            yield "tool_call", call
+    for call in assembler.finish():
+        yield "tool_call", call
+    yield "message", _assistant_message(content, assembler.calls)
+
+
+async def _achunks(request: dict):
+    with span("chat_completion", "llm", detached=True, model=request.get("model"), stream=True) as trace:
+        async for chunk in await llm.aopen_stream(trace=trace, **request):
+            if chunk.choices:
+                yield chunk
+            else:
+                _usage_chunk(chunk, trace)
+
+
+async def astream_text(**request):
+    async for chunk in _achunks(request):
+        if chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def astream_turn(**request):
+    assembler = ToolCallAssembler()
+    content = ""
+    async for chunk in _achunks(request):
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content += delta.content
+            yield "text", delta.content
+        for call in assembler.feed(delta.tool_calls):
+            yield "tool_call", call
+    for call in assembler.finish():
+        yield "tool_call", call
+    yield "message", _assistant_message(content, assembler.calls)
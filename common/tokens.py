@@ -0,0 +1,52 @@
+"""
+Local token counting.
+
+Uses tiktoken when it is installed and falls back to a character-based
+estimate (about 4 characters per token for English, 1.5 for CJK) so the
+agents keep working without it.
+"""
+import json
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except ImportError:
+    _encoding = None
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    cjk = sum(1 for ch in text if "　" <= ch <= "鿿")
+    return int((len(text) - cjk) / 4 + cjk / 1.5) + 1
+
+
+def as_dict(message) -> dict:
+    # Assistant messages with tool_calls are appended as SDK objects
+    if hasattr(message, "model_dump"):
+        return message.model_dump(exclude_none=True)
+    return message
+
+
+def count_message_tokens(messages: list) -> int:
+    total = 0
+    for message in messages:
+        message = as_dict(message)
+        total += MESSAGE_OVERHEAD + count_tokens(message.get("content") or "")
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call["function"]
+            total += count_tokens(function["name"]) + count_tokens(function["arguments"])
+    return total
+
+
+def count_tools_tokens(tools: list | None) -> int:
+    if not tools:
+        return 0
+    # A ToolRegistry schema is counted once, not on every request
+    cached = getattr(tools, "token_count", None)
+    return cached if cached is not None else count_tokens(json.dumps(tools))
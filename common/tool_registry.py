@@ -0,0 +1,216 @@
+"""
+Tool registry: OpenAI tool schemas built from function signatures.
+
+    registry = ToolRegistry()
+
+    @registry.tool
+    def weather_forecast(city: Annotated[str, "The city to get the weather forecast for"]) -> str:
+        \"\"\"Get the weather forecast for a city\"\"\"
+
+Everything is worked out once, at registration: the JSON schema from the
+type hints (Annotated strings become parameter descriptions, the first
+docstring line the tool description), an argument validator per tool,
+the `schema` list passed as tools= (serialized and token-counted once,
+not per request) and the `descriptions` text for planner prompts.
+
+validate() / call() check the model's arguments before the tool runs, so
+a missing, unknown or wrongly typed argument comes back as a
+ToolArgumentError (a TypeError, like calling with bad arguments) without
+spending a tool round trip.
+
+The registry is a name -> function mapping and stands in for the
+available_tools dicts. Assigning to a registered name swaps the
+implementation and keeps the schema (cached_tool wrappers, benchmark mocks).
+"""
+import json
+import types
+import typing
+import inspect
+import functools
+from collections.abc import MutableMapping
+from typing import Annotated, Any, Literal, Union, get_args, get_origin
+
+from common.tokens import count_tokens
+
+
+class ToolArgumentError(TypeError):
+    """The arguments of a tool call do not match the tool's schema."""
+
+
+_TYPES = {
+    str: ("string", lambda v: isinstance(v, str)),
+    # JSON has no int/bool distinction to lose, Python does
+    int: ("integer", lambda v: isinstance(v, int) and not isinstance(v, bool)),
+    float: ("number", lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)),
+    bool: ("boolean", lambda v: isinstance(v, bool)),
+    list: ("array", lambda v: isinstance(v, list)),
+    dict: ("object", lambda v: isinstance(v, dict)),
+    Any: (None, lambda v: True),
+}
+
+
+def _compile_type(annotation) -> tuple[dict, typing.Callable, str]:
+    """(JSON schema, check(value) -> bool, type name for errors) of one annotation."""
+    origin, args = get_origin(annotation), get_args(annotation)
+
+    if origin is Annotated:
+        schema, check, name = _compile_type(args[0])
+        notes = [note for note in args[1:] if isinstance(note, str)]
+        return ({**schema, "description": notes[0]} if notes else schema), check, name
+
+    if origin in (Union, types.UnionType):
+        options = [arg for arg in args if arg is not type(None)]
+        if len(options) != 1:
+            raise TypeError(f"unsupported union {annotation!r}: use X | None")
+        schema, check, name = _compile_type(options[0])
+        return schema, (lambda v: v is None or check(v)), f"{name} or null"
+
+    if origin is Literal:
+        choices = frozenset(args)
+        schema, _, _ = _compile_type(type(args[0]))
+        return {**schema, "enum": list(args)}, (lambda v: v in choices), f"one of {list(args)}"
+
+    if origin in (list, dict):
+        schema, check, name = _compile_type(origin)
+        if origin is list and args:
+            items, item_check, item_name = _compile_type(args[0])
+            return (
+                {**schema, "items": items},
+                lambda v: check(v) and all(item_check(item) for item in v),
+                f"array of {item_name}",
+            )
+        return schema, check, name
+
+    if annotation is inspect.Parameter.empty:
+        annotation = Any
+    if annotation not in _TYPES:
+        raise TypeError(f"unsupported tool parameter type {annotation!r}")
+    json_type, check = _TYPES[annotation]
+    return ({"type": json_type} if json_type else {}), check, json_type or "any"
+
+
+class Tool:
+    """One registered tool: its function, schema and compiled validator."""
+    def __init__(self, fn, name: str | None = None, description: str | None = None):
+        self.fn = fn
+        self.name = name or fn.__name__
+        self.description = description or (inspect.getdoc(fn) or "").split("\n\n")[0].replace("\n", " ")
+
+        hints = typing.get_type_hints(fn, include_extras=True)
+        properties, checks, required = {}, {}, []
+        for param in inspect.signature(fn).parameters.values():
+            if param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+                raise TypeError(f"tool '{self.name}': *args / **kwargs cannot be described to the model")
+            properties[param.name], check, type_name = _compile_type(hints.get(param.name, param.empty))
+            checks[param.name] = (check, type_name)
+            if param.default is param.empty:
+                required.append(param.name)
+
+        self.params = list(properties)
+        self.schema = {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": {"type": "object", "properties": properties, "required": required},
+            },
+        }
+        self._checks = checks
+        self._required = frozenset(required)
+
+    def validate(self, args) -> dict:
+        if not isinstance(args, dict):
+            raise ToolArgumentError(f"'{self.name}' takes a JSON object of arguments, got {type(args).__name__}")
+        missing = self._required - args.keys()
+        if missing:
+            raise ToolArgumentError(f"'{self.name}' is missing required arguments: {sorted(missing)}")
+        for key, value in args.items():
+            if key not in self._checks:
+                raise ToolArgumentError(f"'{self.name}' has no argument '{key}' (takes {self.params})")
+            check, type_name = self._checks[key]
+            if not check(value):
+                raise ToolArgumentError(
+                    f"'{self.name}' argument '{key}' must be {type_name}, got {json.dumps(value)[:80]}"
+                )
+        return args
+
+    def signature(self) -> str:
+        return f"{self.name}({', '.join(self.params)})"
+
+
+class ToolSchema(list):
+    """The tools= payload; serialized and token-counted on first use only."""
+    @functools.cached_property
+    def json(self) -> str:
+        return json.dumps(self)
+
+    @functools.cached_property
+    def token_count(self) -> int:
+        return count_tokens(self.json)
+
+
+class ToolRegistry(MutableMapping):
+    def __init__(self):
+        self._tools: dict[str, Tool] = {}
+
+    def tool(self, fn=None, *, name: str | None = None, description: str | None = None):
+        """Register a function (as a decorator, with or without options); returns it unchanged."""
+        def register(fn):
+            tool = Tool(fn, name, description)
+            self._tools[tool.name] = tool
+            self._invalidate()
+            return fn
+        return register(fn) if fn is not None else register
+
+    @functools.cached_property
+    def schema(self) -> ToolSchema:
+        """The tools= list for chat completions."""
+        return ToolSchema(tool.schema for tool in self._tools.values())
+
+    @functools.cached_property
+    def descriptions(self) -> str:
+        """One `- name(params): description` line per tool, for prompts."""
+        return "\n".join(f"- {tool.signature()}: {tool.description}" for tool in self._tools.values())
+
+    def validate(self, name: str, args) -> dict:
+        if name not in self._tools:
+            raise ToolArgumentError(f"unknown tool '{name}' (available: {list(self._tools)})")
+        return self._tools[name].validate(args)
+
+    def parse(self, name: str, arguments: str | None) -> dict:
+        """The validated arguments of a tool call, from the model's JSON string."""
+        try:
+            args = json.loads(arguments or "{}")
+        except json.JSONDecodeError as e:
+            raise ToolArgumentError(f"invalid JSON arguments for '{name}': {e}") from None
+        return self.validate(name, args)
+
+    def call(self, name: str, arguments: str | dict | None):
+        """Validate, then run. Arguments may be the raw JSON string or a dict."""
+        args = self.validate(name, arguments) if isinstance(arguments, dict) else self.parse(name, arguments)
+        return self._tools[name].fn(**args)
+
+    def _invalidate(self) -> None:
+        self.__dict__.pop("schema", None)
+        self.__dict__.pop("descriptions", None)
+
+    # name -> function mapping
+
+    def __getitem__(self, name: str):
+        return self._tools[name].fn
+
+    def __setitem__(self, name: str, fn) -> None:
+        if name in self._tools:
+            self._tools[name].fn = fn
+        else:
+            self.tool(fn, name=name)
+
+    def __delitem__(self, name: str) -> None:
+        del self._tools[name]
+        self._invalidate()
+
+    def __iter__(self):
+        return iter(self._tools)
+
+    def __len__(self) -> int:
+        return len(self._tools)
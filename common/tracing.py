@@ -0,0 +1,287 @@
+"""
+Lightweight tracing shared by all agents.
+
+Spans for queries, LLM calls, tool calls, parsing, retries and replans,
+each with a duration and free-form fields (tokens, cache_hit, retries,
+...). Parents follow the current thread / asyncio task through a
+contextvar. Disabled by default, in which case span() costs one attribute
+lookup; set AGENT_TRACE=trace.json (or call tracer.enable()) to collect.
+
+    AGENT_TRACE=trace.json python "3. Error Handling/3.1 error-handling.py"
+
+writes a Chrome trace (open in chrome://tracing or ui.perfetto.dev) at exit
+and prints where the wall-clock time of each query went.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import asyncio
+import inspect
+import functools
+import itertools
+import weakref
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+
+# Time is attributed to the first of these that is active at each instant;
+# the rest of a query's wall time is "other" (agent code, printing, ...)
+BREAKDOWN = ("retry", "llm", "tool", "parse")
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    span_id: int
+    parent_id: int | None
+    root_id: int
+    track: int
+    start: float
+    end: float = 0.0
+    attrs: dict = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def set_default(self, **attrs) -> None:
+        for key, value in attrs.items():
+            self.attrs.setdefault(key, value)
+
+
+class _NullSpan:
+    def set(self, **attrs) -> None:
+        pass
+
+    def set_default(self, **attrs) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.spans: list[Span] = []
+        self._by_root: dict[int, list[Span]] = {}
+        self._ids = itertools.count(1)
+        # Keyed weakly by the task or thread itself: finished ones drop out, and
+        # an id() reused by a later task cannot inherit an old track
+        self._tracks = weakref.WeakKeyDictionary()
+        self._track_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+            self._by_root.clear()
+
+    def span(self, name: str, category: str = "agent", detached: bool = False, **attrs):
+        """
+        Context manager timing the block. With detached=True the span does
+        not become the parent of spans opened inside the block; use it in
+        generators, whose body runs in the caller's context.
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return self._span(name, category, detached, attrs)
+
+    @contextmanager
+    def _span(self, name: str, category: str, detached: bool, attrs: dict):
+        parent = _current.get()
+        span_id = next(self._ids)
+        span = Span(
+            name=name,
+            category=category,
+            span_id=span_id,
+            parent_id=parent.span_id if parent else None,
+            root_id=parent.root_id if parent else span_id,
+            track=self._track(),
+            start=time.perf_counter(),
+            attrs=attrs,
+        )
+        token = None if detached else _current.set(span)
+        try:
+            yield span
+        except GeneratorExit:
+            # A traced generator closed early: not an error
+            raise
+        except BaseException as e:
+            span.attrs["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.perf_counter()
+            if token is not None:
+                _current.reset(token)
+            with self._lock:
+                self.spans.append(span)
+                self._by_root.setdefault(span.root_id, []).append(span)
+
+    def current(self):
+        """The innermost open span (NULL_SPAN if none)."""
+        return _current.get() or NULL_SPAN
+
+    def annotate(self, **attrs) -> None:
+        """Add fields to the innermost open span, if any."""
+        self.current().set(**attrs)
+
+    def _track(self) -> int:
+        # One track per asyncio task or thread: spans on a track nest properly
+        try:
+            owner = asyncio.current_task() or threading.current_thread()
+        except RuntimeError:
+            owner = threading.current_thread()
+        with self._lock:
+            track = self._tracks.get(owner)
+            if track is None:
+                track = self._tracks[owner] = next(self._track_ids)
+            return track
+
+    # ---------------- export ----------------
+
+    def export_chrome(self, path: str) -> None:
+        """Chrome trace event format (complete events, microseconds)."""
+        pid = os.getpid()
+        events = [
+            {
+                "name": s.name,
+                "cat": s.category,
+                "ph": "X",
+                "ts": round((s.start - self._origin) * 1e6, 1),
+                "dur": round(s.duration * 1e6, 1),
+                "pid": pid,
+                "tid": s.track,
+                "args": s.attrs,
+            }
+            for s in sorted(self.spans, key=lambda s: s.start)
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    def export_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([asdict(s) for s in self.spans], f, default=str, indent=1)
+
+    # ---------------- report ----------------
+
+    def breakdown(self, root: Span) -> dict:
+        """Wall-clock seconds of `root` per BREAKDOWN category, plus "other"."""
+        events = []
+        for s in self._by_root.get(root.root_id, []):
+            if s is not root and s.category in BREAKDOWN:
+                start, end = max(s.start, root.start), min(s.end, root.end)
+                if end > start:
+                    events += [(start, 1, s.category), (end, -1, s.category)]
+        events.sort(key=lambda e: (e[0], e[1]))
+
+        active = dict.fromkeys(BREAKDOWN, 0)
+        totals = dict.fromkeys(BREAKDOWN + ("other",), 0.0)
+        last = root.start
+        for at, change, category in events:
+            owner = next((c for c in BREAKDOWN if active[c]), "other")
+            totals[owner] += at - last
+            active[category] += change
+            last = at
+        totals["other"] += root.end - last
+        return totals
+
+    def summary(self) -> str:
+        roots = sorted(
+            (s for s in self.spans if s.category == "query" and s.parent_id is None),
+            key=lambda s: s.start,
+        )
+        lines = []
+        for root in roots:
+            spans = self._by_root[root.root_id]
+            llm = [s for s in spans if s.category == "llm"]
+            tools = [s for s in spans if s.category == "tool"]
+            tokens = sum(s.attrs.get("prompt_tokens", 0) + s.attrs.get("completion_tokens", 0) for s in llm)
+            parts = ", ".join(
+                f"{name} {seconds:.2f}s ({seconds / root.duration:.0%})"
+                for name, seconds in self.breakdown(root).items() if seconds > 0
+            ) if root.duration else ""
+            label = str(root.attrs.get("query", root.name))[:60]
+            lines.append(
+                f"{label!r}: {root.duration:.2f}s = {parts}\n"
+                f"    {len(llm)} LLM calls ({sum(bool(s.attrs.get('cache_hit')) for s in llm)} cached, "
+                f"{sum(s.attrs.get('retries', 0) for s in llm)} retries, {tokens} tokens), "
+                f"{len(tools)} tool calls, "
+                f"{sum(s.category == 'replan' for s in spans)} replans"
+            )
+        return "\n".join(lines) or "no queries traced"
+
+
+tracer = Tracer()
+span = tracer.span
+annotate = tracer.annotate
+current_span = tracer.current
+
+
+def traced(category: str = "agent", name: str | None = None, query_arg: str | None = None):
+    """
+    Decorator form of span() for plain and async functions. With
+    query_arg, that argument is recorded as the span's "query" field
+    (use it with category="query" on an agent's per-request entry point).
+    """
+    def decorator(fn):
+        label = name or fn.__name__
+        signature = inspect.signature(fn)
+
+        def attrs(args, kwargs) -> dict:
+            if not query_arg:
+                return {}
+            return {"query": signature.bind_partial(*args, **kwargs).arguments.get(query_arg)}
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await fn(*args, **kwargs)
+                with tracer.span(label, category, **attrs(args, kwargs)):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return fn(*args, **kwargs)
+            with tracer.span(label, category, **attrs(args, kwargs)):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def _export_at_exit(path: str) -> None:
+    if not tracer.spans:
+        return
+    if path.endswith(".spans.json"):
+        tracer.export_json(path)
+    else:
+        tracer.export_chrome(path)
+    print(f"\n[trace] {len(tracer.spans)} spans written to {path}\n{tracer.summary()}", file=sys.stderr)
+
+
+if os.getenv("AGENT_TRACE"):
+    tracer.enable()
+    atexit.register(_export_at_exit, os.environ["AGENT_TRACE"])
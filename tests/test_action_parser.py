@@ -0,0 +1,69 @@
+import os
+import json
+
+import pytest
+
+from common.loader import ROOT, load_script
+
+m = load_script("3. Error Handling/3.1 error-handling.py")
+
+
+def corpus():
+    with open(os.path.join(ROOT, "3. Error Handling", "parse_corpus.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.mark.parametrize("case", corpus(), ids=lambda case: case["case"])
+def test_action_parser_corpus(case):
+    codes = {code.value for code in m.ParseErrorCode}
+    if case["expect"] in codes:
+        with pytest.raises(m.ActionParseError) as raised:
+            m.parse_llm_response(case["output"])
+        assert raised.value.code.value == case["expect"]
+    else:
+        parsed = m.parse_llm_response(case["output"])
+        got = "finish" if parsed.action == "finish" or parsed.final_answer else parsed.action
+        assert got == case["expect"]
+
+
+def test_action_parser_repairs():
+    parsed = m.parse_llm_response(
+        "Sure! {'thought': 'search', 'action': 'web_search', "
+        "'action_input': {'query': 'F1', 'exact': True,},}"
+    )
+    assert parsed.action == "web_search"
+    assert parsed.action_input == {"query": "F1", "exact": True}
+
+
+def test_action_parser_last_action_wins():
+    text = (
+        'Example: {"action": "calculator", "action_input": {"expression": "1"}}\n'
+        'Mine: {"thought": "t", "action": "web_search", "action_input": {"query": "x"}}'
+    )
+    assert m.parse_llm_response(text).action == "web_search"
+
+
+def test_action_parser_error_codes():
+    cases = {
+        "I am not sure what to do.": m.ParseErrorCode.NO_ACTION,
+        '{"thought": "t", "action": "web_search", "action_input": {"query": ': m.ParseErrorCode.TRUNCATED,
+        '{"thought": "no action here"}': m.ParseErrorCode.MISSING_ACTION,
+        '{"action": "web_search", "action_input": "F1"}': m.ParseErrorCode.BAD_ACTION_INPUT,
+    }
+    for text, code in cases.items():
+        with pytest.raises(m.ActionParseError) as raised:
+            m.parse_llm_response(text)
+        assert raised.value.code is code, text
+        assert isinstance(raised.value, ValueError)
+
+
+def test_action_parser_final_answer_line():
+    parsed = m.parse_llm_response("Thinking done.\nFinal Answer: 42")
+    assert parsed.action is None
+    assert parsed.final_answer == "42"
+
+
+def test_action_parser_final_answer_quoting_json():
+    parsed = m.parse_llm_response('Final Answer: the config is {"debug": true}')
+    assert parsed.action is None
+    assert parsed.final_answer == 'the config is {"debug": true}'
@@ -0,0 +1,67 @@
+from openai.types.chat import ChatCompletion
+
+from common.cache import ResponseCache, cache_key, is_cacheable
+
+
+def completion(text):
+    return ChatCompletion.model_validate({
+        "id": "c", "object": "chat.completion", "created": 0, "model": "m",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": text}}],
+    })
+
+
+REQUEST = {"model": "m", "messages": [{"role": "user", "content": "hi"}]}
+
+
+def test_key_is_canonical():
+    assert cache_key(model="m", messages=[]) == cache_key(messages=[], model="m")
+    assert cache_key(model="m", messages=[]) != cache_key(model="n", messages=[])
+
+
+def test_sampled_requests_are_not_cacheable():
+    assert is_cacheable({"temperature": 0})
+    assert not is_cacheable({"temperature": 0.7})
+    assert not is_cacheable({"n": 2})
+    assert not is_cacheable({"stream": True})
+
+
+def test_memory_hit():
+    cache, calls = ResponseCache(), []
+    create = lambda **request: calls.append(request) or completion("hello")
+    first = cache.get_or_create(create, **REQUEST)
+    second = cache.get_or_create(create, **REQUEST)
+    assert first is second and len(calls) == 1
+    assert cache.stats["memory_hits"] == 1 and cache.stats["misses"] == 1
+
+
+def test_bypass():
+    cache, calls = ResponseCache(), []
+    create = lambda **request: calls.append(request) or completion("hello")
+    cache.get_or_create(create, temperature=1.0, **REQUEST)
+    cache.get_or_create(create, temperature=1.0, **REQUEST)
+    cache.get_or_create(create, cache=False, **REQUEST)
+    cache.enabled = False
+    cache.get_or_create(create, **REQUEST)
+    assert len(calls) == 4 and cache.stats["bypassed"] == 4
+
+
+def test_lru_and_ttl():
+    cache = ResponseCache(max_entries=1, ttl=60)
+    cache.put("a", completion("a"))
+    cache.put("b", completion("b"))
+    assert cache.get("a") is None and cache.get("b") is not None
+    expired = ResponseCache(ttl=0)
+    expired.put("a", completion("a"))
+    assert expired.get("a") is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    ResponseCache(path=path).put("k", completion("from disk"))
+    reloaded = ResponseCache(path=path)
+    response = reloaded.get("k")
+    assert response.choices[0].message.content == "from disk"
+    assert reloaded.stats["disk_hits"] == 1
+    reloaded.get("k")
+    assert reloaded.stats["memory_hits"] == 1
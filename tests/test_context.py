@@ -0,0 +1,73 @@
+import time
+import asyncio
+
+import pytest
+
+from common.context import ContextManager
+
+
+HISTORY = [{"role": "system", "content": "system"}] + [
+    {"role": "user" if i % 2 == 0 else "assistant", "content": "word " * 50} for i in range(20)
+]
+
+
+def test_context_within_budget_is_untouched():
+    context = ContextManager(max_tokens=100_000, summarizer=lambda *a: "unused")
+    assert context.build(HISTORY) == HISTORY
+
+
+def test_context_summarizes_each_message_once():
+    summarized = []
+
+    def summarizer(summary, new_messages):
+        summarized.append(len(new_messages))
+        return "summary"
+
+    context = ContextManager(max_tokens=200, keep_recent=4, summarizer=summarizer)
+    sent = context.build(HISTORY)
+    assert sent[0]["content"] == "system"
+    assert "summary" in sent[1]["content"]
+    assert sent[2:] == HISTORY[-4:]
+    sent = context.build(HISTORY + HISTORY[1:3])
+    assert summarized == [16, 2]
+
+
+def test_abuild_does_not_block_the_event_loop():
+    def slow(summary, new_messages):
+        time.sleep(0.2)
+        return "summary"
+
+    async def main():
+        context = ContextManager(max_tokens=200, summarizer=slow)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            for _ in range(5):
+                await asyncio.sleep(0.02)
+                ticks += 1
+
+        sent, _ = await asyncio.gather(context.abuild(HISTORY), ticker())
+        return context, sent, ticks
+
+    context, sent, ticks = asyncio.run(main())
+    assert ticks == 5 and context.summary == "summary"
+    assert sent == ContextManager(max_tokens=200, summarizer=slow).build(HISTORY)
+
+
+def test_abuild_awaits_async_summarizer():
+    async def summarize(summary, new_messages):
+        return f"{len(new_messages)} messages"
+
+    context = ContextManager(max_tokens=200, keep_recent=4, summarizer=None, asummarizer=summarize)
+    asyncio.run(context.abuild(HISTORY))
+    assert context.summary == "16 messages"
+
+
+def test_keep_recent_zero_compacts_everything():
+    context = ContextManager(max_tokens=50, keep_recent=0, summarizer=lambda summary, new: "summary")
+    history = HISTORY + [{"role": "tool", "tool_call_id": "1", "content": "result"}]
+    sent = context.build(history)
+    assert [m["content"] for m in sent] == ["system", "Summary of the earlier conversation:\nsummary"]
+    with pytest.raises(ValueError):
+        ContextManager(keep_recent=-1)
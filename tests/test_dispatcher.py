@@ -0,0 +1,51 @@
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+
+from common.dispatcher import ToolDispatcher
+
+
+def call(name, i, **args):
+    return SimpleNamespace(id=f"call_{i}", function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+
+
+def echo(text: str, delay: float = 0.0) -> str:
+    time.sleep(delay)
+    return text
+
+
+def test_results_keep_call_order_and_run_concurrently():
+    dispatcher = ToolDispatcher({"echo": echo}, max_workers=4)
+    calls = [call("echo", i, text=str(i), delay=0.05 * (3 - i)) for i in range(3)]
+    started = time.perf_counter()
+    results = dispatcher.dispatch(calls)
+    assert [r.content for r in results] == ["0", "1", "2"]
+    assert [r.tool_call_id for r in results] == ["call_0", "call_1", "call_2"]
+    assert time.perf_counter() - started < 0.25
+
+
+def test_adispatch_matches_dispatch():
+    dispatcher = ToolDispatcher({"echo": echo})
+    calls = [call("echo", i, text=str(i)) for i in range(3)]
+    results = asyncio.run(dispatcher.adispatch(calls))
+    assert [r.message() for r in results] == [
+        {"role": "tool", "tool_call_id": f"call_{i}", "content": str(i)} for i in range(3)
+    ]
+
+
+def test_errors_become_results():
+    def down(text: str) -> str:
+        raise ConnectionError("backend down")
+
+    dispatcher = ToolDispatcher({"echo": echo, "down": down})
+    results = dispatcher.dispatch([
+        call("down", 0, text="x"),
+        call("nope", 1, text="x"),
+        SimpleNamespace(id="call_2", function=SimpleNamespace(name="echo", arguments="{not json")),
+        call("echo", 3, text="fine"),
+    ])
+    assert results[0].content == "Error: backend down"
+    assert results[1].content == "Error: unknown tool 'nope'"
+    assert results[2].content.startswith("Error: invalid JSON arguments")
+    assert results[3].content == "fine"
@@ -0,0 +1,109 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from common.loader import load_script
+
+m = load_script("2. Plan-and-Execute/2.3 LLMCompiler.py")
+
+PLAN = """Plan: Weather in both cities.
+#E1 = weather_forecast("Tokyo")
+#E2 = weather_forecast("Osaka")
+Plan: Compare them.
+#E3 = web_search("compare #E1 and #E2")
+#E4 = web_search("#E9 is not a task yet")
+"""
+
+
+@pytest.fixture
+def echo_tools(monkeypatch):
+    calls = []
+
+    def run_tool(tool_name, arg):
+        calls.append(arg)
+        if arg.startswith("slow"):
+            time.sleep(0.05)
+        return f"<{arg}>"
+
+    monkeypatch.setattr(m, "run_tool", run_tool)
+    return calls
+
+
+def task(task_id, arg, deps=()):
+    return m.Task(id=task_id, thought="", tool="t", arg=arg, deps=set(deps))
+
+
+def test_plan_parser_dependencies():
+    parser = m.PlanParser()
+    tasks = parser.feed(PLAN) + parser.close()
+    assert [(t.id, t.tool, t.arg, t.deps) for t in tasks] == [
+        ("#E1", "weather_forecast", "Tokyo", set()),
+        ("#E2", "weather_forecast", "Osaka", set()),
+        ("#E3", "web_search", "compare #E1 and #E2", {"#E1", "#E2"}),
+        ("#E4", "web_search", "#E9 is not a task yet", set()),
+    ]
+    assert tasks[2].thought == "Compare them."
+    assert m.critical_path(tasks) == 2
+
+
+def test_plan_parser_streamed_chunks_and_last_line():
+    parser = m.PlanParser()
+    text = PLAN.rstrip("\n")
+    tasks = []
+    for i in range(0, len(text), 5):
+        tasks += parser.feed(text[i:i + 5])
+    tasks += parser.close()
+    assert [t.id for t in tasks] == ["#E1", "#E2", "#E3", "#E4"]
+
+
+def test_substitute_is_single_pass():
+    assert m.substitute("#E1 #E12", {"#E1": "a", "#E12": "b"}) == "a b"
+
+
+def test_scheduler_runs_dependencies_first(echo_tools):
+    tasks = [task("#E1", "slow 1"), task("#E2", "2"), task("#E3", "#E1 + #E2", {"#E1", "#E2"})]
+    evidence = m.execute_threaded(tasks)
+    assert evidence["#E3"] == "<<slow 1> + <2>>"
+    assert echo_tools.index("<slow 1> + <2>") == 2
+
+
+def test_scheduler_survives_inline_completion(echo_tools, caplog):
+    # E2 and E3 both wait for E1; E2's future is already done when its
+    # callback is attached, so _on_done runs inline, re-entering the scheduler
+    release = threading.Event()
+
+    class Pool:
+        def submit(self, fn, tool_name, arg):
+            future = Future()
+            if arg == "1":
+                threading.Thread(target=lambda: (release.wait(), future.set_result(fn(tool_name, arg)))).start()
+            else:
+                future.set_result(fn(tool_name, arg))
+            return future
+
+        def shutdown(self):
+            pass
+
+    tfu = m.TaskFetchingUnit()
+    tfu._pool = Pool()
+    tfu.submit(task("#E1", "1"))
+    tfu.submit(task("#E2", "#E1 two", {"#E1"}))
+    tfu.submit(task("#E3", "#E1 three", {"#E1"}))
+    tfu.close()
+    release.set()
+
+    done = threading.Thread(target=tfu.join, daemon=True)
+    done.start()
+    done.join(2)
+    assert not done.is_alive(), "join() never woke up"
+    assert tfu.evidence == {"#E1": "<1>", "#E2": "<<1> two>", "#E3": "<<1> three>"}
+    # A callback that raises is only logged by concurrent.futures
+    assert not [r for r in caplog.records if r.name == "concurrent.futures"]
+
+
+def test_async_executor_matches_threaded(echo_tools):
+    tasks = [task("#E1", "slow 1"), task("#E2", "2"), task("#E3", "#E1 + #E2", {"#E1", "#E2"})]
+    assert asyncio.run(m.execute_async(tasks)) == m.execute_threaded(tasks)
@@ -0,0 +1,64 @@
+import time
+import threading
+
+import pytest
+
+from common.memo import cached_tool, tool_cache_stats
+
+
+def test_memo_hits_and_normalizes():
+    calls = []
+
+    @cached_tool(ttl=60)
+    def search(query: str) -> str:
+        calls.append(query)
+        return f"results for {query}"
+
+    assert search("a  b") == search(query="a b") == "results for a  b"
+    assert calls == ["a  b"]
+    assert search.stats["hits"] == 1 and search.stats["misses"] == 1
+
+
+def test_memo_expires_evicts_and_skips_errors():
+    calls = []
+
+    @cached_tool(ttl=0.05, max_entries=1)
+    def tool(x: int) -> int:
+        calls.append(x)
+        if x < 0:
+            raise ValueError("negative")
+        return x
+
+    tool(1)
+    tool(2)                      # evicts 1
+    tool(1)
+    assert calls == [1, 2, 1]
+    time.sleep(0.06)
+    tool(1)
+    assert calls == [1, 2, 1, 1]
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            tool(-1)
+    assert calls.count(-1) == 2
+
+
+def test_memo_deduplicates_in_flight_calls():
+    calls, started = [], threading.Event()
+
+    @cached_tool()
+    def slow(x: int) -> int:
+        calls.append(x)
+        started.set()
+        time.sleep(0.05)
+        return x * 2
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(slow(3)))
+    first.start()
+    started.wait()
+    second = threading.Thread(target=lambda: results.append(slow(3)))
+    second.start()
+    first.join()
+    second.join()
+    assert results == [6, 6] and calls == [3]
+    assert tool_cache_stats({"slow": slow})["slow"]["deduplicated"] == 1
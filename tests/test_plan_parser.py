@@ -0,0 +1,49 @@
+import pytest
+
+from common.loader import load_agent
+
+rewoo = load_agent("rewoo")
+
+PLAN = """Plan: Look up the weather in Tokyo.
+#E1 = weather_forecast("Tokyo")
+Plan: Search for things to do, given the weather.
+#E2 = web_search("what's on in Tokyo (indoor, outdoor), given #E1")
+Plan: Work it out.
+#E3 = calculator(2 * (3 + 4))
+"""
+
+
+def steps_of(parser, chunks):
+    steps = []
+    for chunk in chunks:
+        steps += parser.feed(chunk)
+    return steps + parser.close()
+
+
+def test_plan_parser_whole_text():
+    steps = steps_of(rewoo.PlanParser(), [PLAN])
+    assert [(s["id"], s["tool"], s["arg"]) for s in steps] == [
+        ("#E1", "weather_forecast", "Tokyo"),
+        ("#E2", "web_search", "what's on in Tokyo (indoor, outdoor), given #E1"),
+        ("#E3", "calculator", "2 * (3 + 4)"),
+    ]
+    assert steps[0]["thought"] == "Look up the weather in Tokyo."
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_plan_parser_any_chunking(size):
+    whole = steps_of(rewoo.PlanParser(), [PLAN])
+    chunks = [PLAN[i:i + size] for i in range(0, len(PLAN), size)]
+    assert steps_of(rewoo.PlanParser(), chunks) == whole
+
+
+def test_plan_parser_emits_step_once_closed():
+    parser = rewoo.PlanParser()
+    assert parser.feed('#E1 = web_search("a (b') == []
+    assert [s["arg"] for s in parser.feed(')")\n')] == ["a (b)"]
+
+
+def test_plan_parser_drops_unterminated_call():
+    text = '#E1 = web_search("open (\n#E2 = calculator(1 + 1)\n'
+    steps = steps_of(rewoo.PlanParser(), [text])
+    assert [(s["id"], s["arg"]) for s in steps] == [("#E2", "1 + 1")]
@@ -0,0 +1,25 @@
+from common.loader import load_agent
+from common.prompts import Prompt
+
+plan_execute = load_agent("plan-and-execute")
+
+
+def test_prompt_formats_once_and_keeps_prefix_stable():
+    prompt = Prompt("You can use: {tools}. Braces in examples stay: {{}}", tools="search")
+    first = prompt.messages("q1", context="Step 1: a")
+    second = prompt.messages("q2", context="Step 1: a\nStep 2: b")
+    assert first[0] == second[0] == {"role": "system", "content": "You can use: search. Braces in examples stay: {}"}
+    assert first[1]["content"] == "Step 1: a\n\nq1"
+    assert Prompt("{literal}").messages("q") == [
+        {"role": "system", "content": "{literal}"},
+        {"role": "user", "content": "q"},
+    ]
+
+
+def test_plan_and_execute_prefix_does_not_change_with_results():
+    context = plan_execute.PlanContext()
+    before = plan_execute.EXECUTOR.messages("step 2", context=context.render("step 2"))
+    context.add("step 1", "result 1")
+    after = plan_execute.EXECUTOR.messages("step 2", context=context.render("step 2"))
+    assert before[0] == after[0]
+    assert "result 1" in after[1]["content"]
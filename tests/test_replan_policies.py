@@ -0,0 +1,48 @@
+import pytest
+
+from common.loader import load_agent
+
+m = load_agent("plan-and-execute")
+
+
+def decisions(policy, results):
+    return [policy.check(i + 1, result, ["next"]) for i, result in enumerate(results)]
+
+
+def test_policies_decide_and_count():
+    results = ["sunny, 25C", "Error: search timed out", "ok", "Failed after 3 attempts: down"]
+    assert decisions(m.ReplanPolicy(), results) == [True] * 4
+    assert decisions(m.NeverReplan(), results) == [False] * 4
+    assert decisions(m.EveryNSteps(2), results) == [False, True, False, True]
+    assert decisions(m.OnError(), results) == [False, True, False, True]
+    assert decisions(m.HeuristicGate(), results) == [False, True, True, True]
+
+    policy = m.EveryNSteps(3)
+    decisions(policy, results)
+    assert (policy.name, policy.calls, policy.skipped) == ("every-3", 1, 3)
+
+
+def test_benchmark_policies_includes_policies_added_later(monkeypatch, capsys):
+
+    class AddedLater(m.ReplanPolicy):
+        name = "added-later"
+
+    seen = []
+    monkeypatch.setattr(m, "run_query", lambda query, policy: seen.append(policy.name))
+    monkeypatch.setitem(m.REPLAN_POLICIES, "added-later", AddedLater)
+    m.benchmark_policies(["q"])
+    assert seen[-1] == "added-later"
+    assert "added-later" in capsys.readouterr().out
+
+
+def test_benchmark_policies_restores_cache_on_error(monkeypatch):
+
+    def run_query(query, policy):
+        assert not m.response_cache.enabled
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(m, "run_query", run_query)
+    monkeypatch.setattr(m.response_cache, "enabled", True)
+    with pytest.raises(RuntimeError):
+        m.benchmark_policies(["q"], ["always"])
+    assert m.response_cache.enabled
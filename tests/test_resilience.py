@@ -0,0 +1,184 @@
+import json
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from common.dispatcher import ToolDispatcher
+from common.resilience import (
+    BreakerState, Bulkhead, BulkheadFull, CircuitOpen, ToolBreaker,
+    configure_tool, new_scope, tool_guard,
+)
+
+
+def breaker(**options):
+    return ToolBreaker("t", **{"min_calls": 4, "failure_rate": 0.5, "cooldown": 0.05, **options})
+
+
+def test_breaker_stays_closed_below_min_calls():
+    b = breaker()
+    for _ in range(3):
+        b.record(False)
+    assert b.state is BreakerState.CLOSED
+    b.allow()
+
+
+def test_breaker_opens_on_failure_rate():
+    b = breaker()
+    for ok in (True, False, True, False):
+        b.record(ok)
+    assert b.state is BreakerState.OPEN
+    with pytest.raises(CircuitOpen):
+        b.allow()
+    assert b.stats == {"rejected": 1, "opened": 1}
+
+
+def test_breaker_half_open_probe_closes():
+    b = breaker(probes=1)
+    for _ in range(4):
+        b.record(False)
+    time.sleep(0.06)
+    assert b.state is BreakerState.HALF_OPEN
+    b.allow()                    # the probe
+    with pytest.raises(CircuitOpen):
+        b.allow()                # only one probe at a time
+    b.record(True)
+    assert b.state is BreakerState.CLOSED
+    assert b.error_rate() == (0, 0.0)
+
+
+def test_breaker_failed_probe_reopens():
+    b = breaker()
+    for _ in range(4):
+        b.record(False)
+    time.sleep(0.06)
+    b.allow()
+    b.record(False)
+    assert b.state is BreakerState.OPEN
+    assert b.stats["opened"] == 2
+
+
+def test_breaker_cancelled_probe_is_given_back():
+    b = breaker()
+    for _ in range(4):
+        b.record(False)
+    time.sleep(0.06)
+    b.allow()
+    b.cancel()
+    b.allow()
+
+
+def test_breaker_ignores_late_results_while_open():
+    b = breaker()
+    for _ in range(4):
+        b.record(False)
+    b.record(True)
+    assert b.state is BreakerState.OPEN
+
+
+def test_bulkhead_queues_then_rejects():
+    bulkhead = Bulkhead("t", max_concurrent=1, max_waiting=1)
+    assert bulkhead.slot().done()
+    queued = bulkhead.slot()
+    assert not queued.done()
+    with pytest.raises(BulkheadFull):
+        bulkhead.slot()
+    bulkhead.release()           # handed straight to the waiter
+    assert queued.done() and bulkhead.active == 1
+    bulkhead.release()
+    assert bulkhead.active == 0
+
+
+def test_bulkhead_acquire_times_out():
+    bulkhead = Bulkhead("t", max_concurrent=1, wait_timeout=0.05)
+    bulkhead.acquire()
+    with pytest.raises(BulkheadFull):
+        bulkhead.acquire()
+    assert bulkhead.active == 1
+
+
+def test_guard_caps_concurrency():
+    scope = new_scope("test")
+    configure_tool("slow", scope, max_concurrent=2)
+    guard = tool_guard("slow", scope)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def slow():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    threads = [threading.Thread(target=guard.call, args=(slow,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+
+
+def test_guard_bad_arguments_do_not_count_as_failures():
+    guard = tool_guard("typed", new_scope("test"))
+    for _ in range(20):
+        with pytest.raises(TypeError):
+            guard.call(lambda: (_ for _ in ()).throw(TypeError("bad")))
+    assert guard.breaker.state is BreakerState.CLOSED
+
+
+def test_scopes_are_isolated():
+    flaky, steady = new_scope("test"), new_scope("test")
+    configure_tool("web_search", flaky, min_calls=2)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            tool_guard("web_search", flaky).call(lambda: (_ for _ in ()).throw(ConnectionError()))
+    assert tool_guard("web_search", flaky).breaker.state is BreakerState.OPEN
+    assert tool_guard("web_search", steady).breaker.state is BreakerState.CLOSED
+    assert tool_guard("web_search", steady).bulkhead.max_concurrent == 8
+
+
+# Dispatcher guards
+
+def tool_call(name, i, **args):
+    return SimpleNamespace(id=f"call_{i}", function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+
+
+def test_dispatcher_open_circuit_rejects_without_running():
+    ran = []
+
+    def down(text: str) -> str:
+        ran.append(text)
+        raise ConnectionError("down")
+
+    dispatcher = ToolDispatcher({"down": down})
+    configure_tool("down", dispatcher.scope, min_calls=2)
+    dispatcher.dispatch([tool_call("down", i, text=str(i)) for i in range(2)])
+    assert tool_guard("down", dispatcher.scope).breaker.state is BreakerState.OPEN
+    result = dispatcher.dispatch([tool_call("down", 9, text="9")])[0]
+    assert "circuit" in result.content and ran == ["0", "1"]
+
+
+def test_dispatcher_tool_limits_are_local():
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def tracked(text: str) -> str:
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.03)
+        with lock:
+            running[0] -= 1
+        return text
+
+    limited = ToolDispatcher({"echo": tracked}, max_workers=8, tool_limits={"echo": 1})
+    other = ToolDispatcher({"echo": tracked}, max_workers=8)
+    assert tool_guard("echo", limited.scope).bulkhead.max_concurrent == 1
+    assert tool_guard("echo", other.scope).bulkhead.max_concurrent == 8
+
+    limited.dispatch([tool_call("echo", i, text=str(i)) for i in range(4)])
+    assert peak[0] == 1
+    peak[0] = 0
+    other.dispatch([tool_call("echo", i, text=str(i)) for i in range(4)])
+    assert peak[0] > 1
@@ -0,0 +1,104 @@
+import time
+import threading
+
+import pytest
+
+from common.memo import cached_tool
+from common.resilience import tool_guard
+from common.retry import RetryEngine, backoff_delay
+
+
+def test_backoff_delay():
+    for attempt in range(6):
+        assert 0 <= backoff_delay(attempt, base=0.5, cap=4) <= min(4, 0.5 * 2 ** attempt)
+    assert 2.0 <= backoff_delay(0, server_delay=2.0) <= 2.25
+
+
+def test_memo_fresh_runs_again_while_in_flight():
+    release = threading.Event()
+    calls = []
+
+    @cached_tool()
+    def tool(x: int) -> int:
+        calls.append(x)
+        if len(calls) == 1:
+            release.wait(1)
+        return x
+
+    hung = threading.Thread(target=tool, args=(1,))
+    hung.start()
+    while not calls:
+        time.sleep(0.001)
+    assert tool.fresh(1) == 1
+    assert calls == [1, 1]
+    assert tool(1) == 1          # cached by the fresh call
+    release.set()
+    hung.join()
+
+
+def test_retry_backs_off_until_success():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("down")
+        return "ok"
+
+    engine = RetryEngine(attempts=3, base=0.001, hedge_quantile=None)
+    assert engine.call("flaky", flaky) == "ok"
+    assert engine.stats["retries"] == 2 and engine.stats["failures"] == 0
+
+
+def test_retry_gives_up_and_respects_retry_on():
+    engine = RetryEngine(attempts=3, base=0.001, hedge_quantile=None,
+                         retry_on=lambda e: not isinstance(e, TypeError))
+    with pytest.raises(TypeError):
+        engine.call("bad", lambda: (_ for _ in ()).throw(TypeError("bad")))
+    assert engine.stats["attempts"] == 1
+
+
+def test_retry_after_timeout_bypasses_memo_dedup():
+    calls = []
+
+    @cached_tool()
+    def search(query: str) -> str:
+        calls.append(query)
+        if len(calls) == 1:
+            time.sleep(0.5)      # the first execution hangs
+        return f"results for {query}"
+
+    engine = RetryEngine(attempts=3, base=0.001, timeout=0.1, hedge_quantile=None)
+    assert engine.call("search", search, query="x") == "results for x"
+    assert len(calls) == 2
+    assert engine.stats["timeouts"] == 1
+
+
+def test_hedge_bypasses_memo_dedup():
+    calls = []
+
+    @cached_tool()
+    def search(query: str) -> str:
+        calls.append(query)
+        if query == "slow" and calls.count("slow") == 1:
+            time.sleep(0.5)
+        return query
+
+    engine = RetryEngine(attempts=1, hedge_quantile=50, timeout=2)
+    # Enough fast history for a hedging threshold
+    for i in range(25):
+        engine.call("search", search, query=f"fast {i}")
+    started = time.perf_counter()
+    assert engine.call("search", search, query="slow") == "slow"
+    assert time.perf_counter() - started < 0.4
+    assert engine.stats["hedge_wins"] == 1
+
+
+def test_timed_out_attempt_is_recorded_once():
+    engine = RetryEngine(attempts=1, timeout=0.05, hedge_quantile=None, guarded=True)
+    with pytest.raises(TimeoutError):
+        engine.call("slow", time.sleep, 0.15)
+    breaker = tool_guard("slow", engine.scope).breaker
+    assert breaker.error_rate() == (0, 0.0)    # still running: nothing recorded yet
+    time.sleep(0.2)
+    assert breaker.error_rate() == (1, 0.0)    # its real outcome, once
@@ -0,0 +1,159 @@
+import os
+
+import pytest
+
+from common.loader import load_script
+from common.sessions import OFFSET, SessionLog, SessionStore, resume
+
+agent = load_script("3. Error Handling/3.1 error-handling.py")
+
+
+def messages(n, start=0):
+    return [{"role": "user", "content": f"message {i}"} for i in range(start, start + n)]
+
+
+def contents(records):
+    return [record["content"] for record in records]
+
+
+def test_append_tail_slice(tmp_path):
+    log = SessionLog(str(tmp_path / "s"))
+    log.extend(messages(10))
+    log.append({"role": "assistant", "content": "message 10"})
+    assert len(log) == 11
+    assert contents(log.tail(3)) == ["message 8", "message 9", "message 10"]
+    assert contents(log.slice(2, 4)) == ["message 2", "message 3"]
+    assert log.slice(5, 5) == [] and log.tail(0) == []
+
+
+def test_reopen_reads_existing(tmp_path):
+    log = SessionLog(str(tmp_path / "s"))
+    log.extend(messages(5))
+    log.close()
+    again = SessionLog(str(tmp_path / "s"))
+    assert len(again) == 5
+    assert contents(again.tail(2)) == ["message 3", "message 4"]
+
+
+def test_resume_drops_orphan_tool_results(tmp_path):
+    log = SessionLog(str(tmp_path / "s"))
+    log.extend([
+        {"role": "user", "content": "q"},
+        {"role": "assistant", "content": None, "tool_calls": []},
+        {"role": "tool", "tool_call_id": "1", "content": "r"},
+        {"role": "assistant", "content": "a"},
+    ])
+    assert [m["role"] for m in resume(log, 2)] == ["assistant"]
+    assert [m["role"] for m in resume(log, 3)] == ["assistant", "tool", "assistant"]
+
+
+# Crash recovery
+
+def crashed(tmp_path, damage):
+    path = str(tmp_path / "s")
+    log = SessionLog(path)
+    log.extend(messages(5))
+    log.close()
+    damage(path)
+    return SessionLog(path)
+
+
+def test_recover_records_missing_from_index(tmp_path):
+    # Log written, crash before the index write
+    def damage(path):
+        with open(path + ".idx", "r+b") as f:
+            f.truncate(3 * OFFSET.size)
+    log = crashed(tmp_path, damage)
+    assert len(log) == 5
+    assert contents(log.tail(5)) == contents(messages(5))
+    assert os.path.getsize(log.path + ".idx") == 5 * OFFSET.size
+
+
+def test_recover_half_written_record(tmp_path):
+    def damage(path):
+        with open(path + ".log", "ab") as f:
+            f.write(b"\x40\x00\x00\x00{\"role\": \"us")
+    log = crashed(tmp_path, damage)
+    assert len(log) == 5
+    log.append({"role": "user", "content": "after"})
+    assert contents(log.tail(2)) == ["message 4", "after"]
+
+
+def test_recover_partial_index_entry(tmp_path):
+    def damage(path):
+        with open(path + ".idx", "ab") as f:
+            f.write(b"\x01\x02\x03")
+    log = crashed(tmp_path, damage)
+    assert len(log) == 5
+    assert os.path.getsize(log.path + ".idx") == 5 * OFFSET.size
+
+
+def test_recover_indexed_record_cut_short(tmp_path):
+    def damage(path):
+        with open(path + ".log", "r+b") as f:
+            f.truncate(os.path.getsize(path + ".log") - 3)
+    log = crashed(tmp_path, damage)
+    assert len(log) == 4
+    assert contents(log.tail(1)) == ["message 3"]
+
+
+def test_rejects_foreign_file(tmp_path):
+    (tmp_path / "s.log").write_bytes(b"not a session log")
+    with pytest.raises(ValueError):
+        SessionLog(str(tmp_path / "s"))
+
+
+# Store
+
+def test_store_evicted_log_stays_usable(tmp_path):
+    store = SessionStore(str(tmp_path), max_open=1)
+    a = store.open("a")
+    a.append({"role": "user", "content": "1"})
+    b = store.open("b")
+    assert a.closed and not b.closed
+
+    # A caller still holding `a` keeps using it; `b` gives its handles up instead
+    a.append({"role": "user", "content": "2"})
+    assert not a.closed and b.closed
+    assert contents(a.tail(5)) == ["1", "2"]
+    b.append({"role": "user", "content": "x"})
+    assert contents(b.tail(5)) == ["x"]
+
+
+def test_store_returns_same_log(tmp_path):
+    store = SessionStore(str(tmp_path), max_open=1)
+    a = store.open("a")
+    store.open("b")
+    assert store.open("a") is a
+    assert not a.closed
+
+
+def test_store_close_and_listing(tmp_path):
+    store = SessionStore(str(tmp_path))
+    a = store.open("a")
+    a.extend(messages(2))
+    store.open("b")
+    store.close()
+    assert a.closed
+    assert len(a.tail(5)) == 2
+    assert store.sessions() == ["a", "b"]
+    assert store.exists("a") and not store.exists("c")
+
+
+def test_store_rejects_bad_ids(tmp_path):
+    store = SessionStore(str(tmp_path))
+    with pytest.raises(ValueError):
+        store.open("../escape")
+
+
+def test_agent_state_round_trip(tmp_path):
+    state = agent.AgentState(
+        query="q",
+        steps=[agent.AgentStep("search", "web_search", {"query": "x"}, "results",
+                               agent.StepStatus.SUCCESS, duration=0.5, tokens=120)],
+        final_answer="answer",
+        total_tokens=120,
+    )
+    log = SessionLog(str(tmp_path / "runs"))
+    log.append(state.to_dict())
+    assert agent.AgentState.from_dict(log.tail(1)[0]) == state
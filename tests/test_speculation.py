@@ -0,0 +1,107 @@
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from common.loader import load_agent
+
+m = load_agent("plan-and-execute")
+
+
+@pytest.fixture
+def slow_steps(monkeypatch):
+    monkeypatch.setattr(m, "execute_step", lambda step, context: time.sleep(0.1) or f"r:{step}")
+    return m
+
+
+def test_speculator_hit(slow_steps):
+    speculator = slow_steps.Speculator()
+    speculator.start("b", slow_steps.PlanContext())
+    assert speculator.resolve(["b", "c"], 0.05) == "r:b"
+    speculator.close()
+    assert (speculator.hits, speculator.misses) == (1, 0)
+
+
+def test_speculator_miss_of_running_step_is_discarded(slow_steps):
+    speculator = slow_steps.Speculator()
+    speculator.start("b", slow_steps.PlanContext())
+    time.sleep(0.02)            # the step is running now
+    assert speculator.resolve(["c"], 0.05) is None
+    speculator.close()
+    assert (speculator.discarded, speculator.cancelled) == (1, 0)
+    assert "1 discarded" in speculator.report()
+
+
+def test_speculator_close_releases_thread(slow_steps):
+    speculator = slow_steps.Speculator()
+    speculator.start("b", slow_steps.PlanContext())
+    speculator.close()          # e.g. the replan raised before resolve()
+    assert speculator.misses == 1
+    time.sleep(0.2)
+    assert not [t for t in threading.enumerate() if t.name.startswith("speculate") and t.is_alive()]
+
+
+def test_arun_query_cancels_speculation_when_replan_fails(monkeypatch):
+    started, cancelled = asyncio.Event(), []
+
+    async def aplan(user_input):
+        return ["a", "b"]
+
+    async def aexecute_step(step, context):
+        if step == "b":
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(step)
+                raise
+        return step
+
+    async def areplan(*args):
+        await started.wait()
+        raise RuntimeError("replanner down")
+
+    monkeypatch.setattr(m, "aplan", aplan)
+    monkeypatch.setattr(m, "aexecute_step", aexecute_step)
+    monkeypatch.setattr(m, "areplan", areplan)
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await m.arun_query("q", speculative=True)
+        await asyncio.sleep(0)
+        # Before asyncio.run() would cancel any leftover task itself
+        return list(cancelled)
+
+    assert asyncio.run(main()) == ["b"]
+
+
+def test_arun_query_counts_and_reports_speculation(monkeypatch, capsys):
+    # Plan a, b, c: the replanner keeps b next (hit), then replaces c with d (miss)
+    executed = []
+
+    async def aplan(user_input):
+        return ["a", "b", "c"]
+
+    async def aexecute_step(step, context):
+        executed.append(step)
+        await asyncio.sleep(0.05)
+        return step
+
+    async def areplan(user_input, steps, context, remaining):
+        await asyncio.sleep(0.02)
+        return remaining if remaining[0] == "b" else ["d"]
+
+    async def achat_completion(**request):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="answer"))])
+
+    for name, fn in [("aplan", aplan), ("aexecute_step", aexecute_step),
+                     ("areplan", areplan), ("achat_completion", achat_completion)]:
+        monkeypatch.setattr(m, name, fn)
+
+    assert asyncio.run(m.arun_query("q", speculative=True)) == "answer"
+    assert executed == ["a", "b", "c", "d"]
+    report = capsys.readouterr().out
+    assert "speculation: 1/2 hits (50%)" in report
+    assert "1 discarded after running, 0 cancelled" in report
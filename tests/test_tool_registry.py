@@ -0,0 +1,94 @@
+import json
+from types import SimpleNamespace
+from typing import Annotated, Literal
+
+import pytest
+
+from common.dispatcher import ToolDispatcher
+from common.resilience import tool_guard
+from common.tool_registry import ToolArgumentError, ToolRegistry
+
+
+def make_registry():
+    registry = ToolRegistry()
+
+    @registry.tool
+    def forecast(
+        city: Annotated[str, "The city"],
+        days: int = 1,
+        units: Literal["metric", "imperial"] = "metric",
+        tags: list[str] | None = None,
+    ) -> str:
+        """Get the weather forecast for a city
+
+        More detail that is not sent to the model.
+        """
+        return f"{city}/{days}/{units}"
+
+    return registry
+
+
+def test_schema_from_signature():
+    function = make_registry().schema[0]["function"]
+    assert function["name"] == "forecast"
+    assert function["description"] == "Get the weather forecast for a city"
+    assert function["parameters"] == {
+        "type": "object",
+        "properties": {
+            "city": {"type": "string", "description": "The city"},
+            "days": {"type": "integer"},
+            "units": {"type": "string", "enum": ["metric", "imperial"]},
+            "tags": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["city"],
+    }
+
+
+def test_schema_is_cached_until_registry_changes():
+    registry = make_registry()
+    schema = registry.schema
+    assert registry.schema is schema
+    assert schema.json == json.dumps(schema)
+    registry["forecast"] = lambda city, days=1, units="metric", tags=None: "mock"
+    assert registry.schema is schema            # swapped implementation, same schema
+    assert registry.call("forecast", '{"city": "Paris"}') == "mock"
+    registry.tool(lambda: "x", name="other", description="Other tool")
+    assert registry.schema is not schema and len(registry.schema) == 2
+    assert "- other(): Other tool" in registry.descriptions
+
+
+@pytest.mark.parametrize("arguments", [
+    "{}", '{"city": 1}', '{"city": "a", "days": true}', '{"city": "a", "units": "kelvin"}',
+    '{"city": "a", "tags": [1]}', '{"city": "a", "country": "b"}', "[1]", "{bad json",
+])
+def test_invalid_arguments(arguments):
+    with pytest.raises(ToolArgumentError):
+        make_registry().call("forecast", arguments)
+
+
+def test_valid_call_and_unknown_tool():
+    registry = make_registry()
+    assert registry.call("forecast", {"city": "Oslo", "days": 3, "tags": None}) == "Oslo/3/metric"
+    with pytest.raises(ToolArgumentError):
+        registry.validate("nope", {})
+    assert issubclass(ToolArgumentError, TypeError)
+
+
+def test_dispatcher_rejects_invalid_calls_before_running():
+    dispatcher = ToolDispatcher(make_registry())
+    calls = [
+        ("forecast", "{}"),
+        ("forecast", '{"city": 1}'),
+        ("forecast", '{"city": "a", "country": "b"}'),
+        ("nope", '{"city": "a"}'),
+        ("forecast", "{bad json"),
+    ]
+    results = dispatcher.dispatch([
+        SimpleNamespace(id=f"call_{i}", function=SimpleNamespace(name=name, arguments=arguments))
+        for i, (name, arguments) in enumerate(calls)
+    ])
+    assert [r.tool_call_id for r in results] == [f"call_{i}" for i in range(len(calls))]
+    assert all(r.content.startswith("Error:") for r in results)
+    assert "unknown tool" in results[3].content
+    # Bad arguments are the model's fault, not the tool's: the breaker never sees them
+    assert tool_guard("forecast", dispatcher.scope).breaker.error_rate() == (0, 0.0)
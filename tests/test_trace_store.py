@@ -0,0 +1,43 @@
+from common.loader import load_script
+
+m = load_script("3. Error Handling/3.1 error-handling.py")
+
+
+def make_state(query, observation="Search results for 'x'", status=None):
+    return m.AgentState(
+        query=query,
+        steps=[
+            m.AgentStep("search", "web_search", {"query": "x"}, observation,
+                        status or m.StepStatus.SUCCESS, duration=0.5, tokens=120),
+            m.AgentStep("done", "finish", {}, None, m.StepStatus.SUCCESS, duration=0.25, tokens=80),
+        ],
+        final_answer="answer",
+        total_tokens=200,
+    )
+
+
+def test_store_rebuilds_runs():
+    store = m.TraceStore()
+    states = [make_state(f"q{i}") for i in range(3)]
+    states.append(m.AgentState(query="empty"))
+    for state in states:
+        store.add(state)
+    assert len(store) == 4
+    for i, state in enumerate(states):
+        assert store.run(i) == state
+
+
+def test_store_shares_and_truncates():
+    store = m.TraceStore(max_observation=10)
+    store.add(make_state("a", observation="same long tool output"))
+    store.add(make_state("b", observation="same long tool output"))
+    assert store.observations[0] is store.observations[2]
+    assert store.run(0).steps[0].observation == "same long ... [11 more chars]"
+    assert store._names == ["web_search", "finish"]
+
+
+def test_status_counts():
+    store = m.TraceStore()
+    store.add(make_state("a"))
+    store.add(make_state("b", status=m.StepStatus.TOOL_ERROR))
+    assert store.status_counts() == {m.StepStatus.SUCCESS: 3, m.StepStatus.TOOL_ERROR: 1}
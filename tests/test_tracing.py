@@ -0,0 +1,61 @@
+import gc
+import asyncio
+import threading
+
+from common.tracing import Tracer
+
+
+def make_tracer():
+    tracer = Tracer()
+    tracer.enable()
+    return tracer
+
+
+def test_spans_nest_and_record_errors():
+    tracer = make_tracer()
+    with tracer.span("query", "agent") as root:
+        with tracer.span("call", "llm", tokens=10):
+            pass
+        try:
+            with tracer.span("tool", "tool"):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+    child, failed, query = tracer.spans
+    assert child.parent_id == failed.parent_id == root.span_id
+    assert child.root_id == root.span_id and child.attrs == {"tokens": 10}
+    assert failed.attrs["error"] == "ValueError: boom"
+    assert query.track == child.track
+
+
+def test_finished_threads_release_their_tracks():
+    tracer = make_tracer()
+
+    def work():
+        with tracer.span("tool", "tool"):
+            pass
+
+    for _ in range(50):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+    del thread
+    gc.collect()
+    assert len(tracer._tracks) == 0
+    assert len({s.track for s in tracer.spans}) == 50
+
+
+def test_tasks_get_own_tracks_and_release_them():
+    tracer = make_tracer()
+
+    async def work():
+        with tracer.span("tool", "tool"):
+            await asyncio.sleep(0)
+
+    async def main():
+        await asyncio.gather(*(work() for _ in range(20)))
+
+    asyncio.run(main())
+    gc.collect()
+    assert len({s.track for s in tracer.spans}) == 20
+    assert len(tracer._tracks) == 0